@@ -0,0 +1,67 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import time
+from multiprocessing import Process
+
+from gossip.util.channel import create_channel, put_many, CHANNEL_TYPE_QUEUE, CHANNEL_TYPE_PIPE
+
+__author__ = 'Anselm Binninger, Ralph Oliver Schaumann, Thomas Maier'
+
+
+def produce(channel, amount, interval, batch_size):
+    """ Puts queue items which carry their creation time into the channel. Like a fan-out of the controllers, every
+    batch_size items are created at once and put with one call. """
+    for i in range(0, amount, batch_size):
+        put_many(channel, [{'type': 0, 'identifier': '127.0.0.1:6001', 'message': time.perf_counter()}
+                           for _ in range(min(batch_size, amount - i))])
+        if interval:
+            time.sleep(interval * batch_size)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def measure(channel_type, amount, interval, batch_size):
+    """ Measures the latency of one hop between two processes, which is exactly one link in the gossip pipeline. """
+    channel = create_channel(channel_type)
+    producer = Process(target=produce, args=(channel, amount, interval, batch_size))
+    started = time.perf_counter()
+    producer.start()
+    latencies = []
+    for _ in range(amount):
+        queue_item = channel.get()
+        latencies.append(time.perf_counter() - queue_item['message'])
+    duration = time.perf_counter() - started
+    producer.join()
+    latencies.sort()
+    print('%-6s | batch: %3d | p50: %9.1f us | p99: %9.1f us | %7d items/s'
+          % (channel_type, batch_size, percentile(latencies, 0.5) * 1e6, percentile(latencies, 0.99) * 1e6,
+             amount / duration))
+
+
+parser = argparse.ArgumentParser(description='Measure the hop latency of the channels between the gossip layers')
+parser.add_argument('-n', dest='amount', type=int, default=20000, help='Number of queue items to send')
+parser.add_argument('-i', dest='interval', type=float, default=0.0001,
+                    help='Seconds between two queue items (0 for a saturated channel)')
+parser.add_argument('-b', dest='batch_size', type=int, default=8,
+                    help='Number of queue items which are put at once on the batched path')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for current_channel_type in [CHANNEL_TYPE_QUEUE, CHANNEL_TYPE_PIPE]:
+        for current_batch_size in sorted({1, args.batch_size}):
+            measure(current_channel_type, args.amount, args.interval, current_batch_size)
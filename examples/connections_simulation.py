@@ -17,7 +17,6 @@ import logging
 import logging.config
 import argparse
 import networkx
-from multiprocessing import Lock
 
 from gossip.communication.connection import GossipConnectionPool
 import matplotlib
@@ -56,10 +55,7 @@ class GossipConnectionPoolFast(GossipConnectionPool):
 
     def __init__(self, connection_pool_label, cache_size=30):
         """Constructor."""
-        self.connection_pool_label = connection_pool_label
-        self._connections = {}
-        self._cache_size = cache_size
-        self._pool_lock = Lock()
+        GossipConnectionPool.__init__(self, connection_pool_label, cache_size=cache_size, shared=False)
 
 class Client:
     """Dummy class that mocks a client"""
@@ -0,0 +1,200 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import math
+import random
+import time
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.communication.eviction import create_eviction_policy, EVICTION_POLICIES
+from gossip.util.peer_address import GossipPeerAddress
+
+__author__ = 'Anselm Binninger, Ralph Oliver Schaumann, Thomas Maier'
+
+
+class SimulatedConnection:
+    """ Stands in for the socket of one end of a connection. If the pool evicts it, the other end is closed as well. """
+
+    def __init__(self, network, owner, peer):
+        self.network = network
+        self.owner = owner
+        self.peer = peer
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        self.network.disconnect(self.owner, self.peer, evicted=True)
+
+
+class SimulatedPeer:
+    """ A peer with a real connection pool, a position (which determines the RTTs) and a reliability. """
+
+    def __init__(self, identifier, policy_name, max_connections, headroom):
+        self.identifier = identifier
+        self.pool = GossipConnectionPool(identifier, cache_size=max_connections, shared=False, headroom=headroom,
+                                         eviction_policy=create_eviction_policy(policy_name))
+        self.position = (random.random(), random.random())
+        self.loss_rate = 0.5 if random.random() < 0.1 else 0.0
+        self.activity = random.random()
+
+
+class EvictionSimulation:
+    """ Simulates a network with churn in one process and counts how much connection setup work the eviction policy
+    throws away and how well announces still spread. """
+
+    def __init__(self, policy_name, peers=200, max_connections=8, headroom=2, rounds=30, churn=0.02, fanout=4):
+        self.policy_name = policy_name
+        self.max_connections = max_connections
+        self.headroom = headroom
+        self.rounds = rounds
+        self.churn = churn
+        self.fanout = fanout
+        self.peers = {}
+        self.next_port = 0
+        self.round = 0
+        self.setup_rounds = {}
+        self.setups = 0
+        self.evictions = 0
+        self.wasted = 0
+        for _ in range(peers):
+            self.join()
+
+    def new_peer(self):
+        self.next_port += 1
+        peer = SimulatedPeer(GossipPeerAddress.from_host_port('10.0.%d.%d' % (self.next_port // 256,
+                                                                              self.next_port % 256), 6001),
+                             self.policy_name, self.max_connections, self.headroom)
+        self.peers[peer.identifier] = peer
+        return peer
+
+    def connect(self, dialer, server_identifier):
+        """ Lets a peer dial another one, the dialed peer takes it as inbound connection. """
+        if server_identifier == dialer.identifier or server_identifier not in self.peers:
+            return
+        if not dialer.pool.reserve_slots([server_identifier]):
+            return
+        self.setups += 1
+        self.setup_rounds[frozenset([dialer.identifier, server_identifier])] = self.round
+        dialer.pool.add_connection(server_identifier, SimulatedConnection(self, dialer.identifier, server_identifier),
+                                   server_identifier=server_identifier, outbound=True)
+        if server_identifier in dialer.pool.get_identifiers():
+            self.peers[server_identifier].pool.add_connection(
+                dialer.identifier, SimulatedConnection(self, server_identifier, dialer.identifier),
+                server_identifier=dialer.identifier)
+
+    def disconnect(self, owner, peer, evicted=False):
+        for identifier, other_identifier in [(owner, peer), (peer, owner)]:
+            if identifier in self.peers:
+                self.peers[identifier].pool.remove_connection(other_identifier)
+        setup_round = self.setup_rounds.pop(frozenset([owner, peer]), None)
+        if evicted and setup_round is not None:
+            self.evictions += 1
+            if setup_round == self.round:
+                self.wasted += 1
+
+    def fill_up(self, peer):
+        """ Asks a random neighbor (or any peer) for a sample of its peers and dials them. """
+        neighbors = peer.pool.get_identifiers()
+        contact = random.choice(neighbors) if neighbors else random.choice(list(self.peers))
+        if contact not in self.peers or contact == peer.identifier:
+            return
+        sample = [contact] + self.peers[contact].pool.sample_server_identifiers(
+            self.max_connections, peer.identifier + bytes([self.round % 256]))
+        known = set(neighbors)
+        for server_identifier in sample:
+            if peer.pool.get_capacity() <= 0:
+                break
+            if server_identifier not in known:
+                self.connect(peer, server_identifier)
+
+    def join(self):
+        self.fill_up(self.new_peer())
+
+    def leave(self, peer):
+        for identifier in peer.pool.get_identifiers():
+            self.disconnect(peer.identifier, identifier)
+        del self.peers[peer.identifier]
+
+    def exchange_traffic(self):
+        """ Lets every peer ping its neighbors and receive data from the more active ones. """
+        for peer in list(self.peers.values()):
+            for identifier in peer.pool.get_identifiers():
+                other = self.peers.get(identifier)
+                if other is None:
+                    continue
+                peer.pool.record_ping(identifier)
+                if random.random() >= other.loss_rate:
+                    peer.pool.record_pong(identifier, 0.01 + 0.2 * math.dist(peer.position, other.position))
+                if random.random() < other.activity:
+                    slot = peer.pool.get_slot(identifier)
+                    if slot is not None:
+                        peer.pool.stats.record_received(slot, 100, 1, time.monotonic())
+
+    def coverage(self, messages=20):
+        """ Spreads announces from random peers to fanout random neighbors per hop.
+
+        :returns: The average share of peers an announce reaches
+        """
+        shares = []
+        for _ in range(messages):
+            source = random.choice(list(self.peers))
+            reached = {source}
+            current = [source]
+            while current:
+                following = []
+                for identifier in current:
+                    for neighbor in self.peers[identifier].pool.get_random_identifiers(self.fanout):
+                        if neighbor in self.peers and neighbor not in reached:
+                            reached.add(neighbor)
+                            following.append(neighbor)
+                current = following
+            shares.append(len(reached) / len(self.peers))
+        return sum(shares) / len(shares)
+
+    def run(self):
+        for self.round in range(self.rounds):
+            for peer in list(self.peers.values()):
+                if random.random() < self.churn:
+                    self.leave(peer)
+                    self.join()
+            for peer in list(self.peers.values()):
+                if peer.identifier in self.peers and peer.pool.get_capacity() > 0:
+                    self.fill_up(peer)
+            self.exchange_traffic()
+        degrees = [len(peer.pool.get_identifiers()) for peer in self.peers.values()]
+        return {'setups': self.setups, 'evictions': self.evictions, 'wasted': self.wasted,
+                'coverage': self.coverage(), 'degree': sum(degrees) / len(degrees)}
+
+
+parser = argparse.ArgumentParser(description='Compare the connection eviction policies in a simulated network')
+parser.add_argument('-n', dest='peers', type=int, default=200, help='Number of peers')
+parser.add_argument('-c', dest='connections', type=int, default=8, help='Max. number of connections per peer')
+parser.add_argument('-r', dest='rounds', type=int, default=30, help='Number of simulated rounds')
+parser.add_argument('--churn', dest='churn', type=float, default=0.02,
+                    help='Probability per round that a peer is replaced by a new one')
+parser.add_argument('--headroom', dest='headroom', type=int, default=2, help='Connection headroom of every peer')
+parser.add_argument('--seed', dest='seed', type=int, default=1, help='Seed of the random generator')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    print('%-22s | %7s | %9s | %6s | %8s | %6s' % ('policy', 'setups', 'evictions', 'wasted', 'coverage', 'degree'))
+    for current_policy_name in sorted(EVICTION_POLICIES):
+        random.seed(args.seed)
+        result = EvictionSimulation(current_policy_name, peers=args.peers, max_connections=args.connections,
+                                    headroom=args.headroom, rounds=args.rounds, churn=args.churn).run()
+        print('%-22s | %7d | %9d | %6d | %7.1f%% | %6.2f'
+              % (current_policy_name, result['setups'], result['evictions'], result['wasted'],
+                 result['coverage'] * 100, result['degree']))
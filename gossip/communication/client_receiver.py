@@ -13,20 +13,39 @@
 # limitations under the License.
 
 import logging
-from multiprocessing import Process
+import time
 
 from gossip.util import packing
 from gossip.util.exceptions import GossipMessageException, GossipClientDisconnectedException, \
     GossipMessageFormatException
 from gossip.util.message import MessageOther
 from gossip.util.message import GOSSIP_MESSAGE_TYPES
+from gossip.util.peer_address import GossipPeerAddress
 from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, QUEUE_ITEM_TYPE_CONNECTION_LOST, \
     QUEUE_ITEM_TYPE_NEW_CONNECTION
+from gossip.util.runtime import GossipWorker
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
 
-class GossipClientReceiver(Process):
+def decode_message(msg):
+    """
+    Turns a received message into the matching message object.
+
+    :param msg: A dict of the received values (see packing.receive_msg)
+    :returns: The message object (MessageOther if the code is not known by Gossip)
+    """
+    if msg['code'] in GOSSIP_MESSAGE_TYPES.keys():
+        try:
+            return GOSSIP_MESSAGE_TYPES[msg['code']](msg['message'])
+        except Exception as e:
+            # TODO Don't catch Exception, catch specific decoding exception
+            raise GossipMessageFormatException('%s' % e)
+    else:
+        return MessageOther(msg['code'], msg['message'])
+
+
+class GossipClientReceiver(GossipWorker):
     """ A client receiver is a process which receives data from a specified socket. """
     def __init__(self, client_receiver_label, client_socket, ipv4_address, tcp_port, to_controller_queue,
                  connection_pool):
@@ -39,12 +58,13 @@ class GossipClientReceiver(Process):
         :param to_controller_queue: The queue which connects this client receiver with the responsible controller
         :param connection_pool: If the socket crashes, the connection will be removed in this connection pool
         """
-        Process.__init__(self)
+        GossipWorker.__init__(self, client_receiver_label)
         self.client_receiver_label = client_receiver_label
         self.client_socket = client_socket
-        self.identifier = '%s:%d' % (ipv4_address, tcp_port)
+        self.identifier = GossipPeerAddress.from_host_port(ipv4_address, tcp_port)
         self.to_controller_queue = to_controller_queue
         self.connection_pool = connection_pool
+        self.slot = None
 
     def run(self):
         """ This typical run method of the client receiver process is responsible for handling a connection for
@@ -64,11 +84,12 @@ class GossipClientReceiver(Process):
     def handle_client(self):
         """ Receives new messages until the client dies. It also kills connections to clients which send malformed
         messages. Therefor it informs the responsible controller as well. """
+        self.slot = self.connection_pool.get_slot(self.identifier)
         self.to_controller_queue.put({'type': QUEUE_ITEM_TYPE_NEW_CONNECTION,
                                       'identifier': self.identifier,
                                       'message': None})
         try:
-            while True:
+            while not self.stopped():
                 message = self.__receive()
                 logging.debug('%s (%s) | Received message %s' % (self.client_receiver_label, self.identifier, message))
         except (GossipMessageException, GossipMessageFormatException) as e:
@@ -88,14 +109,9 @@ class GossipClientReceiver(Process):
         :returns: The received message object
         """
         msg = packing.receive_msg(self.client_socket)
-        if msg['code'] in GOSSIP_MESSAGE_TYPES.keys():
-            try:
-                message_object = GOSSIP_MESSAGE_TYPES[msg['code']](msg['message'])
-            except Exception as e:
-                # TODO Don't catch Exception, catch specific decoding exception
-                raise GossipMessageFormatException('%s' % e)
-        else:
-            message_object = MessageOther(msg['code'], msg['message'])
+        message_object = decode_message(msg)
+        if self.slot is not None:
+            self.connection_pool.stats.record_received(self.slot, msg['size'], 1, time.monotonic())
 
         self.to_controller_queue.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE,
                                       'identifier': self.identifier,
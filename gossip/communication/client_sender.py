@@ -13,96 +13,250 @@
 # limitations under the License.
 
 import logging
-import multiprocessing
+import os
+import selectors
 import socket
+import time
+from queue import Empty
 
 from gossip.util.exceptions import GossipQueueException, GossipIdentifierNotFound
-from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_SEND_MESSAGE, QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_SEND_MESSAGE, QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, \
+    QUEUE_ITEM_TYPE_CONNECTION_LOST
 from gossip.communication.client_receiver import GossipClientReceiver
+from gossip.util.runtime import GossipWorker, WORKER_POLL_INTERVAL
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
+""" Max. amount of seconds to wait until a new connection has been established """
+CONNECT_TIMEOUT = 5.0
 
-class GossipSender(multiprocessing.Process):
+""" Max. amount of seconds the sender waits for new commands while connections are being established """
+CONNECT_POLL_INTERVAL = 0.01
+
+
+class GossipSender(GossipWorker):
     """ The Gossip sender receives new commands from the responsible controller. The sender is responsible for sending
     new messages to specified receivers. It is able to establish new connections as well if the controller sends the
-    appropriate command to do so. """
+    appropriate command to do so. Connections are established concurrently, messages to a connection which is still
+    being established are kept until it is ready. """
 
-    def __init__(self, sender_label, from_controller_queue, to_controller_queue, connection_pool):
+    def __init__(self, sender_label, from_controller_queue, to_controller_queue, connection_pool, receiver_pool=None):
         """ Constructor.
 
         :param sender_label: A label to derive the concrete functionality of this client sender
         :param from_controller_queue: The client sender gets new commands via this queue from the responsible controller
         :param to_controller_queue: This instance forwards the controller queue to new receiver instances
         :param connection_pool: The connection pool which contains all connections/sockets
+        :param receiver_pool: (optional) Established connections are handed to this receiver pool, without a pool a new
+                              receiver is started per connection
         """
-        multiprocessing.Process.__init__(self)
+        GossipWorker.__init__(self, sender_label)
         self.sender_label = sender_label
         self.from_controller_queue = from_controller_queue
         self.to_controller_queue = to_controller_queue
         self.connection_pool = connection_pool
+        self.receiver_pool = receiver_pool
+        self._selector = None
+        self._pending = {}
+        self._races = {}
 
     def run(self):
         """ This is a typical run method for the sender process. It waits for commands from the controller to establish
         new connections or to send messages to established connections. The sender gets the appropriate
         connection/socket from the connection pool. """
-        logging.info('%s started - PID: %s' % (self.sender_label, self.pid))
+        logging.info('%s started - PID: %s' % (self.sender_label, os.getpid()))
+        self._selector = selectors.DefaultSelector()
 
-        while True:
-            queue_item = self.from_controller_queue.get()
+        while not self.stopped():
+            if self._pending:
+                self.__complete_connections()
+            try:
+                queue_item = self.from_controller_queue.get(
+                    timeout=CONNECT_POLL_INTERVAL if self._pending else WORKER_POLL_INTERVAL)
+            except Empty:
+                continue
             queue_item_type = queue_item['type']
             identifier = queue_item['identifier']
 
             # Fetch the right connection
             if queue_item_type == QUEUE_ITEM_TYPE_SEND_MESSAGE:
                 message = queue_item['message']
-
-                # Fetch connection from connection pool
-                logging.info("%s | Redirecting message (code %d) to corresponding client"
-                             % (self.sender_label, message.get_values()['code']))
-                try:
-                    connection = self.connection_pool.get_connection(identifier)
-                except GossipIdentifierNotFound:
-                    connection = None
-
-                # Send message
-                if connection:
-                    if message:
-                        encoded = message.encode()
-                        try:
-                            connection.send(encoded)
-                            logging.debug('%s | Sent message (%s) to client %s | Sent message: %s'
-                                          % (self.sender_label, message.get_values()['code'], identifier,
-                                             message.get_values()))
-                        except (ConnectionResetError, ConnectionAbortedError):
-                            self.connection_pool.remove_connection(identifier)
-                            logging.error('%s | During sending a message peer disconnected' % self.sender_label)
+                if identifier in self._pending:
+                    self._pending[identifier]['messages'].append(message)
                 else:
-                    logging.error('%s | No connection found in connection pool, giving up' % self.sender_label)
+                    self.__send(identifier, message)
 
             elif queue_item_type == QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION:
-                # Establish new connection
-                logging.info("%s Establishing new connection to %s" % (self.sender_label, identifier))
-                connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                server_host, server_port = identifier.split(':')
-                server_port = int(server_port)
-                try:
-                    connection.connect((server_host, server_port))
-                    self.connection_pool.add_connection(identifier, connection, server_identifier=identifier)
-                except ConnectionRefusedError:
-                    logging.error('%s | Cannot establish connection to %s' % (self.sender_label, identifier))
-                    continue
-
-                logging.info("%s | Added new connection to connection pool" % self.sender_label)
-
-                # Create client receiver for new connection
-                # TODO Client receiver label should not be hardcoded here!
-                client_receiver = GossipClientReceiver('P2PClientReceiver', connection, server_host, server_port,
-                                                       self.to_controller_queue, self.connection_pool)
-
-                client_receiver.start()
+                # Establish new connection, connections of the same race are cancelled as soon as one is established
+                self.__connect(identifier, queue_item.get('race'))
 
             else:
                 # If this happens, someone did a horrible mistake in the code: The queue item type is not supported!
                 raise GossipQueueException('%s: Queue item cannot be identified! This should never happen!'
                                            % self.sender_label)
+
+        for identifier in list(self._pending):
+            self.__pop_pending(identifier)['connection'].close()
+        self._selector.close()
+
+    def __send(self, identifier, message):
+        """ Sends a message via an established connection.
+
+        :param identifier: The identifier of the connection
+        :param message: The message to send
+        """
+        # Fetch connection from connection pool
+        logging.info("%s | Redirecting message (code %d) to corresponding client"
+                     % (self.sender_label, message.get_values()['code']))
+        try:
+            connection, slot = self.connection_pool.get_connection_slot(identifier)
+        except GossipIdentifierNotFound:
+            connection, slot = None, None
+
+        # Send message
+        if connection:
+            if message:
+                encoded = message.encode()
+                try:
+                    connection.send(encoded)
+                    if slot is not None:
+                        self.connection_pool.stats.record_sent(slot, len(encoded))
+                    logging.debug('%s | Sent message (%s) to client %s | Sent message: %s'
+                                  % (self.sender_label, message.get_values()['code'], identifier,
+                                     message.get_values()))
+                except (ConnectionResetError, ConnectionAbortedError):
+                    self.connection_pool.remove_connection(identifier)
+                    logging.error('%s | During sending a message peer disconnected' % self.sender_label)
+        else:
+            logging.error('%s | No connection found in connection pool, giving up' % self.sender_label)
+
+    def __connect(self, identifier, race=None):
+        """ Starts to establish a new connection without waiting for it.
+
+        :param identifier: The server identifier to connect to, e.g. '192.168.1.2:6001'
+        :param race: (optional) A tuple of the server identifiers of all connections which race against each other,
+                     only the first established connection of a race is kept
+        """
+        if identifier in self._pending:
+            return
+        if race is not None:
+            race_state = self._races.setdefault(race, {'winner': None, 'failed': set(), 'outstanding': set(race)})
+            race_state['outstanding'].discard(identifier)
+            if race_state['winner'] is not None:
+                logging.info('%s | Not connecting to %s, %s has already won the race'
+                             % (self.sender_label, identifier, race_state['winner']))
+                self.connection_pool.release_reservation(identifier)
+                self.__forget_race(race)
+                return
+        if self.connection_pool.get_identifiers_of_server(identifier):
+            logging.info('%s | Not connecting to %s, there is a connection already' % (self.sender_label, identifier))
+            self.connection_pool.release_reservation(identifier)
+            if race is not None:
+                self.__win_race(race, identifier)
+            return
+        logging.info("%s Establishing new connection to %s" % (self.sender_label, identifier))
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        connection.setblocking(False)
+        self._selector.register(connection, selectors.EVENT_WRITE, identifier)
+        self._pending[identifier] = {'connection': connection, 'messages': [], 'race': race,
+                                     'deadline': time.monotonic() + CONNECT_TIMEOUT}
+        try:
+            connection.connect((identifier.host, identifier.port))
+        except BlockingIOError:
+            return
+        except OSError:
+            self.__fail(identifier)
+
+    def __complete_connections(self):
+        """ Finishes all connections which have been established or failed meanwhile resp. which timed out. """
+        for key, _ in self._selector.select(timeout=0):
+            identifier = key.data
+            # A connection may have been cancelled because another connection has won its race
+            if identifier not in self._pending:
+                continue
+            if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                self.__fail(identifier)
+            else:
+                self.__establish(identifier)
+        now = time.monotonic()
+        for identifier in [identifier for identifier, pending in self._pending.items() if pending['deadline'] <= now]:
+            self.__fail(identifier)
+
+    def __establish(self, identifier):
+        """ Adds an established connection to the connection pool, hands it over to a receiver and sends the messages
+        which have been waiting for it.
+
+        :param identifier: The server identifier of the connection
+        """
+        pending = self.__pop_pending(identifier)
+        connection = pending['connection']
+        connection.setblocking(True)
+        self.connection_pool.add_connection(identifier, connection, server_identifier=identifier, outbound=True)
+        logging.info("%s | Added new connection to connection pool" % self.sender_label)
+
+        # Hand the new connection to a receiver
+        if self.receiver_pool:
+            self.receiver_pool.add_connection(identifier, connection)
+        else:
+            # TODO Client receiver label should not be hardcoded here!
+            client_receiver = GossipClientReceiver('P2PClientReceiver', connection, identifier.host, identifier.port,
+                                                   self.to_controller_queue, self.connection_pool)
+            self.runtime.start(client_receiver)
+
+        if pending['race'] is not None:
+            self.__win_race(pending['race'], identifier)
+
+        for message in pending['messages']:
+            self.__send(identifier, message)
+
+    def __fail(self, identifier):
+        """ Gives up a connection which cannot be established.
+
+        :param identifier: The server identifier of the connection
+        """
+        pending = self.__pop_pending(identifier)
+        pending['connection'].close()
+        self.connection_pool.release_reservation(identifier)
+        logging.error('%s | Cannot establish connection to %s' % (self.sender_label, identifier))
+
+        # Within a race, the controller only learns about the failure if all connections failed
+        if pending['race'] is not None:
+            failed = self._races[pending['race']]['failed']
+            failed.add(identifier)
+            if failed != set(pending['race']):
+                return
+            self.__forget_race(pending['race'])
+        # The controller replaces the peer, e.g. by another one of its passive view
+        self.to_controller_queue.put({'type': QUEUE_ITEM_TYPE_CONNECTION_LOST,
+                                      'identifier': identifier,
+                                      'message': None})
+
+    def __win_race(self, race, identifier):
+        """ Decides a race in favour of a connection. The other connections of the race are not needed anymore.
+
+        :param race: The tuple of server identifiers which race against each other
+        :param identifier: The server identifier of the winning connection
+        """
+        self._races[race]['winner'] = identifier
+        for other_identifier in [other_identifier for other_identifier, other in self._pending.items()
+                                 if other['race'] == race]:
+            logging.info('%s | Cancelling connection to %s, %s has been faster'
+                         % (self.sender_label, other_identifier, identifier))
+            self.__pop_pending(other_identifier)['connection'].close()
+            self.connection_pool.release_reservation(other_identifier)
+        self.__forget_race(race)
+
+    def __forget_race(self, race):
+        """ Drops the state of a race as soon as it is decided and no more connections of the race are coming.
+
+        :param race: The tuple of server identifiers which race against each other
+        """
+        race_state = self._races[race]
+        decided = race_state['winner'] is not None or race_state['failed'] == set(race)
+        if decided and not race_state['outstanding']:
+            del self._races[race]
+
+    def __pop_pending(self, identifier):
+        pending = self._pending.pop(identifier)
+        self._selector.unregister(pending['connection'])
+        return pending
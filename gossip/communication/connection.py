@@ -12,50 +12,175 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ctypes
+import hashlib
+import heapq
 import logging
 import random
-from multiprocessing import Manager, Lock
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import Manager, Lock, RawValue
 from socket import SHUT_RDWR
+from types import MappingProxyType
+from gossip.communication.eviction import GossipScoreEviction
+from gossip.communication.peer_stats import GossipPeerStats
 from gossip.util.exceptions import GossipIdentifierNotFound
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
+""" RTT in seconds which is assumed for peers which have not been measured yet """
+DEFAULT_RTT = 0.1
+
+""" Seconds which are added to the score of a peer which does not answer any ping """
+ERROR_PENALTY = 1.0
+
+""" Amount of random candidates the best peer of the passive view is promoted from. Good peers are preferred this way,
+but every peer still has a chance, so random links keep the network connected. """
+SELECTION_SAMPLE_SIZE = 3
+
+""" Seconds after which the reservation of a dial is dropped, in case its result is never reported. Clearly longer than
+the connect timeout of the sender. """
+RESERVATION_TIMEOUT = 15.0
+
+""" Amount of stats slots beyond the cache size, connections are added before the pool evicts surplus ones """
+STATS_SPARE_SLOTS = 8
+
+
+def score_peer(rtt, error_rate):
+    """ Rates a peer by its latency and its reliability, lower scores are better.
+
+    :param rtt: Moving average of the RTT in seconds, None if it has not been measured yet
+    :param error_rate: Moving average of the unanswered pings, between 0 and 1
+    :returns: The score in seconds
+    """
+    return (DEFAULT_RTT if rtt is None else rtt) + error_rate * ERROR_PENALTY
+
+
+class GossipPoolSnapshot(namedtuple('GossipPoolSnapshot', ['version', 'identifiers', 'server_identifier_of',
+                                                           'identifiers_of_server', 'lazy_identifiers'])):
+    """ Immutable view of the membership of a connection pool at one version (see GossipConnectionPool.get_snapshot).
+
+    version: The version of the pool this snapshot has been taken at
+    identifiers: Tuple of the identifiers of all connections
+    server_identifier_of: Read-only dict in the form {<identifier>: <server identifier or None>}
+    identifiers_of_server: Read-only dict in the form {<server identifier>: (<identifier>, ...)}
+    lazy_identifiers: Frozenset of the identifiers of all lazy links, all other links are eager
+    """
+    __slots__ = ()
+
 
 class GossipConnectionPool:
     """ Thread-safe implementation of a pool for Gossip connections. """
     CONNECTION = 'Connection'
     SERVER_IDENTIFIER = 'ServerIdentifier'
+    SLOT = 'Slot'
+    OUTBOUND = 'Outbound'
 
-    def __init__(self, connection_pool_label, cache_size=30):
+    def __init__(self, connection_pool_label, cache_size=30, shared=True, passive_view=None, headroom=0,
+                 eviction_policy=None):
         """ Constructor.
 
         :param connection_pool_label: A label to derive the concrete functionality of this connection pool
         :param cache_size: (optional): The max. amount of connections in this connection pool.
+        :param shared: (optional) If False, the pool can only be used by threads of the current process
+        :param passive_view: (optional) GossipPassiveView which takes the server identifiers of evicted connections
+        :param headroom: (optional) Amount of connections by which unsolicited (e.g. incoming) connections may exceed
+                         the cache size (high watermark). Beyond that, connections are evicted down to the cache size
+                         (low watermark) at once, so that not every further connection causes another eviction.
+        :param eviction_policy: (optional) GossipEvictionPolicy which chooses the connections to evict, by default
+                                the connections with the worst scores out of a few random ones
         """
         self.connection_pool_label = connection_pool_label
-        self._connections = Manager().dict()
+        if shared:
+            manager = Manager()
+            self._connections = manager.dict()
+            self._reservations = manager.dict()
+            self._server_index = manager.dict()
+            self._lazy_links = manager.dict()
+            self._pool_lock = Lock()
+            self._version = RawValue(ctypes.c_uint64, 0)
+        else:
+            self._connections = {}
+            self._reservations = {}
+            self._server_index = {}
+            self._lazy_links = {}
+            self._pool_lock = threading.Lock()
+            self._version = ctypes.c_uint64(0)
+        self._snapshot = None
         self._cache_size = cache_size
-        self._pool_lock = Lock()
+        self._headroom = headroom
+        self.passive_view = passive_view
+        self.eviction_policy = eviction_policy if eviction_policy is not None else GossipScoreEviction()
+        self.stats = GossipPeerStats(cache_size + headroom + STATS_SPARE_SLOTS, shared=shared)
 
-    def add_connection(self, identifier, connection, server_identifier=None):
+    def add_connection(self, identifier, connection, server_identifier=None, outbound=False):
         """ Adds new identifier with its connection.
 
         :param identifier: An object which identifies an unique connection
         :param connection: A connection object
         :param server_identifier: (optional) The server identifier of the peer
+        :param outbound: (optional) True if we have established the connection, False if the peer has connected to us
         """
         self._pool_lock.acquire()
+        # An established dial takes the place of its reservation
+        if server_identifier is not None:
+            self._reservations.pop(server_identifier, None)
         if identifier not in self._connections:
             self._connections[identifier] = {GossipConnectionPool.CONNECTION: connection,
-                                             GossipConnectionPool.SERVER_IDENTIFIER: server_identifier}
+                                             GossipConnectionPool.SERVER_IDENTIFIER: server_identifier,
+                                             GossipConnectionPool.OUTBOUND: outbound,
+                                             GossipConnectionPool.SLOT: self.stats.allocate(time.monotonic())}
+            self.__index_server_identifier(identifier, server_identifier)
+            self.__publish()
             logging.debug('%s | Added new connection %s (pool: %s)' % (self.connection_pool_label, identifier, self))
             self._pool_lock.release()
-            self.__maintain_connections()
+            self.__maintain_connections(identifier)
         else:
             self._pool_lock.release()
             logging.debug('%s | Connection %s exists already (pool: %s)' % (self.connection_pool_label, identifier,
                                                                             self))
 
+    def reserve_slots(self, server_identifiers):
+        """ Reserves places in the pool for connections which are about to be established (dials). Reservations count
+        like connections, so concurrent dials never exceed the cache size. A reservation ends as soon as the
+        connection is added to the pool, the dial fails (see release_reservation) or after RESERVATION_TIMEOUT.
+
+        :param server_identifiers: Server identifiers of the peers to dial, in the order of preference
+        :returns: List of the server identifiers which got a reservation, peers which are being dialed already are
+                  left out
+        """
+        self._pool_lock.acquire()
+        now = time.monotonic()
+        self.__purge_reservations(now)
+        capacity = self._cache_size - len(self._connections) - len(self._reservations)
+        reserved = []
+        for server_identifier in server_identifiers:
+            if len(reserved) >= capacity:
+                break
+            if server_identifier not in self._reservations:
+                self._reservations[server_identifier] = now + RESERVATION_TIMEOUT
+                reserved.append(server_identifier)
+        self._pool_lock.release()
+        if reserved:
+            logging.debug('%s | Reserved slots for %s' % (self.connection_pool_label, reserved))
+        return reserved
+
+    def release_reservation(self, server_identifier):
+        """ Gives a reserved place in the pool back, e.g. because the dial failed.
+
+        :param server_identifier: The server identifier of the dialed peer
+        """
+        self._pool_lock.acquire()
+        self._reservations.pop(server_identifier, None)
+        self._pool_lock.release()
+
+    def __purge_reservations(self, now):
+        """ Drops expired reservations. Must be called under the pool lock. """
+        for server_identifier, expiry in list(self._reservations.items()):
+            if expiry <= now:
+                self._reservations.pop(server_identifier, None)
+
     def update_connection(self, identifier, server_identifier):
         """ Updates an existing identifier with its connection.
 
@@ -64,9 +189,12 @@ class GossipConnectionPool:
         """
         self._pool_lock.acquire()
         if identifier in self._connections:
-            connection_to_update = self._connections[identifier][GossipConnectionPool.CONNECTION]
-            self._connections[identifier] = {GossipConnectionPool.CONNECTION: connection_to_update,
-                                             GossipConnectionPool.SERVER_IDENTIFIER: server_identifier}
+            connection_to_update = dict(self._connections[identifier])
+            self.__unindex_server_identifier(identifier, connection_to_update[GossipConnectionPool.SERVER_IDENTIFIER])
+            connection_to_update[GossipConnectionPool.SERVER_IDENTIFIER] = server_identifier
+            self._connections[identifier] = connection_to_update
+            self.__index_server_identifier(identifier, server_identifier)
+            self.__publish()
             logging.debug('%s | Updated information about connection %s (pool: %s)' % (self.connection_pool_label,
                                                                                        identifier, self))
         else:
@@ -82,11 +210,61 @@ class GossipConnectionPool:
         self._pool_lock.acquire()
         removed_connection = self._connections.pop(identifier, None)
         if removed_connection:
+            self.__unindex_server_identifier(identifier, removed_connection[GossipConnectionPool.SERVER_IDENTIFIER])
+            self._lazy_links.pop(identifier, None)
+            self.__publish()
+            if removed_connection[GossipConnectionPool.SLOT] is not None:
+                self.stats.release(removed_connection[GossipConnectionPool.SLOT])
             logging.debug('%s | Removed connection %s (pool: %s)' % (self.connection_pool_label, identifier, self))
             self._pool_lock.release()
             return removed_connection[GossipConnectionPool.CONNECTION]
         self._pool_lock.release()
 
+    def __publish(self):
+        """ Bumps the version of the pool after its membership has changed, so that the cached snapshots of all
+        processes are rebuilt. Must be called under the pool lock. """
+        self._version.value += 1
+
+    def get_snapshot(self):
+        """ Provides the membership of the pool as an immutable snapshot. Every process caches the latest snapshot
+        and only takes a new one after connections have been added, updated or removed or a link type has changed,
+        which a version counter in shared memory tells. As long as the membership is stable, looking up fan-out
+        targets neither takes the pool lock nor calls the manager.
+
+        :returns: GossipPoolSnapshot
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version.value:
+            return snapshot
+        self._pool_lock.acquire()
+        version = self._version.value
+        identifiers = tuple(self._connections.keys())
+        server_index = self._server_index.copy()
+        lazy_identifiers = frozenset(self._lazy_links.keys())
+        self._pool_lock.release()
+        server_identifier_of = dict.fromkeys(identifiers)
+        for server_identifier, connection_identifiers in server_index.items():
+            for identifier in connection_identifiers:
+                server_identifier_of[identifier] = server_identifier
+        snapshot = GossipPoolSnapshot(version, identifiers, MappingProxyType(server_identifier_of),
+                                      MappingProxyType(server_index), lazy_identifiers)
+        self._snapshot = snapshot
+        return snapshot
+
+    def __index_server_identifier(self, identifier, server_identifier):
+        """ Adds a connection to the index of server identifiers. Must be called under the pool lock. """
+        if server_identifier:
+            self._server_index[server_identifier] = self._server_index.get(server_identifier, ()) + (identifier,)
+
+    def __unindex_server_identifier(self, identifier, server_identifier):
+        """ Removes a connection from the index of server identifiers. Must be called under the pool lock. """
+        if server_identifier:
+            identifiers = tuple(x for x in self._server_index.get(server_identifier, ()) if x != identifier)
+            if identifiers:
+                self._server_index[server_identifier] = identifiers
+            else:
+                self._server_index.pop(server_identifier, None)
+
     def get_connection(self, identifier):
         """ Gets a connection from the pool.
 
@@ -101,73 +279,245 @@ class GossipConnectionPool:
             self._pool_lock.release()
             raise GossipIdentifierNotFound('Cannot find identifier %s' % identifier)
 
+    def get_connection_slot(self, identifier):
+        """ Gets a connection from the pool together with its slot in the stats table.
+
+        :param identifier: Unique identifier to find the affected connection
+        :returns: A tuple of the connection and its slot (None if the stats table is full)
+        """
+        self._pool_lock.acquire()
+        connection = self._connections.get(identifier, None)
+        self._pool_lock.release()
+        if connection is None:
+            raise GossipIdentifierNotFound('Cannot find identifier %s' % identifier)
+        return connection[GossipConnectionPool.CONNECTION], connection[GossipConnectionPool.SLOT]
+
+    def get_slot(self, identifier):
+        """ Gets the slot of a connection in the stats table.
+
+        :param identifier: Unique identifier to find the affected connection
+        :returns: The slot, None if the connection is unknown or the stats table is full
+        """
+        self._pool_lock.acquire()
+        connection = self._connections.get(identifier, None)
+        self._pool_lock.release()
+        if connection is None:
+            return None
+        return connection[GossipConnectionPool.SLOT]
+
     def get_server_identifier(self, identifier):
         """ Gets the server identifier for one connection.
 
         :param identifier: Unique identifier to find the affected server identifier
         """
-        self._pool_lock.acquire()
-        connection = self._connections.get(identifier, None)
-        if connection:
-            self._pool_lock.release()
-            return connection[GossipConnectionPool.SERVER_IDENTIFIER]
-        else:
-            self._pool_lock.release()
+        server_identifier_of = self.get_snapshot().server_identifier_of
+        if identifier not in server_identifier_of:
             raise GossipIdentifierNotFound('Cannot find identifier %s' % identifier)
+        return server_identifier_of[identifier]
 
     def get_identifiers(self):
         """ Gets a list of all identifiers.
 
-        :returns: List of all identifier strings
+        :returns: List of all identifiers
         """
-        self._pool_lock.acquire()
-        identifiers = self._connections.keys()
-        self._pool_lock.release()
-        return identifiers
+        return list(self.get_snapshot().identifiers)
+
+    def sample_server_identifiers(self, amount, seed, page=0, identifier_to_exclude=None):
+        """ Provides a uniform random sample of the server identifiers. Every server identifier gets a pseudo random
+        rank derived from the seed, and the sample consists of the server identifiers with the lowest ranks (key based
+        reservoir sampling). Since the ranks only depend on the seed, further pages continue the same sample without
+        repetitions, even if connections have been added or removed meanwhile.
+
+        :param amount: Max. amount of server identifiers per page
+        :param seed: Bytes which determine the ranks, e.g. the server identifier of the requesting peer
+        :param page: (optional) Index of the page, page 0 contains the server identifiers with the lowest ranks
+        :param identifier_to_exclude: (optional) Server identifiers to exclude
+        :returns: List of at most amount server identifiers
+        """
+        server_identifiers = self.get_server_identifiers(identifier_to_exclude=identifier_to_exclude)
+        ranked = heapq.nsmallest((page + 1) * amount, set(server_identifiers),
+                                 key=lambda x: hashlib.blake2b(seed + x, digest_size=8).digest())
+        return ranked[page * amount:]
+
+    def get_identifiers_of_server(self, server_identifier):
+        """ Provides the identifiers of all connections to a server.
+
+        :param server_identifier: The server identifier, e.g. '192.168.1.2:6001'
+        :returns: List of identifiers
+        """
+        return list(self.get_snapshot().identifiers_of_server.get(server_identifier, ()))
 
     def get_server_identifiers(self, identifier_to_exclude=None):
-        """ Collects server identifiers
+        """ Collects server identifiers. Every server identifier is contained once, even if there are several
+        connections to the same server.
 
         :param identifier_to_exclude: (optional) Server identifiers to exclude
         """
-        if not identifier_to_exclude:
-            identifier_to_exclude = []
+        return list(self.__known_server_identifiers(identifier_to_exclude))
 
-        server_identifiers = []
-        self._pool_lock.acquire()
-        for identifier, connection in self._connections.items():
-            server_address = connection[GossipConnectionPool.SERVER_IDENTIFIER]
-            if server_address and server_address not in identifier_to_exclude:
-                server_identifiers.append(server_address)
-        self._pool_lock.release()
+    def __known_server_identifiers(self, identifier_to_exclude=None):
+        """ Provides the set of server identifiers of all connections. """
+        server_identifiers = set(self.get_snapshot().identifiers_of_server)
+        if identifier_to_exclude:
+            server_identifiers.difference_update(identifier_to_exclude)
         return server_identifiers
 
     def __str__(self):
         output = ', '.join(['%s<=%s' % (key, val[GossipConnectionPool.SERVER_IDENTIFIER])
-                            for key, val in self._connections.items()])
+                            for key, val in list(self._connections.items())])
         if output == '':
             output = 'Pool is empty'
         return output
 
-    def __maintain_connections(self):
-        """ Maintains the list of connections. If number of current connections exceeds maximum cache size a random
-        connection is killed. """
-        if len(self._connections) > self._cache_size:
-            self._pool_lock.acquire()
-            connection_to_remove = list(self._connections.keys())[random.randint(0, len(self._connections) - 1)]
-            self._pool_lock.release()
+    def __maintain_connections(self, identifier_to_keep):
+        """ Maintains the list of connections. If the number of current connections exceeds the cache size plus the
+        headroom (high watermark), connections are killed until the cache size (low watermark) is reached again, but
+        never the connection which has just been added. The eviction policy chooses the victims. The killed peers are
+        moved to the passive view together with their scores, so they can be promoted again later on.
+
+        :param identifier_to_keep: Identifier of the connection which has just been added
+        """
+        if len(self._connections) <= self._cache_size + self._headroom:
+            return
+        self._pool_lock.acquire()
+        connections = {identifier: connection for identifier, connection in list(self._connections.items())
+                       if identifier != identifier_to_keep}
+        surplus = len(self._connections) - self._cache_size
+        self._pool_lock.release()
+        candidates = {identifier: self.__eviction_info(connection) for identifier, connection in connections.items()}
+        for connection_to_remove in self.eviction_policy.select_victims(candidates, surplus):
+            server_identifier = connections[connection_to_remove][GossipConnectionPool.SERVER_IDENTIFIER]
             killed_connection = self.remove_connection(connection_to_remove)
+            if killed_connection is None:
+                continue
+            if self.passive_view is not None and server_identifier:
+                self.passive_view.add_identifiers([server_identifier],
+                                                  score=candidates[connection_to_remove]['score'])
             killed_connection.shutdown(SHUT_RDWR)
             killed_connection.close()
             logging.debug('%s | Connection maintainer removes: %s (current pool: %s)' % (self.connection_pool_label,
                                                                                          connection_to_remove, self))
 
+    def __eviction_info(self, connection):
+        """ Collects what eviction policies know about a connection, see GossipEvictionPolicy.select_victims. """
+        if connection[GossipConnectionPool.SLOT] is None:
+            return {'score': score_peer(None, 0.0), 'last_activity': 0.0, 'connected': 0.0,
+                    'outbound': connection[GossipConnectionPool.OUTBOUND]}
+        stats = self.stats.get(connection[GossipConnectionPool.SLOT])
+        return {'score': score_peer(stats['rtt'], stats['error_rate']), 'last_activity': stats['last_activity'],
+                'connected': stats['connected'], 'outbound': connection[GossipConnectionPool.OUTBOUND]}
+
+    def record_ping(self, identifier):
+        """ Remembers that a ping has been sent via a connection. If the previous ping has not been answered until
+        now, it counts as an error.
+
+        :param identifier: Unique identifier to find the affected connection
+        """
+        slot = self.get_slot(identifier)
+        if slot is not None:
+            self.stats.record_ping(slot, time.monotonic())
+
+    def record_pong(self, identifier, rtt):
+        """ Updates the RTT and the error rate of a connection after a ping has been answered.
+
+        :param identifier: Unique identifier to find the affected connection
+        :param rtt: The measured RTT in seconds
+        """
+        slot = self.get_slot(identifier)
+        if slot is not None:
+            logging.debug('%s | RTT of %s is %.1f ms' % (self.connection_pool_label, identifier,
+                                                         self.stats.record_pong(slot, rtt) * 1000))
+
+    def get_score(self, identifier):
+        """ Provides the score of a connection, see score_peer.
+
+        :param identifier: Unique identifier to find the affected connection
+        :returns: The score, lower scores are better
+        """
+        self._pool_lock.acquire()
+        connection = self._connections.get(identifier, None)
+        self._pool_lock.release()
+        if connection is None:
+            raise GossipIdentifierNotFound('Cannot find identifier %s' % identifier)
+        return self.__score(connection)
+
+    def __score(self, connection):
+        if connection[GossipConnectionPool.SLOT] is None:
+            return score_peer(None, 0.0)
+        stats = self.stats.get(connection[GossipConnectionPool.SLOT])
+        return score_peer(stats['rtt'], stats['error_rate'])
+
+    def get_connection_stats(self, identifier):
+        """ Provides the statistics of one connection.
+
+        :param identifier: Unique identifier to find the affected connection
+        :returns: A dict as provided by GossipPeerStats.get, None if the connection has no slot in the stats table
+        """
+        self._pool_lock.acquire()
+        connection = self._connections.get(identifier, None)
+        self._pool_lock.release()
+        if connection is None:
+            raise GossipIdentifierNotFound('Cannot find identifier %s' % identifier)
+        if connection[GossipConnectionPool.SLOT] is None:
+            return None
+        return self.stats.get(connection[GossipConnectionPool.SLOT])
+
+    def get_stats(self):
+        """ Provides the statistics of all connections, e.g. for monitoring.
+
+        :returns: A dict in the form {<identifier>: <stats>}, where the stats are a dict as provided by
+                  GossipPeerStats.get plus the key server_identifier
+        """
+        self._pool_lock.acquire()
+        connections = list(self._connections.items())
+        self._pool_lock.release()
+        all_stats = {}
+        for identifier, connection in connections:
+            if connection[GossipConnectionPool.SLOT] is not None:
+                all_stats[identifier] = self.stats.get(connection[GossipConnectionPool.SLOT])
+                all_stats[identifier]['server_identifier'] = connection[GossipConnectionPool.SERVER_IDENTIFIER]
+        return all_stats
+
+    def get_idle_identifiers(self, idle_since):
+        """ Provides the identifiers of all connections which have not received anything for a while.
+
+        :param idle_since: Connections whose last activity is older than this point in time (time.monotonic) are idle
+        :returns: List of identifiers
+        """
+        idle_slots = set(self.stats.get_idle_slots(idle_since))
+        self._pool_lock.acquire()
+        identifiers = [identifier for identifier, connection in list(self._connections.items())
+                       if connection[GossipConnectionPool.SLOT] in idle_slots]
+        self._pool_lock.release()
+        return identifiers
+
+    def format_stats(self):
+        """ Renders the statistics of all connections as a table for operators.
+
+        :returns: The table as string
+        """
+        now = time.monotonic()
+        lines = ['%-21s %-21s %9s %7s %6s %10s %10s %8s %8s %7s'
+                 % ('identifier', 'server identifier', 'rtt (ms)', 'errors', 'idle', 'bytes in', 'bytes out', 'msgs in',
+                    'msgs out', 'age')]
+        for identifier, stats in sorted(self.get_stats().items()):
+            lines.append('%-21s %-21s %9s %7.2f %6.1f %10d %10d %8d %8d %7.0f'
+                         % (identifier, stats['server_identifier'] or '-',
+                            '-' if stats['rtt'] is None else '%.1f' % (stats['rtt'] * 1000), stats['error_rate'],
+                            now - stats['last_activity'], stats['bytes_in'], stats['bytes_out'], stats['messages_in'],
+                            stats['messages_out'], now - stats['connected']))
+        return '\n'.join(lines)
+
     def get_capacity(self):
-        """ Provides the left capacity of the current connection pool.
+        """ Provides the left capacity of the current connection pool. Reserved places count as used.
 
-        :returns: The left capacity
+        :returns: The left capacity, negative if unsolicited connections exceed the cache size
         """
-        return self._cache_size - len(self._connections)
+        self._pool_lock.acquire()
+        self.__purge_reservations(time.monotonic())
+        capacity = self._cache_size - len(self._connections) - len(self._reservations)
+        self._pool_lock.release()
+        return capacity
 
     def filter_new_server_identifiers(self, server_identifiers, identifier_to_exclude=None):
         """ Provides all given identifiers which are not known until now.
@@ -176,12 +526,9 @@ class GossipConnectionPool:
         :param identifier_to_exclude: (optional) Server identifiers to exclude
         :returns: Identifiers which are not known as server identifiers in the connection pool until now
         """
-        known_server_identifiers = self.get_server_identifiers(identifier_to_exclude=identifier_to_exclude)
-        new_identifiers = []
-        for server_identifier in server_identifiers:
-            if server_identifier not in known_server_identifiers:
-                new_identifiers.append(server_identifier)
-        return new_identifiers
+        new_server_identifiers = set(server_identifiers) - self.__known_server_identifiers(identifier_to_exclude)
+        return [server_identifier for server_identifier in server_identifiers
+                if server_identifier in new_server_identifiers]
 
     def get_random_identifier(self, identifier_to_exclude):
         """ Provides a random identifier which represents an active connection in the pool at the moment.
@@ -189,12 +536,151 @@ class GossipConnectionPool:
         :param identifier_to_exclude: Identifier to exclude
         :returns: Random identifier
         """
-        self._pool_lock.acquire()
-        identifiers = [identifier for identifier in self._connections.keys() if identifier != identifier_to_exclude]
-        self._pool_lock.release()
+        identifiers = [identifier for identifier in self.get_snapshot().identifiers
+                       if identifier != identifier_to_exclude]
         if len(identifiers) > 1:
             return identifiers[random.randint(0, len(identifiers) - 1)]
         elif len(identifiers) == 1:
             return identifiers[0]
         else:
             return None
+
+    def get_random_identifiers(self, amount, identifiers_to_exclude=None):
+        """ Provides several random identifiers which represent active connections in the pool at the moment.
+
+        :param amount: Max. amount of identifiers, 0 provides all identifiers
+        :param identifiers_to_exclude: (optional) Identifiers to exclude
+        :returns: List of distinct random identifiers
+        """
+        identifiers = self.get_snapshot().identifiers
+        if identifiers_to_exclude:
+            identifiers_to_exclude = set(identifiers_to_exclude)
+            identifiers = [identifier for identifier in identifiers if identifier not in identifiers_to_exclude]
+        if 0 < amount < len(identifiers):
+            return random.sample(identifiers, amount)
+        return list(identifiers)
+
+    def set_eager(self, identifier, eager):
+        """ Changes the type of a link within the broadcast tree. Messages are pushed over eager links, only their
+        digests are advertised over lazy links. New connections are eager.
+
+        :param identifier: Unique identifier to find the affected connection
+        :param eager: True for an eager link, False for a lazy link
+        """
+        self._pool_lock.acquire()
+        if identifier in self._connections and (identifier in self._lazy_links) == eager:
+            if eager:
+                self._lazy_links.pop(identifier, None)
+            else:
+                self._lazy_links[identifier] = True
+            self.__publish()
+            logging.debug('%s | Link to %s is %s now'
+                          % (self.connection_pool_label, identifier, 'eager' if eager else 'lazy'))
+        self._pool_lock.release()
+
+    def get_link_identifiers(self, eager, identifiers_to_exclude=None):
+        """ Provides the identifiers of all eager resp. all lazy links.
+
+        :param eager: True for eager links, False for lazy links
+        :param identifiers_to_exclude: (optional) Identifiers to exclude
+        :returns: List of identifiers
+        """
+        snapshot = self.get_snapshot()
+        identifiers_to_exclude = set(identifiers_to_exclude) if identifiers_to_exclude else set()
+        return [identifier for identifier in snapshot.identifiers
+                if (identifier not in snapshot.lazy_identifiers) == eager and identifier not in identifiers_to_exclude]
+
+
+class GossipPassiveView:
+    """ Thread-safe implementation of the passive view of a peer. It contains server identifiers of peers which are
+    known but not connected at the moment. If a connection of the active view (the connection pool) is lost, a peer of
+    the passive view is promoted to a new connection. """
+
+    def __init__(self, passive_view_label, view_size=60, shared=True):
+        """ Constructor.
+
+        :param passive_view_label: A label to derive the concrete functionality of this passive view
+        :param view_size: (optional) The max. amount of server identifiers in this passive view
+        :param shared: (optional) If False, the view can only be used by threads of the current process
+        """
+        self.passive_view_label = passive_view_label
+        if shared:
+            self._identifiers = Manager().dict()
+            self._view_lock = Lock()
+        else:
+            self._identifiers = {}
+            self._view_lock = threading.Lock()
+        self._view_size = view_size
+
+    def add_identifiers(self, server_identifiers, identifiers_to_exclude=None, score=None):
+        """ Adds server identifiers to the passive view. If the view exceeds its size, random identifiers are removed.
+
+        :param server_identifiers: Server identifiers to add
+        :param identifiers_to_exclude: (optional) Server identifiers which must not be added (e.g. our own one or the
+                                       ones of the active view)
+        :param score: (optional) The last known score of the peers (see score_peer), e.g. of an evicted connection
+        """
+        if not identifiers_to_exclude:
+            identifiers_to_exclude = []
+
+        self._view_lock.acquire()
+        for server_identifier in server_identifiers:
+            if server_identifier not in identifiers_to_exclude and \
+                    (score is not None or server_identifier not in self._identifiers):
+                self._identifiers[server_identifier] = score
+        while len(self._identifiers) > self._view_size:
+            identifiers = list(self._identifiers.keys())
+            self._identifiers.pop(identifiers[random.randint(0, len(identifiers) - 1)], None)
+        self._view_lock.release()
+        logging.debug('%s | Passive view: %s' % (self.passive_view_label, self))
+
+    def remove_identifier(self, server_identifier):
+        """ Removes a server identifier from the passive view, e.g. because it is connected now.
+
+        :param server_identifier: The server identifier to remove
+        """
+        self._view_lock.acquire()
+        self._identifiers.pop(server_identifier, None)
+        self._view_lock.release()
+
+    def pop_random_identifier(self, identifiers_to_exclude=None):
+        """ Removes a server identifier from the passive view, e.g. to promote it to a new connection. The peer with
+        the best known score out of a few random ones is chosen, peers without a score count as unmeasured peers.
+
+        :param identifiers_to_exclude: (optional) Server identifiers which must not be chosen
+        :returns: The server identifier (None if there is no one left)
+        """
+        if not identifiers_to_exclude:
+            identifiers_to_exclude = []
+
+        self._view_lock.acquire()
+        candidates = [(identifier, score) for identifier, score in list(self._identifiers.items())
+                      if identifier not in identifiers_to_exclude]
+        candidates = random.sample(candidates, min(SELECTION_SAMPLE_SIZE, len(candidates)))
+        server_identifier = None
+        if candidates:
+            server_identifier = min(candidates, key=lambda x: score_peer(None, 0.0) if x[1] is None else x[1])[0]
+        if server_identifier:
+            self._identifiers.pop(server_identifier, None)
+        self._view_lock.release()
+        return server_identifier
+
+    def get_random_identifiers(self, amount):
+        """ Provides random server identifiers of the passive view without removing them.
+
+        :param amount: Max. amount of server identifiers
+        :returns: List of distinct server identifiers
+        """
+        self._view_lock.acquire()
+        identifiers = list(self._identifiers.keys())
+        self._view_lock.release()
+        return random.sample(identifiers, min(amount, len(identifiers)))
+
+    def __len__(self):
+        return len(self._identifiers)
+
+    def __str__(self):
+        output = ', '.join(str(server_identifier) for server_identifier in self._identifiers.keys())
+        if output == '':
+            output = 'View is empty'
+        return output
@@ -0,0 +1,135 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import random
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+EVICTION_POLICY_RANDOM = 'random'
+EVICTION_POLICY_SCORE = 'score'
+EVICTION_POLICY_LEAST_RECENTLY_ACTIVE = 'least_recently_active'
+EVICTION_POLICY_YOUNGEST_FIRST = 'youngest_first'
+EVICTION_POLICY_INBOUND_RATIO = 'inbound_ratio'
+
+""" Amount of random candidates the score policy evicts the worst one of. Good peers are preferred this way, but every
+peer still has a chance, so random links keep the network connected. """
+EVICTION_SAMPLE_SIZE = 3
+
+""" Share of outbound connections the inbound ratio policy protects """
+OUTBOUND_SHARE = 0.5
+
+
+class GossipEvictionPolicy(abc.ABC):
+    """ Base class of all eviction policies. A policy decides which connections the connection pool kills if it holds
+    too many of them. Policies only rank the candidates they get, they neither access the pool nor the sockets. """
+
+    @abc.abstractmethod
+    def select_victims(self, candidates, amount):
+        """ Chooses the connections to evict.
+
+        :param candidates: A dict in the form {<identifier>: <info>}, where every info is a dict with the keys score
+                           (see score_peer, lower is better), last_activity and connected (time.monotonic of the last
+                           received data resp. of the connection setup) and outbound (True if we dialed the peer)
+        :param amount: The amount of connections to evict
+        :returns: List of at most amount identifiers
+        """
+
+
+class GossipRandomEviction(GossipEvictionPolicy):
+    """ Evicts random connections. """
+
+    def select_victims(self, candidates, amount):
+        return random.sample(list(candidates), min(amount, len(candidates)))
+
+
+class GossipScoreEviction(GossipEvictionPolicy):
+    """ Evicts the connection with the worst score out of a few random ones, one after the other. """
+
+    def __init__(self, sample_size=EVICTION_SAMPLE_SIZE):
+        """ Constructor.
+
+        :param sample_size: (optional) Amount of random candidates per victim
+        """
+        self.sample_size = sample_size
+
+    def select_victims(self, candidates, amount):
+        remaining = list(candidates)
+        victims = []
+        while len(victims) < amount and remaining:
+            sample = random.sample(remaining, min(self.sample_size, len(remaining)))
+            victim = max(sample, key=lambda x: candidates[x]['score'])
+            remaining.remove(victim)
+            victims.append(victim)
+        return victims
+
+
+class GossipLeastRecentlyActiveEviction(GossipEvictionPolicy):
+    """ Evicts the connections which have not received anything for the longest time. """
+
+    def select_victims(self, candidates, amount):
+        return sorted(candidates, key=lambda x: candidates[x]['last_activity'])[:amount]
+
+
+class GossipYoungestFirstEviction(GossipEvictionPolicy):
+    """ Evicts the connections which have been set up last. Long-living connections survive, so a flood of new
+    connections (e.g. of an attacker) cannot push out the established peers. """
+
+    def select_victims(self, candidates, amount):
+        return sorted(candidates, key=lambda x: candidates[x]['connected'], reverse=True)[:amount]
+
+
+class GossipInboundRatioEviction(GossipEvictionPolicy):
+    """ Evicts inbound connections as long as they take at least their share of the connections, so that the peers
+    we have chosen ourselves are protected against peers which connect to us. Within each direction the connection
+    with the worst score is evicted first. """
+
+    def __init__(self, outbound_share=OUTBOUND_SHARE):
+        """ Constructor.
+
+        :param outbound_share: (optional) Share of the connections which is reserved for outbound connections
+        """
+        self.outbound_share = outbound_share
+
+    def select_victims(self, candidates, amount):
+        inbound = sorted([identifier for identifier, info in candidates.items() if not info['outbound']],
+                         key=lambda x: candidates[x]['score'])
+        outbound = sorted([identifier for identifier, info in candidates.items() if info['outbound']],
+                          key=lambda x: candidates[x]['score'])
+        victims = []
+        while len(victims) < amount and (inbound or outbound):
+            total = len(inbound) + len(outbound)
+            if inbound and (not outbound or len(inbound) >= total * (1.0 - self.outbound_share)):
+                victims.append(inbound.pop())
+            else:
+                victims.append(outbound.pop())
+        return victims
+
+
+EVICTION_POLICIES = {EVICTION_POLICY_RANDOM: GossipRandomEviction,
+                     EVICTION_POLICY_SCORE: GossipScoreEviction,
+                     EVICTION_POLICY_LEAST_RECENTLY_ACTIVE: GossipLeastRecentlyActiveEviction,
+                     EVICTION_POLICY_YOUNGEST_FIRST: GossipYoungestFirstEviction,
+                     EVICTION_POLICY_INBOUND_RATIO: GossipInboundRatioEviction}
+
+
+def create_eviction_policy(policy_name=EVICTION_POLICY_SCORE):
+    """ Creates an eviction policy by its name, e.g. as configured.
+
+    :param policy_name: (optional) One of the keys of EVICTION_POLICIES
+    :returns: The new GossipEvictionPolicy
+    """
+    if policy_name not in EVICTION_POLICIES:
+        raise ValueError('Unknown eviction policy: %s' % policy_name)
+    return EVICTION_POLICIES[policy_name]()
@@ -0,0 +1,176 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import multiprocessing
+import threading
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Weight of a new sample within the moving averages of the RTT and the error rate of a connection """
+QUALITY_EWMA_WEIGHT = 0.2
+
+""" Value of the RTT field as long as the RTT of a connection has not been measured """
+RTT_UNMEASURED = -1.0
+
+
+class GossipPeerStats:
+    """ Thread-safe table of statistics per connection. Every connection owns one slot (its handle) of a flat array of
+    floats as long as it is in the connection pool, so receivers, senders and controllers update the statistics
+    without sending the connection entries through the manager of the connection pool. A slot is handed out again as
+    soon as its connection has been removed, so updates of a receiver which did not notice the removal yet may still
+    be counted for the next connection. """
+    IN_USE = 0
+    CONNECTED = 1
+    LAST_ACTIVITY = 2
+    BYTES_IN = 3
+    BYTES_OUT = 4
+    MESSAGES_IN = 5
+    MESSAGES_OUT = 6
+    RTT = 7
+    ERROR_RATE = 8
+    PING_SENT = 9
+    FIELD_COUNT = 10
+
+    def __init__(self, slot_count, shared=True):
+        """ Constructor.
+
+        :param slot_count: The max. amount of connections which are tracked at once
+        :param shared: (optional) If False, the table can only be used by threads of the current process
+        """
+        self.slot_count = slot_count
+        if shared:
+            self._values = multiprocessing.RawArray('d', slot_count * GossipPeerStats.FIELD_COUNT)
+            self._lock = multiprocessing.Lock()
+        else:
+            self._values = array.array('d', [0.0] * slot_count * GossipPeerStats.FIELD_COUNT)
+            self._lock = threading.Lock()
+
+    def allocate(self, now):
+        """ Reserves a free slot for a new connection and resets its statistics.
+
+        :param now: The current time in seconds (time.monotonic)
+        :returns: The slot, None if all slots are in use
+        """
+        with self._lock:
+            for slot in range(self.slot_count):
+                offset = slot * GossipPeerStats.FIELD_COUNT
+                if not self._values[offset + GossipPeerStats.IN_USE]:
+                    for field in range(GossipPeerStats.FIELD_COUNT):
+                        self._values[offset + field] = 0.0
+                    self._values[offset + GossipPeerStats.IN_USE] = 1.0
+                    self._values[offset + GossipPeerStats.CONNECTED] = now
+                    self._values[offset + GossipPeerStats.LAST_ACTIVITY] = now
+                    self._values[offset + GossipPeerStats.RTT] = RTT_UNMEASURED
+                    return slot
+        return None
+
+    def release(self, slot):
+        """ Frees the slot of a removed connection.
+
+        :param slot: The slot of the connection
+        """
+        with self._lock:
+            self._values[slot * GossipPeerStats.FIELD_COUNT + GossipPeerStats.IN_USE] = 0.0
+
+    def record_received(self, slot, size, message_count, now):
+        """ Counts incoming data of a connection.
+
+        :param slot: The slot of the connection
+        :param size: The amount of received bytes
+        :param message_count: The amount of complete messages within these bytes
+        :param now: The current time in seconds (time.monotonic)
+        """
+        offset = slot * GossipPeerStats.FIELD_COUNT
+        with self._lock:
+            self._values[offset + GossipPeerStats.BYTES_IN] += size
+            self._values[offset + GossipPeerStats.MESSAGES_IN] += message_count
+            self._values[offset + GossipPeerStats.LAST_ACTIVITY] = now
+
+    def record_sent(self, slot, size):
+        """ Counts an outgoing message of a connection.
+
+        :param slot: The slot of the connection
+        :param size: The size of the message in bytes
+        """
+        offset = slot * GossipPeerStats.FIELD_COUNT
+        with self._lock:
+            self._values[offset + GossipPeerStats.BYTES_OUT] += size
+            self._values[offset + GossipPeerStats.MESSAGES_OUT] += 1
+
+    def record_ping(self, slot, now):
+        """ Remembers that a ping has been sent. If the previous ping has not been answered until now, it counts as an
+        error.
+
+        :param slot: The slot of the connection
+        :param now: The current time in seconds (time.monotonic)
+        """
+        offset = slot * GossipPeerStats.FIELD_COUNT
+        with self._lock:
+            if self._values[offset + GossipPeerStats.PING_SENT]:
+                self._values[offset + GossipPeerStats.ERROR_RATE] += \
+                    QUALITY_EWMA_WEIGHT * (1.0 - self._values[offset + GossipPeerStats.ERROR_RATE])
+            self._values[offset + GossipPeerStats.PING_SENT] = now
+
+    def record_pong(self, slot, rtt):
+        """ Updates the RTT and the error rate after a ping has been answered.
+
+        :param slot: The slot of the connection
+        :param rtt: The measured RTT in seconds
+        :returns: The moving average of the RTT in seconds
+        """
+        offset = slot * GossipPeerStats.FIELD_COUNT
+        with self._lock:
+            if self._values[offset + GossipPeerStats.RTT] == RTT_UNMEASURED:
+                self._values[offset + GossipPeerStats.RTT] = rtt
+            else:
+                self._values[offset + GossipPeerStats.RTT] += \
+                    QUALITY_EWMA_WEIGHT * (rtt - self._values[offset + GossipPeerStats.RTT])
+            if self._values[offset + GossipPeerStats.PING_SENT]:
+                self._values[offset + GossipPeerStats.ERROR_RATE] -= \
+                    QUALITY_EWMA_WEIGHT * self._values[offset + GossipPeerStats.ERROR_RATE]
+            self._values[offset + GossipPeerStats.PING_SENT] = 0.0
+            return self._values[offset + GossipPeerStats.RTT]
+
+    def get(self, slot):
+        """ Provides the statistics of a connection.
+
+        :param slot: The slot of the connection
+        :returns: A dict with the keys connected, last_activity (time.monotonic of the last received data), bytes_in,
+                  bytes_out, messages_in, messages_out, rtt (None if not measured yet), error_rate and ping_pending
+        """
+        offset = slot * GossipPeerStats.FIELD_COUNT
+        with self._lock:
+            values = self._values[offset:offset + GossipPeerStats.FIELD_COUNT]
+        return {'connected': values[GossipPeerStats.CONNECTED],
+                'last_activity': values[GossipPeerStats.LAST_ACTIVITY],
+                'bytes_in': int(values[GossipPeerStats.BYTES_IN]),
+                'bytes_out': int(values[GossipPeerStats.BYTES_OUT]),
+                'messages_in': int(values[GossipPeerStats.MESSAGES_IN]),
+                'messages_out': int(values[GossipPeerStats.MESSAGES_OUT]),
+                'rtt': None if values[GossipPeerStats.RTT] == RTT_UNMEASURED else values[GossipPeerStats.RTT],
+                'error_rate': values[GossipPeerStats.ERROR_RATE],
+                'ping_pending': values[GossipPeerStats.PING_SENT] > 0}
+
+    def get_idle_slots(self, idle_since):
+        """ Provides all slots in use which have not received anything for a while.
+
+        :param idle_since: Slots whose last activity is older than this point in time (time.monotonic) are idle
+        :returns: List of slots
+        """
+        with self._lock:
+            values = self._values[:]
+        return [slot for slot in range(self.slot_count)
+                if values[slot * GossipPeerStats.FIELD_COUNT + GossipPeerStats.IN_USE] and
+                values[slot * GossipPeerStats.FIELD_COUNT + GossipPeerStats.LAST_ACTIVITY] < idle_since]
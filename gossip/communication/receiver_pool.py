@@ -0,0 +1,192 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import multiprocessing
+import os
+import selectors
+import socket
+import time
+
+from gossip.communication.client_receiver import decode_message
+from gossip.util import packing
+from gossip.util.exceptions import GossipMessageException, GossipMessageFormatException
+from gossip.util.peer_address import GossipPeerAddress, PEER_ADDRESS_SIZE
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, QUEUE_ITEM_TYPE_CONNECTION_LOST, \
+    QUEUE_ITEM_TYPE_NEW_CONNECTION
+from gossip.util.runtime import GossipWorker, WORKER_POLL_INTERVAL
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Max. amount of bytes which are read from a socket at once """
+RECEIVE_BUFFER_SIZE = 65536
+
+
+class GossipReceiverWorker(GossipWorker):
+    """ A receiver worker handles many connections at once. It waits for incoming data on all of its sockets by means
+    of a selector and forwards the received messages to the controller. New connections are handed over by the
+    GossipReceiverPool via a unix socket pair, which passes the file descriptors of the sockets. """
+
+    def __init__(self, receiver_label, to_controller_queue, connection_pool):
+        """ Constructor.
+
+        :param receiver_label: A label to derive the concrete functionality of this receiver worker
+        :param to_controller_queue: The queue which connects this receiver worker with the responsible controller
+        :param connection_pool: If a socket crashes, the connection will be removed in this connection pool
+        """
+        GossipWorker.__init__(self, receiver_label)
+        self.receiver_label = receiver_label
+        self.to_controller_queue = to_controller_queue
+        self.connection_pool = connection_pool
+        self.handoff_socket, self._handoff_reader = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.load = multiprocessing.Value('i', 0)
+        self._selector = None
+        self._buffers = {}
+
+    def hand_over(self, identifier, client_socket):
+        """ Hands a connection over to this worker. Must be called under the lock of the receiver pool.
+
+        :param identifier: The identifier of the connection, e.g. '192.168.1.2:6001'
+        :param client_socket: The socket of the connection
+        """
+        with self.load.get_lock():
+            self.load.value += 1
+        socket.send_fds(self.handoff_socket, [identifier], [client_socket.fileno()])
+
+    def run(self):
+        """ Waits for new connections and incoming data until the worker is stopped. """
+        logging.info('%s started - PID: %s' % (self.receiver_label, os.getpid()))
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._handoff_reader, selectors.EVENT_READ)
+        while not self.stopped():
+            for key, _ in self._selector.select(timeout=WORKER_POLL_INTERVAL):
+                if key.fileobj is self._handoff_reader:
+                    self.__accept_handoff()
+                else:
+                    self.__receive(key.fileobj, *key.data)
+        for identifier, client_socket in [(key.data[0], key.fileobj) for key in self._selector.get_map().values()
+                                          if key.fileobj is not self._handoff_reader]:
+            self.__close(identifier, client_socket)
+        self._selector.close()
+
+    def __accept_handoff(self):
+        """ Takes over a connection from the receiver pool and informs the controller about it. """
+        packed_identifier, fds, _, _ = socket.recv_fds(self._handoff_reader, PEER_ADDRESS_SIZE, 1)
+        identifier = GossipPeerAddress(packed_identifier)
+        # The socket is a duplicate of the one used by the sender. It stays in blocking mode, since the file status
+        # flags are shared between both descriptors. The selector guarantees that recv does not block anyway.
+        client_socket = socket.socket(fileno=fds[0])
+        self._buffers[client_socket] = b''
+        self._selector.register(client_socket, selectors.EVENT_READ,
+                                (identifier, self.connection_pool.get_slot(identifier)))
+        logging.info('%s (%s) | Took over connection' % (self.receiver_label, identifier))
+        self.to_controller_queue.put({'type': QUEUE_ITEM_TYPE_NEW_CONNECTION,
+                                      'identifier': identifier,
+                                      'message': None})
+
+    def __receive(self, client_socket, identifier, slot):
+        """ Reads the available data of a socket and forwards all complete messages to the controller. Connections to
+        clients which disconnect or send malformed messages are closed.
+
+        :param client_socket: The readable socket
+        :param identifier: The identifier of the connection
+        :param slot: The slot of the connection in the stats table of the connection pool, None if it has none
+        """
+        try:
+            data = client_socket.recv(RECEIVE_BUFFER_SIZE)
+            if not data:
+                logging.debug('%s (%s) | Client disconnected' % (self.receiver_label, identifier))
+                self.__lose(identifier, client_socket)
+                return
+            msgs, self._buffers[client_socket] = packing.parse_msgs(self._buffers[client_socket] + data)
+            if slot is not None:
+                self.connection_pool.stats.record_received(slot, len(data), len(msgs), time.monotonic())
+            for msg in msgs:
+                message_object = decode_message(msg)
+                logging.debug('%s (%s) | Received message %s' % (self.receiver_label, identifier, message_object))
+                self.to_controller_queue.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE,
+                                              'identifier': identifier,
+                                              'message': message_object})
+        except (GossipMessageException, GossipMessageFormatException) as e:
+            logging.debug('%s (%s) | Received undecodable or invalid message: %s' % (self.receiver_label, identifier,
+                                                                                     e))
+            self.__lose(identifier, client_socket)
+        except (ConnectionResetError, ConnectionAbortedError):
+            logging.debug('%s (%s) | Client disconnected' % (self.receiver_label, identifier))
+            self.__lose(identifier, client_socket)
+
+    def __lose(self, identifier, client_socket):
+        """ Closes a lost connection, removes it from the connection pool and informs the controller about it.
+
+        :param identifier: The identifier of the lost connection
+        :param client_socket: The socket of the lost connection
+        """
+        self.__close(identifier, client_socket)
+        logging.info('%s (%s) Removing connection from connection pool' % (self.receiver_label, identifier))
+        self.connection_pool.remove_connection(identifier)
+        self.to_controller_queue.put({'type': QUEUE_ITEM_TYPE_CONNECTION_LOST,
+                                      'identifier': identifier,
+                                      'message': None})
+
+    def __close(self, identifier, client_socket):
+        self._selector.unregister(client_socket)
+        client_socket.close()
+        self._buffers.pop(client_socket, None)
+        with self.load.get_lock():
+            self.load.value -= 1
+
+
+class GossipReceiverPool:
+    """ A fixed pool of receiver workers which is started together with the other Gossip workers. Servers and senders
+    hand new connections to the pool instead of starting a new client receiver per connection, so setting up a
+    connection does not cost a new process or thread. """
+
+    def __init__(self, receiver_label, worker_count, to_controller_queue, connection_pool):
+        """ Constructor.
+
+        :param receiver_label: A label to derive the concrete functionality of the receiver workers
+        :param worker_count: The amount of receiver workers
+        :param to_controller_queue: The queue which connects the receiver workers with the responsible controller
+        :param connection_pool: If a socket crashes, the connection will be removed in this connection pool
+        """
+        self.receiver_label = receiver_label
+        self.workers = [GossipReceiverWorker('%s%d' % (receiver_label, worker_index), to_controller_queue,
+                                             connection_pool)
+                        for worker_index in range(worker_count)]
+        self._lock = multiprocessing.Lock()
+
+    def add_connection(self, identifier, client_socket):
+        """ Hands a new connection to the least loaded receiver worker.
+
+        :param identifier: The identifier of the connection, e.g. '192.168.1.2:6001'
+        :param client_socket: The socket of the connection
+        """
+        with self._lock:
+            worker = min(self.workers, key=lambda x: x.load.value)
+            worker.hand_over(identifier, client_socket)
+        logging.debug('%s | Handed connection %s over to %s' % (self.receiver_label, identifier, worker.receiver_label))
+
+
+def create_receiver_pool(receiver_label, worker_count, to_controller_queue, connection_pool):
+    """ Creates a receiver pool unless receivers are configured to be started per connection.
+
+    :param receiver_label: A label to derive the concrete functionality of the receiver workers
+    :param worker_count: The amount of receiver workers, 0 starts a new receiver per connection instead
+    :param to_controller_queue: The queue which connects the receiver workers with the responsible controller
+    :param connection_pool: If a socket crashes, the connection will be removed in this connection pool
+    :returns: A GossipReceiverPool, or None if worker_count is 0
+    """
+    if worker_count > 0:
+        return GossipReceiverPool(receiver_label, worker_count, to_controller_queue, connection_pool)
+    return None
@@ -13,17 +13,19 @@
 # limitations under the License.
 
 import logging
-import multiprocessing
+import os
 import socket
 
 from gossip.communication.client_receiver import GossipClientReceiver
+from gossip.util.peer_address import GossipPeerAddress
+from gossip.util.runtime import GossipWorker, WORKER_POLL_INTERVAL
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
 
-class GossipServer(multiprocessing.Process):
+class GossipServer(GossipWorker):
     def __init__(self, server_label, client_receiver_label, bind_address, tcp_port, to_controller_queue,
-                 connection_pool):
+                 connection_pool, receiver_pool=None):
         """ The Gossip server waits for new connections established by other clients. It also instantiates new receivers
         for incoming connections.
 
@@ -33,35 +35,45 @@ class GossipServer(multiprocessing.Process):
         :param tcp_port: TCP port which is used to listen for new connections
         :param to_controller_queue: Newly instantiated receivers need to know a queue to communicate with the controller
         :param connection_pool: New connections will be added to the appropriate connection pool
+        :param receiver_pool: (optional) New connections are handed to this receiver pool, without a pool a new receiver
+                              is started per connection
         """
-        multiprocessing.Process.__init__(self)
+        GossipWorker.__init__(self, server_label)
         self.server_label = server_label
         self.client_receiver_label = client_receiver_label
         self.bind_address = bind_address
         self.tcp_port = tcp_port
         self.to_controller_queue = to_controller_queue
         self.connection_pool = connection_pool
+        self.receiver_pool = receiver_pool
 
     def run(self):
         """ Typical run method for the sender process. It waits for new connections, refers to newly instantiated
         receiver instances, and finally starts the new receivers. """
         try:
             logging.info('%s started (%s:%d) - PID: %s' % (self.server_label, self.bind_address, self.tcp_port,
-                                                           self.pid))
+                                                           os.getpid()))
             server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             server_socket.bind((self.bind_address, self.tcp_port))
             server_socket.listen(5)
-            while True:
-                client_socket, address = server_socket.accept()
+            server_socket.settimeout(WORKER_POLL_INTERVAL)
+            while not self.stopped():
+                try:
+                    client_socket, address = server_socket.accept()
+                except socket.timeout:
+                    continue
                 tcp_address, tcp_port = address
-                connection_identifier = '%s:%d' % (tcp_address, tcp_port)
+                connection_identifier = GossipPeerAddress.from_host_port(tcp_address, tcp_port)
                 self.connection_pool.add_connection(connection_identifier, client_socket)
                 logging.info("%s | Added new connection to connection pool" % self.server_label)
-                client_receiver = GossipClientReceiver(self.client_receiver_label, client_socket, tcp_address, tcp_port,
-                                                       self.to_controller_queue, self.connection_pool)
-                client_receiver.start()
+                if self.receiver_pool:
+                    self.receiver_pool.add_connection(connection_identifier, client_socket)
+                else:
+                    client_receiver = GossipClientReceiver(self.client_receiver_label, client_socket, tcp_address,
+                                                           tcp_port, self.to_controller_queue, self.connection_pool)
+                    self.runtime.start(client_receiver)
             server_socket.close()
         except OSError as os_error:
             logging.error('%s crashed (%s:%d) - PID: %s - %s' % (self.server_label, self.bind_address, self.tcp_port,
-                                                                 self.pid, os_error))
+                                                                 os.getpid(), os_error))
@@ -0,0 +1,84 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3
+
+from gossip.util.peer_address import GossipPeerAddress
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Seconds between two snapshots of the connected peers into the address book """
+ADDRESS_BOOK_INTERVAL = 10.0
+
+""" Peers which have not been connected for this amount of seconds are forgotten """
+ADDRESS_BOOK_MAX_AGE = 7 * 24 * 3600.0
+
+""" Seconds to wait for connections to former peers after a restart until the bootstrappers are contacted """
+REJOIN_TIMEOUT = 2.0
+
+
+class GossipAddressBook:
+    """ Persists the server identifiers of peers we have been connected to in a SQLite database, so that a restarted
+    instance can rejoin via its former peers instead of loading the bootstrapper. Besides the time a peer has been
+    seen last, the book counts the snapshots which contained the peer, so long-lived peers are preferred. Times are
+    wall-clock times and server identifiers are kept in their text form, since the book outlives the process. This is
+    local state of one controller, so it is not thread-safe. """
+
+    def __init__(self, path, max_age=ADDRESS_BOOK_MAX_AGE):
+        """ Constructor.
+
+        :param path: Path of the SQLite database file, which is created if it does not exist
+        :param max_age: (optional) Seconds after which a peer which has not been seen anymore is forgotten
+        """
+        self.max_age = max_age
+        self._db = sqlite3.connect(path)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS peers (server_identifier TEXT PRIMARY KEY, '
+                             'last_seen REAL NOT NULL, seen INTEGER NOT NULL)')
+
+    def record(self, server_identifiers, now):
+        """ Takes a snapshot of the connected peers and forgets the peers which are too old.
+
+        :param server_identifiers: Server identifiers of the connected peers
+        :param now: The current wall-clock time in seconds
+        """
+        with self._db:
+            self._db.executemany('INSERT INTO peers VALUES (?, ?, 1) ON CONFLICT (server_identifier) DO UPDATE '
+                                 'SET last_seen = excluded.last_seen, seen = seen + 1',
+                                 [(str(server_identifier), now) for server_identifier in set(server_identifiers)])
+            self._db.execute('DELETE FROM peers WHERE last_seen < ?', (now - self.max_age,))
+
+    def get_healthy_peers(self, amount, now):
+        """ Provides the peers which have been seen most often, more recently seen peers first among equals.
+
+        :param amount: Max. amount of server identifiers
+        :param now: The current wall-clock time in seconds
+        :returns: List of server identifiers, entries which cannot be parsed are skipped
+        """
+        rows = self._db.execute('SELECT server_identifier FROM peers WHERE last_seen >= ? '
+                                'ORDER BY seen DESC, last_seen DESC LIMIT ?', (now - self.max_age, amount))
+        server_identifiers = []
+        for row in rows:
+            try:
+                server_identifiers.append(GossipPeerAddress.from_string(row[0]))
+            except ValueError:
+                continue
+        return server_identifiers
+
+    def close(self):
+        """ Closes the database. """
+        self._db.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM peers').fetchone()[0]
@@ -12,20 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import multiprocessing
 import logging
+import os
+import time
+from queue import Empty
 
 from gossip.control import convert
+from gossip.control.broadcast import GossipDigestBatches, BROADCAST_MODE_FANOUT, BROADCAST_MODE_TREE, \
+    BROADCAST_MODE_PULL
+from gossip.util.channel import put_many
+from gossip.util.message import MessageGossipIHave
 from gossip.util.message_code import MESSAGE_CODE_ANNOUNCE, MESSAGE_CODE_NOTIFY, MESSAGE_CODE_VALIDATION
+from gossip.util.packing import pack_gossip_ihave
 from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_SEND_MESSAGE, QUEUE_ITEM_TYPE_CONNECTION_LOST, \
     QUEUE_ITEM_TYPE_RECEIVED_MESSAGE
+from gossip.util.runtime import GossipWorker, WORKER_POLL_INTERVAL
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
 
-class APIController(multiprocessing.Process):
+class APIController(GossipWorker):
     def __init__(self, from_api_queue, to_api_queue, to_p2p_queue, api_connection_pool, p2p_connection_pool,
-                 announce_message_cache, api_registration_handler):
+                 announce_message_cache, api_registration_handler, fanout=0, forward_budget=0,
+                 broadcast=BROADCAST_MODE_FANOUT):
         """ This controller is responsible for all incoming messages from the API layer. If an API client sends any
         message, this controller handles it in various ways.
 
@@ -36,8 +45,12 @@ class APIController(multiprocessing.Process):
         :param p2p_connection_pool: Pool which contains all P2P connections/clients/sockets
         :param announce_message_cache: Message cache which contains announce messages.
         :param api_registration_handler: Used for registrations (via NOTIFY message) from API clients
+        :param fanout: (optional) Amount of random peers an announce is spread to, 0 spreads it to all peers
+        :param forward_budget: (optional) Max. amount of forwards per announce, 0 for an unlimited budget
+        :param broadcast: (optional) BROADCAST_MODE_FANOUT, BROADCAST_MODE_TREE or BROADCAST_MODE_PULL (fanout is not
+                          used for trees)
         """
-        multiprocessing.Process.__init__(self)
+        GossipWorker.__init__(self, type(self).__name__)
         self.from_api_queue = from_api_queue
         self.to_api_queue = to_api_queue
         self.to_p2p_queue = to_p2p_queue
@@ -45,13 +58,23 @@ class APIController(multiprocessing.Process):
         self.p2p_connection_pool = p2p_connection_pool
         self.announce_message_cache = announce_message_cache
         self.api_registration_handler = api_registration_handler
+        self.fanout = fanout
+        self.forward_budget = forward_budget
+        self.broadcast = broadcast
+        self.ihave_batches = GossipDigestBatches()
 
     def run(self):
         """ Typical run method which is used to handle API messages and commands. It reacts on incoming messages with
         changing the state of Gossip internally or by sending new messages resp. establishing new connections. """
-        logging.info('%s started - PID: %s' % (type(self).__name__, self.pid))
-        while True:
-            queue_item = self.from_api_queue.get()
+        logging.info('%s started - PID: %s' % (self.worker_label, os.getpid()))
+        while not self.stopped():
+            self.send_ihave_batches()
+            try:
+                # Pending digests must not wait longer than one batch interval
+                queue_item = self.from_api_queue.get(
+                    timeout=self.ihave_batches.interval if len(self.ihave_batches) else WORKER_POLL_INTERVAL)
+            except Empty:
+                continue
             queue_item_type = queue_item['type']
             message = queue_item['message']
             senders_identifier = queue_item['identifier']
@@ -72,16 +95,14 @@ class APIController(multiprocessing.Process):
                         # Communication with API clients works with notification messages only. Therefore we have to
                         # convert the announce message.
                         notification_msg = convert.from_announce_to_notification(msg_id, message)
-                        for receiver in self.api_registration_handler.get_registrations(message.data_type):
-                            if receiver != senders_identifier:
-                                self.to_api_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver,
-                                                       'message': notification_msg})
+                        put_many(self.to_api_queue, [
+                            {'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver, 'message': notification_msg}
+                            for receiver in self.api_registration_handler.get_registrations(message.data_type)
+                            if receiver != senders_identifier])
 
-                        # Spread message via P2P layer (all peers!)
+                        # Spread message via P2P layer
                         logging.info('APIController | Spread message (id: %d) through P2P layer' % msg_id)
-                        for receiver in self.p2p_connection_pool.get_identifiers():
-                            self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver,
-                                                   'message': message})
+                        self.spread_message_to_p2p(msg_id, message)
                     else:
                         logging.info('APIController | Discard message (already known).')
 
@@ -112,12 +133,10 @@ class APIController(multiprocessing.Process):
                             # Spread message if it's still present in the cache
                             message_to_spread = self.announce_message_cache.get_message(msg_id)
                             if message_to_spread:
-                                # Spread message over P2P layer
+                                # Spread message over P2P layer, but not to the peers which have it already
                                 logging.info('APIController | Spread message (id: %d) through P2P layer' % msg_id)
-                                # TODO: Don't send the message to the original sender! Exclude his identifier!
-                                for identifier in self.p2p_connection_pool.get_identifiers():
-                                    self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE,
-                                                           'identifier': identifier, 'message': message_to_spread})
+                                self.spread_message_to_p2p(msg_id, message_to_spread,
+                                                           self.announce_message_cache.get_known_by(msg_id))
                             else:
                                 logging.debug('APIController | Message (id: %d) not in cache anymore.'
                                               ' Spreading impossible' % msg_id)
@@ -144,6 +163,49 @@ class APIController(multiprocessing.Process):
             if server_address != server_to_exclude:
                 yield server_address
 
+    def spread_message_to_p2p(self, msg_id, message, identifiers_to_exclude=None):
+        """ Spreads an announce through the P2P layer. In fanout mode the announce is pushed to a random subset of the
+        P2P connections, in tree mode it is pushed over all eager links and advertised over all lazy links. In pull
+        mode it is only advertised to a random subset of the P2P connections, which request it if they miss it. The
+        amount of pushes resp. advertisements is limited by the left forwarding budget of the message. Peers which
+        get the announce are remembered as holders of the message, so it is never pushed to them again.
+
+        :param msg_id: The id of the message in the announce message cache
+        :param message: The announce message to spread
+        :param identifiers_to_exclude: (optional) P2P identifiers which must not receive the message
+        """
+        now = time.monotonic()
+        if self.broadcast == BROADCAST_MODE_TREE:
+            receivers = self.p2p_connection_pool.get_link_identifiers(True,
+                                                                      identifiers_to_exclude=identifiers_to_exclude)
+            for receiver in self.p2p_connection_pool.get_link_identifiers(
+                    False, identifiers_to_exclude=identifiers_to_exclude):
+                self.ihave_batches.add(receiver, message.get_digest(), now)
+        elif self.broadcast == BROADCAST_MODE_PULL:
+            receivers = self.p2p_connection_pool.get_random_identifiers(self.fanout,
+                                                                        identifiers_to_exclude=identifiers_to_exclude)
+            forwards = self.announce_message_cache.reserve_forwards(msg_id, len(receivers), self.forward_budget)
+            logging.debug('APIController | Advertising message (id: %d) to %d of %d peers'
+                          % (msg_id, forwards, len(receivers)))
+            for receiver in receivers[:forwards]:
+                self.ihave_batches.add(receiver, message.get_digest(), now)
+            return
+        else:
+            receivers = self.p2p_connection_pool.get_random_identifiers(self.fanout,
+                                                                        identifiers_to_exclude=identifiers_to_exclude)
+        forwards = self.announce_message_cache.reserve_forwards(msg_id, len(receivers), self.forward_budget)
+        logging.debug('APIController | Spreading message (id: %d) to %d of %d peers'
+                      % (msg_id, forwards, len(receivers)))
+        self.announce_message_cache.add_known_by(msg_id, receivers[:forwards])
+        put_many(self.to_p2p_queue, [{'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver, 'message': message}
+                                     for receiver in receivers[:forwards]])
+
+    def send_ihave_batches(self):
+        """ Sends the advertised digests which waited long enough for other digests to the same peer. """
+        put_many(self.to_p2p_queue, [{'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver,
+                                      'message': MessageGossipIHave(pack_gossip_ihave(digests)['data'])}
+                                     for receiver, digests in self.ihave_batches.pop_due(time.monotonic()).items()])
+
     def spread_message_to_api(self, notification_msg, senders_identifier):
         """ Spreads a message to all API clients which are registered for the containing message type.
 
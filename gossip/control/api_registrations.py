@@ -20,9 +20,12 @@ __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 class APIRegistrationHandler:
     """Thread-safe implementation of an handler for API registrations."""
 
-    def __init__(self):
-        """ Contructor. """
-        self._api_registrations = Manager().dict()
+    def __init__(self, shared=True):
+        """ Contructor.
+
+        :param shared: (optional) If False, the registrations can only be used by threads of the current process
+        """
+        self._api_registrations = Manager().dict() if shared else {}
 
     def register(self, code, identifier):
         """ Registers an identifier for a specified code.
@@ -34,16 +37,16 @@ class APIRegistrationHandler:
             self._api_registrations[code] = []
 
         if identifier not in self._api_registrations[code]:
-            self._api_registrations[code] += [identifier]
+            self._api_registrations[code] = self._api_registrations[code] + [identifier]
 
     def unregister(self, identifier):
         """Removes a api from registrations
 
         :param identifier which should be removed from the registrations"""
-        for code, registrations in self._api_registrations.items():
+        for code, registrations in list(self._api_registrations.items()):
             if identifier in registrations:
-                registrations.remove(identifier)
-                self._api_registrations[code] = registrations
+                self._api_registrations[code] = [registration for registration in registrations
+                                                 if registration != identifier]
 
     def get_registrations(self, code):
         """ Provides all identifiers who registered for a specified code.
@@ -0,0 +1,162 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+from multiprocessing import Manager, Lock
+
+from gossip.util.packing import MAX_DIGESTS
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Announces are pushed to a random subset of all peers """
+BROADCAST_MODE_FANOUT = 'fanout'
+""" Announces are pushed over the eager links of a broadcast tree, the lazy links only carry their digests """
+BROADCAST_MODE_TREE = 'tree'
+""" Only the digests of announces are pushed to a random subset of all peers, which pull the announces they miss """
+BROADCAST_MODE_PULL = 'pull'
+
+BROADCAST_MODES = [BROADCAST_MODE_FANOUT, BROADCAST_MODE_TREE, BROADCAST_MODE_PULL]
+
+""" Max. amount of seconds a digest waits for other digests to the same peer before they are sent in one IHAVE """
+IHAVE_BATCH_INTERVAL = 0.05
+
+
+class GossipMissingMessages:
+    """ Keeps track of messages which have been advertised by other peers (IHAVE) but have not been received until
+    now. If a message is still missing after a timeout, it has to be requested from one of the advertising peers.
+    Several P2P controller shards have to share one table: an IHAVE is routed by the connection it arrived on, the
+    announce it advertises by its digest, so both may be handled by different shards. """
+
+    def __init__(self, timeout, shared=False):
+        """ Constructor.
+
+        :param timeout: Seconds to wait for a message after it has been advertised the first time
+        :param shared: (optional) If True, the table can be used by several processes
+        """
+        self.timeout = timeout
+        if shared:
+            self._missing = Manager().dict()
+            self._missing_lock = Lock()
+        else:
+            self._missing = {}
+            self._missing_lock = threading.Lock()
+
+    def add(self, digest, identifier, now, requested=False):
+        """ Remembers that a peer has advertised a message.
+
+        :param digest: The digest of the advertised message
+        :param identifier: The identifier of the advertising peer
+        :param now: The current time in seconds
+        :param requested: (optional) True if the message has already been requested from this peer
+        :returns: True if the message has not been advertised before
+        """
+        self._missing_lock.acquire()
+        try:
+            missing = self._missing.get(digest)
+            if missing is not None:
+                if identifier not in missing['identifiers'] and identifier not in missing['requested']:
+                    missing['identifiers'].append(identifier)
+                    # Shared tables hand out copies, so the entry has to be written back
+                    self._missing[digest] = missing
+                return False
+            if requested:
+                self._missing[digest] = {'identifiers': [], 'requested': [identifier], 'deadline': now + self.timeout}
+            else:
+                self._missing[digest] = {'identifiers': [identifier], 'requested': [], 'deadline': now + self.timeout}
+            return True
+        finally:
+            self._missing_lock.release()
+
+    def remove(self, digest):
+        """ Forgets a message, e.g. because it has been received.
+
+        :param digest: The digest of the message
+        """
+        self._missing_lock.acquire()
+        try:
+            self._missing.pop(digest, None)
+        finally:
+            self._missing_lock.release()
+
+    def expire(self, now):
+        """ Collects all messages which are overdue. Every overdue message is assigned to the peer which advertised it
+        first. If other peers advertised it as well, they are asked next after another timeout.
+
+        :param now: The current time in seconds
+        :returns: A dict in the form {<identifier>: [<digest>, ...]}
+        """
+        overdue = {}
+        self._missing_lock.acquire()
+        try:
+            for digest, missing in list(self._missing.items()):
+                if missing['deadline'] <= now:
+                    if missing['identifiers']:
+                        identifier = missing['identifiers'].pop(0)
+                        missing['requested'].append(identifier)
+                        overdue.setdefault(identifier, []).append(digest)
+                    if missing['identifiers']:
+                        missing['deadline'] = now + self.timeout
+                        self._missing[digest] = missing
+                    else:
+                        del self._missing[digest]
+        finally:
+            self._missing_lock.release()
+        return overdue
+
+    def __len__(self):
+        return len(self._missing)
+
+
+class GossipDigestBatches:
+    """ Collects the digests which have to be advertised to other peers, so that many digests share one IHAVE. This is
+    local state of one controller, so it is not thread-safe. """
+
+    def __init__(self, interval=IHAVE_BATCH_INTERVAL, max_digests=MAX_DIGESTS):
+        """ Constructor.
+
+        :param interval: (optional) Max. amount of seconds a digest waits for other digests
+        :param max_digests: (optional) Max. amount of digests per batch
+        """
+        self.interval = interval
+        self.max_digests = max_digests
+        self._batches = {}
+
+    def add(self, identifier, digest, now):
+        """ Adds a digest to the batch of a peer.
+
+        :param identifier: The identifier of the peer which gets the digest
+        :param digest: The digest to advertise
+        :param now: The current time in seconds
+        """
+        batch = self._batches.setdefault(identifier, {'digests': [], 'created': now})
+        if digest not in batch['digests']:
+            batch['digests'].append(digest)
+
+    def pop_due(self, now):
+        """ Removes and provides all batches which waited long enough or which are full.
+
+        :param now: The current time in seconds
+        :returns: A dict in the form {<identifier>: [<digest>, ...]}
+        """
+        due = {}
+        for identifier, batch in list(self._batches.items()):
+            if batch['created'] + self.interval <= now or len(batch['digests']) >= self.max_digests:
+                due[identifier] = batch['digests'][:self.max_digests]
+                if len(batch['digests']) > self.max_digests:
+                    batch['digests'] = batch['digests'][self.max_digests:]
+                else:
+                    del self._batches[identifier]
+        return due
+
+    def __len__(self):
+        return len(self._batches)
@@ -0,0 +1,158 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from multiprocessing import Manager, Lock
+
+from gossip.util.packing import MAX_PEER_DELTA_ENTRIES
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Min. amount of seconds between two peer deltas to the same peer, membership events are collected meanwhile """
+PEER_DELTA_INTERVAL = 0.5
+
+""" Versions are two bytes large and compared by means of serial number arithmetic, so they may wrap around """
+VERSION_MODULO = 0x10000
+
+
+def is_newer_version(version, known_version):
+    """ Checks whether a version is newer than another one, taking a wrap around into account.
+
+    :param version: The version to check
+    :param known_version: The version to compare with
+    :returns: True if version is newer than known_version
+    """
+    return 0 < (version - known_version) % VERSION_MODULO < VERSION_MODULO // 2
+
+
+class GossipMembershipVersions:
+    """ Keeps the latest known version of the membership events per address. The P2P controller shards route peer
+    deltas by the connection they arrived on, so the shards have to share one table: otherwise the same event arriving
+    via connections of different shards would be accepted and spread once per shard. """
+
+    def __init__(self, shared=True):
+        """ Constructor.
+
+        :param shared: (optional) If False, the table can only be used by threads of the current process
+        """
+        if shared:
+            self._versions = Manager().dict()
+            self._versions_lock = Lock()
+        else:
+            self._versions = {}
+            self._versions_lock = threading.Lock()
+
+    def next_version(self, address):
+        """ Increments the version of an address.
+
+        :param address: The server identifier of the affected peer
+        :returns: The new version
+        """
+        self._versions_lock.acquire()
+        version = (self._versions.get(address, 0) + 1) % VERSION_MODULO
+        self._versions[address] = version
+        self._versions_lock.release()
+        return version
+
+    def accept(self, address, version):
+        """ Stores the version of an address if it is newer than the known one.
+
+        :param address: The server identifier of the affected peer
+        :param version: The version of the event
+        :returns: True if the version is new
+        """
+        self._versions_lock.acquire()
+        known_version = self._versions.get(address)
+        accepted = known_version is None or is_newer_version(version, known_version)
+        if accepted:
+            self._versions[address] = version
+        self._versions_lock.release()
+        return accepted
+
+
+class GossipMembershipDeltas:
+    """ Keeps track of membership events (peer found/lost) and collects them per peer, so that all events of a short
+    period are sent in one peer delta. Every event has a version per address: an event is only spread if its version is
+    newer than the known one, so the same event reported by several peers is spread only once. The pending peer deltas
+    are local state of one controller, so they are not thread-safe, the versions may be shared between controllers. """
+
+    def __init__(self, interval=PEER_DELTA_INTERVAL, max_entries=MAX_PEER_DELTA_ENTRIES, versions=None):
+        """ Constructor.
+
+        :param interval: (optional) Min. amount of seconds between two peer deltas to the same peer
+        :param max_entries: (optional) Max. amount of entries per peer delta
+        :param versions: (optional) The GossipMembershipVersions shared with other controllers, by default the
+                         versions are local
+        """
+        self.interval = interval
+        self.max_entries = max_entries
+        self._versions = versions if versions is not None else GossipMembershipVersions(shared=False)
+        self._batches = {}
+        self._last_sent = {}
+
+    def record(self, address, update_type, ttl):
+        """ Records an event we observed ourselves. It gets the next version of the address.
+
+        :param address: The server identifier of the affected peer
+        :param update_type: PEER_UPDATE_TYPE_PEER_FOUND or PEER_UPDATE_TYPE_PEER_LOST
+        :param ttl: The ttl of the event
+        :returns: The entry of the event in the form {'address', 'update_type', 'ttl', 'version'}
+        """
+        return {'address': address, 'update_type': update_type, 'ttl': ttl,
+                'version': self._versions.next_version(address)}
+
+    def accept(self, entry):
+        """ Accepts an event of another peer if its version is newer than the known one.
+
+        :param entry: The entry of the event, see record
+        :returns: True if the event is new
+        """
+        return self._versions.accept(entry['address'], entry['version'])
+
+    def add(self, identifier, entry):
+        """ Adds an event to the next peer delta to a peer. A pending event about the same address is replaced.
+
+        :param identifier: The identifier of the peer which gets the event
+        :param entry: The entry of the event, see record
+        """
+        self._batches.setdefault(identifier, {})[entry['address']] = entry
+
+    def remove_peer(self, identifier):
+        """ Forgets the pending events of a peer, e.g. because its connection has been lost.
+
+        :param identifier: The identifier of the peer
+        """
+        self._batches.pop(identifier, None)
+        self._last_sent.pop(identifier, None)
+
+    def pop_due(self, now):
+        """ Removes and provides the pending events of all peers which did not get a peer delta within the interval.
+
+        :param now: The current time in seconds
+        :returns: A dict in the form {<identifier>: [<entry>, ...]}
+        """
+        due = {}
+        for identifier, batch in list(self._batches.items()):
+            if self._last_sent.get(identifier, now - self.interval) + self.interval <= now:
+                entries = list(batch.values())
+                due[identifier] = entries[:self.max_entries]
+                for entry in due[identifier]:
+                    del batch[entry['address']]
+                if not batch:
+                    del self._batches[identifier]
+                self._last_sent[identifier] = now
+        return due
+
+    def __len__(self):
+        return len(self._batches)
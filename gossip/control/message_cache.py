@@ -13,7 +13,8 @@
 # limitations under the License.
 
 import logging
-from multiprocessing import Manager
+import threading
+from multiprocessing import Manager, Lock
 from random import randrange
 
 from datetime import datetime
@@ -27,35 +28,56 @@ class GossipMessageCache:
     DATE_ADDED = 'DateAdded'
     MAX_MSG_ID = 65535
 
-    def __init__(self, message_cache_label, cache_size=30):
+    def __init__(self, message_cache_label, cache_size=30, shared=True, shard_index=0, shard_count=1):
         """Contructor.
 
         :param cache_size: The maximum numbers of messages that can be hold by this cache: Default 30
+        :param shared: (optional) If False, the cache can only be used by threads of the current process
+        :param shard_index: (optional) If the cache is one of several shards, all generated message ids are congruent
+                            to shard_index modulo shard_count
+        :param shard_count: (optional) The total amount of shards
         """
-        self._msg_cache = Manager().dict()
+        if shared:
+            manager = Manager()
+            self._msg_cache = manager.dict()
+            self._digests = manager.dict()
+            self._cache_lock = Lock()
+        else:
+            self._msg_cache = {}
+            self._digests = {}
+            self._cache_lock = threading.Lock()
         self._message_cache_label = message_cache_label
         self._cache_size = cache_size
+        self._shard_index = shard_index
+        self._shard_count = shard_count
 
-    def add_message(self, message, valid=False):
+    def add_message(self, message, valid=False, origin=None):
         """ Adds new message to the cache.
 
         :param message: The new message to cache
         :param valid: (optional) Flag which states whether this message is valid or not
+        :param origin: (optional) Identifier of the connection we received the message from, it is the first peer
+                       which is known to have the message
         :returns: The generated random message identifier for the cached message (None if message is already in cache)
         """
-        # If the message exists already in the cache, return None
-        for msg_id in self._msg_cache.keys():
-            if message == self._msg_cache[msg_id]['message']:
+        digest = message.get_digest()
+        self._cache_lock.acquire()
+        try:
+            # If the message exists already in the cache, return None
+            if digest in self._digests:
                 return None
 
-        # Generate a message id which isn't in the cache already
-        msg_id = randrange(0, self.MAX_MSG_ID)
-        while msg_id in self._msg_cache.keys():
-            msg_id = randrange(0, self.MAX_MSG_ID)
-        self._msg_cache[msg_id] = {'message': message, 'valid': valid,
-                                   GossipMessageCache.DATE_ADDED: datetime.now()}
-
-        self.__maintain_cache()
+            # Generate a message id which isn't in the cache already
+            msg_id = randrange(self._shard_index, self.MAX_MSG_ID, self._shard_count)
+            while msg_id in self._msg_cache:
+                msg_id = randrange(self._shard_index, self.MAX_MSG_ID, self._shard_count)
+            self._msg_cache[msg_id] = {'message': message, 'valid': valid, 'known_by': [origin] if origin else [],
+                                       'forwards': 0, GossipMessageCache.DATE_ADDED: datetime.now()}
+            self._digests[digest] = msg_id
+
+            self.__maintain_cache()
+        finally:
+            self._cache_lock.release()
         logging.debug('%s | Added new message, current message cache: %s' % (self._message_cache_label,
                                                                              self._msg_cache.keys()))
         return msg_id
@@ -94,22 +116,94 @@ class GossipMessageCache:
             old_cache_item['valid'] = valid
             self._msg_cache[msg_id] = old_cache_item
 
+    def find_digest(self, digest):
+        """ Looks up a message by its digest.
+
+        :param digest: The digest of the desired message (see MessageGossip.get_digest)
+        :returns: The message identifier (None if no cached message has this digest)
+        """
+        return self._digests.get(digest)
+
+    def get_known_by(self, msg_id):
+        """ Provides the identifiers of all connections which are known to have a message, because they sent it resp.
+        advertised it to us or because we sent it to them.
+
+        :param msg_id: Identifier of the message
+        :returns: List of identifiers (empty if the message does not exist)
+        """
+        if msg_id in self._msg_cache:
+            return self._msg_cache[msg_id]['known_by']
+        else:
+            return []
+
+    def add_known_by(self, msg_id, identifiers):
+        """ Remembers that connections have a message.
+
+        :param msg_id: Identifier of the message
+        :param identifiers: Identifiers of the connections which have the message
+        """
+        self._cache_lock.acquire()
+        try:
+            cache_item = self._msg_cache.get(msg_id)
+            if cache_item is not None:
+                cache_item['known_by'] = cache_item['known_by'] + [identifier for identifier in identifiers
+                                                                   if identifier not in cache_item['known_by']]
+                self._msg_cache[msg_id] = cache_item
+        finally:
+            self._cache_lock.release()
+
+    def reserve_forwards(self, msg_id, amount, forward_budget):
+        """ Reserves forwards of a message within its forwarding budget.
+
+        :param msg_id: Identifier of the message
+        :param amount: The amount of forwards which are wanted
+        :param forward_budget: Max. amount of forwards per message, 0 for an unlimited budget
+        :returns: The amount of forwards which may be done (0 if the message does not exist)
+        """
+        self._cache_lock.acquire()
+        try:
+            cache_item = self._msg_cache.get(msg_id)
+            if cache_item is None:
+                return 0
+            if forward_budget > 0:
+                amount = max(0, min(amount, forward_budget - cache_item['forwards']))
+            cache_item['forwards'] += amount
+            self._msg_cache[msg_id] = cache_item
+            return amount
+        finally:
+            self._cache_lock.release()
+
     def remove_message(self, msg_id):
         """ Removes a message from the cache.
 
         :param msg_id: Identifier of the message
         :returns: Removed message (None if it does not exist)
         """
-        return self._msg_cache.pop(msg_id, None)
+        self._cache_lock.acquire()
+        try:
+            return self.__remove_message(msg_id)
+        finally:
+            self._cache_lock.release()
+
+    def __remove_message(self, msg_id):
+        """ Removes a message and its digest from the cache, the caller holds the cache lock.
+
+        :param msg_id: Identifier of the message
+        :returns: Removed message (None if it does not exist)
+        """
+        cache_item = self._msg_cache.pop(msg_id, None)
+        if cache_item is not None:
+            self._digests.pop(cache_item['message'].get_digest(), None)
+        return cache_item
 
     def __maintain_cache(self):
         """ Maintains the message cache. If the cache exceeds the defined maximum the oldest message is removed from the
-        cache """
+        cache, the caller holds the cache lock """
         if len(self._msg_cache) > self._cache_size:
             sorted_messages = sorted(self._msg_cache.items(),
-                                     key=lambda x: self._msg_cache[x[0]][GossipMessageCache.DATE_ADDED])
+                                     key=lambda x: x[1][GossipMessageCache.DATE_ADDED])
             message_to_remove = sorted_messages[0][0]
-            self.remove_message(message_to_remove)
+            self.__remove_message(message_to_remove)
 
     def iterator(self, exclude_id=True):
         """ Creates a generator for the message cache. Removes the outer dict with id and only returns message ordered
@@ -118,5 +212,5 @@ class GossipMessageCache:
         :return: An iterator over the ordered list of messages
         """
         sorted_messages = sorted(self._msg_cache.items(),
-                                 key=lambda x: self._msg_cache[x[0]][GossipMessageCache.DATE_ADDED])
+                                 key=lambda x: x[1][GossipMessageCache.DATE_ADDED])
         return (message[1] if exclude_id else message for message in sorted_messages)
@@ -12,26 +12,59 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import multiprocessing
 import logging
+import os
+import random
+import sqlite3
+import time
+from queue import Empty
+from socket import SHUT_RDWR
 
 from gossip.control import convert
+from gossip.control.address_book import GossipAddressBook, ADDRESS_BOOK_INTERVAL, REJOIN_TIMEOUT
+from gossip.control.broadcast import GossipMissingMessages, BROADCAST_MODE_FANOUT, BROADCAST_MODE_TREE, \
+    BROADCAST_MODE_PULL
+from gossip.control.membership import GossipMembershipDeltas, PEER_DELTA_INTERVAL
+from gossip.util.bloom_filter import create_bloom_filter
+from gossip.util.channel import put_many
+from gossip.util.exceptions import GossipIdentifierNotFound
 from gossip.util.message import MessageGossipPeerResponse, MessageGossipPeerRequest, MessageGossipPeerInit, \
-    MessageGossipPeerUpdate, MessageGossipAnnounce
+    MessageGossipPeerDelta, MessageGossipAnnounce, MessageGossipTreeUpdate, MessageGossipIWant, MessageGossipIHave, \
+    MessageGossipSummary, MessageGossipPing, DIGEST_SIZE
 from gossip.util.packing import pack_gossip_peer_response, pack_gossip_peer_request, pack_gossip_peer_init, \
-    pack_gossip_peer_update, pack_gossip_announce, PEER_UPDATE_TYPE_PEER_LOST, PEER_UPDATE_TYPE_PEER_FOUND
+    pack_gossip_peer_delta, pack_gossip_announce, pack_gossip_tree_update, pack_gossip_iwant, pack_gossip_ihave, \
+    PEER_UPDATE_TYPE_PEER_LOST, PEER_UPDATE_TYPE_PEER_FOUND, TREE_UPDATE_TYPE_PRUNE, TREE_UPDATE_TYPE_GRAFT, \
+    MAX_DIGESTS, MAX_SUMMARY_SIZE, pack_gossip_summary, IHAVE_TYPE_ANNOUNCE, IHAVE_TYPE_ANTI_ENTROPY, \
+    IHAVE_TYPE_REPAIR, MAX_PEER_REQUEST_PAGE, MAX_PEER_RESPONSE_SIZE, MAX_RANDOM_WALK_LENGTH, pack_gossip_ping, \
+    PING_TYPE_PING, PING_TYPE_PONG
 from gossip.util.message_code import MESSAGE_CODE_ANNOUNCE, MESSAGE_CODE_PEER_REQUEST, MESSAGE_CODE_PEER_RESPONSE, \
-    MESSAGE_CODE_PEER_UPDATE, MESSAGE_CODE_PEER_INIT
+    MESSAGE_CODE_PEER_UPDATE, MESSAGE_CODE_PEER_INIT, MESSAGE_CODE_IHAVE, MESSAGE_CODE_TREE_UPDATE, \
+    MESSAGE_CODE_IWANT, MESSAGE_CODE_SUMMARY, MESSAGE_CODE_PEER_DELTA, MESSAGE_CODE_PING
+from gossip.util.peer_address import GossipPeerAddress
 from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_SEND_MESSAGE, QUEUE_ITEM_TYPE_CONNECTION_LOST, \
     QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, QUEUE_ITEM_TYPE_NEW_CONNECTION
+from gossip.util.runtime import GossipWorker, WORKER_POLL_INTERVAL
+from gossip.util.timer_wheel import GossipTimerWheel
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
+""" Amount of connected peers and of peers of the passive view which are sent with a shuffle """
+SHUFFLE_ACTIVE_SAMPLE_SIZE = 3
+SHUFFLE_PASSIVE_SAMPLE_SIZE = 4
 
-class P2PController(multiprocessing.Process):
+""" Every n-th ping round pings all connected peers to keep their RTTs up to date, the other rounds only ping the
+peers which have been idle since the last round """
+RTT_PROBE_ROUNDS = 6
+
+
+class P2PController(GossipWorker):
     def __init__(self, from_p2p_queue, to_p2p_queue, to_api_queue, p2p_connection_pool, p2p_server_address,
                  announce_message_cache, update_message_cache, api_registration_handler, max_ttl,
-                 bootstrapper_address=None):
+                 bootstrapper_addresses=None, forward_budget=0, broadcast=BROADCAST_MODE_FANOUT, graft_timeout=1.0,
+                 passive_view=None, shuffle_interval=0, anti_entropy_interval=0, anti_entropy_budget=4096,
+                 peer_delta_interval=PEER_DELTA_INTERVAL, peer_response_size=16, random_walk_length=0,
+                 address_book_path=None, ping_interval=0, keepalive_timeout=0, membership_versions=None,
+                 missing_messages=None, peer_request_pages=None):
         """ This controller is responsible for all incoming messages from the P2P layer. If a P2P client sends any
         message, this controller handles it in various ways.
 
@@ -41,12 +74,44 @@ class P2PController(multiprocessing.Process):
         :param p2p_connection_pool: Pool which contains all P2P connections/clients/sockets
         :param p2p_server_address: The P2P server address for this gossip instance
         :param announce_message_cache: Message cache which contains announce messages.
-        :param update_message_cache: Message cache for peer update messages
+        :param update_message_cache: Message cache for peer update messages (peers of older versions only)
         :param api_registration_handler: Used for registrations (via NOTIFY message) from API clients
         :param max_ttl: Max. amount of hops until messages will be dropped
-        :param bootstrapper_address: (optional) dict to specify the bootstrapper {'host': <IPv4>: 'port': <int(port)>}
+        :param bootstrapper_addresses: (optional) list of dicts to specify the bootstrappers [{'host': <IPv4>:
+                                       'port': <int(port)>}, ...], the fastest one is used
+        :param forward_budget: (optional) Max. amount of forwards per announce, 0 for an unlimited budget
+        :param broadcast: (optional) BROADCAST_MODE_FANOUT, BROADCAST_MODE_TREE or BROADCAST_MODE_PULL
+        :param graft_timeout: (optional) Seconds to wait for an advertised announce until it is requested (tree) resp.
+                              until it is requested from the next advertising peer (pull)
+        :param passive_view: (optional) GossipPassiveView with known but unconnected peers, which replace lost
+                             connections
+        :param shuffle_interval: (optional) Seconds between two shuffles of the passive view with a random peer, 0
+                                 disables shuffling
+        :param anti_entropy_interval: (optional) Seconds between two anti-entropy rounds with a random peer, 0 disables
+                                      anti-entropy
+        :param anti_entropy_budget: (optional) Max. amount of digest bytes which are advertised per anti-entropy round
+        :param peer_delta_interval: (optional) Min. amount of seconds between two peer deltas to the same peer
+        :param peer_response_size: (optional) Max. amount of server identifiers per peer response
+        :param random_walk_length: (optional) Amount of hops the initial peer request is forwarded from the bootstrapper
+                                   on, so that the peers are sampled from the whole network, 0 lets the bootstrapper
+                                   answer itself
+        :param address_book_path: (optional) Path of the address book, which persists the connected peers, so that
+                                  they are contacted first after a restart
+        :param ping_interval: (optional) Seconds between two ping rounds. Every round pings the connected peers which
+                              have been idle since the last round, every RTT_PROBE_ROUNDS-th round pings all of
+                              them. The RTTs are kept in the stats table of the connection pool, which scores its
+                              peers by them. 0 only pings new connections
+        :param keepalive_timeout: (optional) Seconds after which a connection which has not received anything (not
+                                  even a pong) is considered dead and closed, 0 keeps silent connections forever
+        :param membership_versions: (optional) GossipMembershipVersions shared by all P2P controller shards, a single
+                                    controller keeps its versions locally
+        :param missing_messages: (optional) GossipMissingMessages shared by all P2P controller shards, a single
+                                 controller keeps the advertised but missing messages locally
+        :param peer_request_pages: (optional) Dict shared by all P2P controller shards, which maps the connection
+                                   identifiers of pending peer requests to the requested page. The response may be
+                                   handled by another shard than the one which sent the request
         """
-        multiprocessing.Process.__init__(self)
+        GossipWorker.__init__(self, type(self).__name__)
         self.from_p2p_queue = from_p2p_queue
         self.to_p2p_queue = to_p2p_queue
         self.to_api_queue = to_api_queue
@@ -56,22 +121,94 @@ class P2PController(multiprocessing.Process):
         self.update_message_cache = update_message_cache
         self.api_registration_handler = api_registration_handler
         self.max_ttl = max_ttl
-        self.bootstrapper_address = bootstrapper_address
+        self.bootstrapper_addresses = bootstrapper_addresses
+        self.forward_budget = forward_budget
+        self.broadcast = broadcast
+        if missing_messages is None:
+            missing_messages = GossipMissingMessages(graft_timeout)
+        self.missing_messages = missing_messages
+        self.passive_view = passive_view
+        self.shuffle_interval = shuffle_interval
+        self.anti_entropy_interval = anti_entropy_interval
+        self.anti_entropy_budget = anti_entropy_budget
+        self.membership = GossipMembershipDeltas(peer_delta_interval, versions=membership_versions)
+        self.peer_response_size = min(peer_response_size, MAX_PEER_RESPONSE_SIZE)
+        # Every instance samples differently, but the pages for the same requesting peer fit together
+        self.peer_sample_salt = os.urandom(16)
+        self.peer_request_pages = peer_request_pages if peer_request_pages is not None else {}
+        self.random_walk_length = min(random_walk_length, MAX_RANDOM_WALK_LENGTH)
+        self.address_book_path = address_book_path
+        self.address_book = None
+        self.ping_interval = ping_interval
+        self.keepalive_timeout = keepalive_timeout
+        self.keepalive_timers = None
+        self.own_p2p_server_identifier = GossipPeerAddress.from_host_port(self.p2p_server_address['host'],
+                                                                          self.p2p_server_address['port'])
 
     def run(self):
         """ Typical run method which is used to handle P2P messages and commands. It reacts on incoming messages with
         changing the state of Gossip internally or by sending new messages resp. establishing new connections. """
-        logging.info('%s started - PID: %s' % (type(self).__name__, self.pid))
+        logging.info('%s started - PID: %s' % (self.worker_label, os.getpid()))
 
         # Bootstrapping part
-        if self.bootstrapper_address:
-            bootstrapper_identifier = '%s:%d' % (self.bootstrapper_address['host'], self.bootstrapper_address['port'])
-            self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': bootstrapper_identifier})
-            self.send_peer_request(bootstrapper_identifier)
+        # Former peers of the address book are contacted in parallel, the bootstrappers are only needed if none of them
+        # can be reached. The peers which do not fit into the pool are kept in the passive view.
+        rejoin_deadline = None
+        if self.address_book_path:
+            try:
+                self.address_book = GossipAddressBook(self.address_book_path)
+            except sqlite3.Error as e:
+                logging.error('P2PController | Cannot open address book %s: %s' % (self.address_book_path, e))
+        if self.address_book is not None and self.connect_to_peers(
+                self.address_book.get_healthy_peers(2 * self.p2p_connection_pool.get_capacity(), time.time())):
+            rejoin_deadline = time.monotonic() + REJOIN_TIMEOUT
+        else:
+            self.bootstrap()
 
         # Usual controller part
-        while True:
-            queue_item = self.from_p2p_queue.get()
+        if self.keepalive_timeout > 0:
+            self.keepalive_timers = GossipTimerWheel(time.monotonic())
+        next_shuffle = time.monotonic() + self.shuffle_interval
+        next_anti_entropy_round = time.monotonic() + self.anti_entropy_interval
+        next_address_book_snapshot = time.monotonic() + ADDRESS_BOOK_INTERVAL
+        next_ping = time.monotonic() + self.ping_interval
+        ping_round = 0
+        while not self.stopped():
+            if rejoin_deadline is not None and time.monotonic() >= rejoin_deadline:
+                rejoin_deadline = None
+                if not self.p2p_connection_pool.get_identifiers():
+                    logging.info('P2PController | None of the former peers is reachable, contacting bootstrappers')
+                    self.bootstrap()
+            if self.address_book is not None and time.monotonic() >= next_address_book_snapshot:
+                next_address_book_snapshot = time.monotonic() + ADDRESS_BOOK_INTERVAL
+                self.address_book.record(self.p2p_connection_pool.get_server_identifiers(
+                    identifier_to_exclude=[self.own_p2p_server_identifier]), time.time())
+            if len(self.missing_messages):
+                self.request_missing_messages()
+            if self.keepalive_timers is not None:
+                self.check_keepalive_timers()
+            if self.passive_view is not None and self.shuffle_interval > 0 and time.monotonic() >= next_shuffle:
+                next_shuffle = time.monotonic() + self.shuffle_interval
+                self.shuffle_passive_view()
+            if self.ping_interval > 0 and time.monotonic() >= next_ping:
+                ping_round += 1
+                if ping_round % RTT_PROBE_ROUNDS == 0:
+                    identifiers = self.p2p_connection_pool.get_identifiers()
+                else:
+                    identifiers = self.p2p_connection_pool.get_idle_identifiers(next_ping - self.ping_interval)
+                next_ping = time.monotonic() + self.ping_interval
+                for identifier in identifiers:
+                    self.send_ping(identifier)
+            if self.anti_entropy_interval > 0 and time.monotonic() >= next_anti_entropy_round:
+                next_anti_entropy_round = time.monotonic() + self.anti_entropy_interval
+                self.start_anti_entropy_round()
+            self.send_peer_deltas()
+            try:
+                # Pending membership events must not wait much longer than one peer delta interval
+                queue_item = self.from_p2p_queue.get(
+                    timeout=self.membership.interval if len(self.membership) else WORKER_POLL_INTERVAL)
+            except Empty:
+                continue
             queue_item_type = queue_item['type']
             message = queue_item['message']
             senders_identifier = queue_item['identifier']
@@ -84,7 +221,8 @@ class P2PController(multiprocessing.Process):
                                                                                          message))
 
                     # Spread message via API layer (only registered clients) if it's unknown until now
-                    msg_id = self.announce_message_cache.add_message(message)
+                    msg_id = self.announce_message_cache.add_message(message, origin=senders_identifier)
+                    self.missing_messages.remove(message.get_digest())
 
                     if msg_id:
                         logging.info('P2PController | Spread message (id: %d) through API layer' % msg_id)
@@ -100,39 +238,89 @@ class P2PController(multiprocessing.Process):
                             # Communication with API clients works with notification messages only. Therefore we have to
                             # convert the announce message.
                             notification_msg = convert.from_announce_to_notification(msg_id, announce_msg)
-                            for receiver in self.api_registration_handler.get_registrations(message.data_type):
-                                if receiver != senders_identifier:
-                                    self.to_api_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver,
-                                                           'message': notification_msg})
+                            put_many(self.to_api_queue, [
+                                {'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver,
+                                 'message': notification_msg}
+                                for receiver in self.api_registration_handler.get_registrations(message.data_type)
+                                if receiver != senders_identifier])
                     else:
                         logging.info('P2PController | Discard message (already known).')
+                        # The sender has the message, so it never has to be sent to it
+                        known_msg_id = self.announce_message_cache.find_digest(message.get_digest())
+                        if known_msg_id is not None:
+                            self.announce_message_cache.add_known_by(known_msg_id, [senders_identifier])
+                        # A duplicate means that there is a cycle in the broadcast tree, so the link becomes lazy
+                        if self.broadcast == BROADCAST_MODE_TREE:
+                            self.send_tree_update(senders_identifier, TREE_UPDATE_TYPE_PRUNE)
+
+                elif msg_code == MESSAGE_CODE_IHAVE:
+                    # Someone advertises announces, remember the ones we don't have
+                    logging.debug('P2PController | Handle received ihave (%d): %s' % (MESSAGE_CODE_IHAVE, message))
+                    # In pull mode and for anti-entropy we request missing announces right away, unless they have been
+                    # requested already
+                    ihave_type = message.get_values()['ihave_type']
+                    request_now = self.broadcast == BROADCAST_MODE_PULL or ihave_type != IHAVE_TYPE_ANNOUNCE
+                    wanted_digests = []
+                    for digest in message.get_values()['digests']:
+                        known_msg_id = self.announce_message_cache.find_digest(digest)
+                        if known_msg_id is None:
+                            if self.missing_messages.add(digest, senders_identifier, time.monotonic(),
+                                                         requested=request_now) and request_now:
+                                wanted_digests.append(digest)
+                        else:
+                            # The advertising peer has the message, so it never has to be sent to it
+                            self.announce_message_cache.add_known_by(known_msg_id, [senders_identifier])
+                    if wanted_digests:
+                        self.send_iwant(senders_identifier, wanted_digests)
+                    # The initiator of an anti-entropy round gets the recent announces it misses in return
+                    if ihave_type == IHAVE_TYPE_ANTI_ENTROPY:
+                        advertised_digests = set(message.get_values()['digests'])
+                        self.send_ihave(senders_identifier, [digest for digest in self.get_recent_digests()
+                                                             if digest not in advertised_digests], IHAVE_TYPE_REPAIR)
+
+                elif msg_code == MESSAGE_CODE_IWANT:
+                    # Someone requests announces we advertised
+                    logging.debug('P2PController | Handle received iwant (%d): %s' % (MESSAGE_CODE_IWANT, message))
+                    self.send_requested_messages(senders_identifier, message.get_values()['digests'])
+
+                elif msg_code == MESSAGE_CODE_TREE_UPDATE:
+                    logging.debug('P2PController | Handle received tree update (%d): %s' % (MESSAGE_CODE_TREE_UPDATE,
+                                                                                            message))
+                    if message.get_values()['update_type'] == TREE_UPDATE_TYPE_GRAFT:
+                        # The link becomes eager and the sender gets the announces it misses
+                        self.p2p_connection_pool.set_eager(senders_identifier, True)
+                        self.send_requested_messages(senders_identifier, message.get_values()['digests'])
+                    else:
+                        self.p2p_connection_pool.set_eager(senders_identifier, False)
+
+                elif msg_code == MESSAGE_CODE_SUMMARY:
+                    # A new connected peer summarizes its messages, so we send the ones it misses
+                    logging.debug('P2PController | Handle received summary (%d): %s' % (MESSAGE_CODE_SUMMARY, message))
+                    self.exchange_messages(senders_identifier, message.get_values()['bloom_filter'])
 
                 elif msg_code == MESSAGE_CODE_PEER_REQUEST:
                     # Someone wants to know our known identifiers
                     logging.debug('P2PController | Handle received peer request (%d): %s' % (MESSAGE_CODE_PEER_REQUEST,
                                                                                              message))
 
-                    # The peer request message contains the server address of the other peer
+                    # The peer request message contains the server address of the requesting peer, which is the
+                    # other peer unless the request has been forwarded by a random walk
                     peer_server_identifier = message.get_values()['p2p_server_address']
-                    self.p2p_connection_pool.update_connection(senders_identifier, peer_server_identifier)
+                    forwarded = message.get_values()['forwarded']
+                    if not forwarded:
+                        self.p2p_connection_pool.update_connection(senders_identifier, peer_server_identifier)
 
-                    # Build identifier list BUT exclude the identifier of the requesting peer!
-                    own_p2p_server_identifier = '%s:%d' % (self.p2p_server_address['host'],
-                                                           self.p2p_server_address['port'])
-                    known_server_identifiers = self.p2p_connection_pool.get_server_identifiers(
-                        identifier_to_exclude=[peer_server_identifier, own_p2p_server_identifier])
-
-                    # Send the assembled identifier list
-                    packed_data = pack_gossip_peer_response(known_server_identifiers)['data']
-                    peer_response_msg = MessageGossipPeerResponse(packed_data)
-                    self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': senders_identifier,
-                                           'message': peer_response_msg})
-                    logging.debug('P2PController | Answering with peer response (%d): %s' % (MESSAGE_CODE_PEER_RESPONSE,
-                                                                                             peer_response_msg))
+                    # A random walk is passed on to a random peer until its length is used up, the last peer answers
+                    walk_length = message.get_values()['walk_length']
+                    if not walk_length or not self.forward_random_walk(senders_identifier, peer_server_identifier,
+                                                                       walk_length - 1):
+                        self.answer_peer_request(senders_identifier, peer_server_identifier,
+                                                 message.get_values()['page'], forwarded)
 
                     # We've got the server identifier with the peer request, so spread it to anyone we know
-                    senders_server_identifier = self.p2p_connection_pool.get_server_identifier(senders_identifier)
-                    self.send_peer_update(senders_identifier, senders_server_identifier, self.max_ttl)
+                    if not forwarded:
+                        senders_server_identifier = self.p2p_connection_pool.get_server_identifier(senders_identifier)
+                        self.announce_peer(senders_identifier, senders_server_identifier)
 
                 elif msg_code == MESSAGE_CODE_PEER_INIT:
                     # Someone wants to inform us about his server identifier
@@ -145,83 +333,56 @@ class P2PController(multiprocessing.Process):
 
                     # We've got the server identifier with the peer init, so spread it to anyone we know
                     senders_server_identifier = self.p2p_connection_pool.get_server_identifier(senders_identifier)
-                    self.send_peer_update(senders_identifier, senders_server_identifier, self.max_ttl)
+                    self.announce_peer(senders_identifier, senders_server_identifier)
 
                 elif msg_code == MESSAGE_CODE_PEER_RESPONSE:
                     # We received the known identifiers of someone
                     logging.debug('P2PController | Handle received peer response (%d): %s'
                                   % (MESSAGE_CODE_PEER_RESPONSE, message))
 
-                    # Use the peer response only if there is space for new connections in the pool
-                    if self.p2p_connection_pool.get_capacity() > 0:
-                        received_server_identifiers = message.get_values()['data']
-                        new_identifiers = self.p2p_connection_pool.filter_new_server_identifiers(
-                            received_server_identifiers)
-
-                        # If the peer response provides new identifiers, we establish a new connection with them
-                        if len(new_identifiers) > 0:
-                            for new_identifier in new_identifiers:
-                                self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION,
-                                                       'identifier': new_identifier})
-
-                                # Send initial message
-                                logging.debug('P2PController | Sending peer init (%d): %s' % (MESSAGE_CODE_PEER_INIT,
-                                                                                              message))
-                                own_p2p_server_identifier = '%s:%d' % (self.p2p_server_address['host'],
-                                                                       self.p2p_server_address['port'])
-                                packed_data = pack_gossip_peer_init(own_p2p_server_identifier)['data']
-                                self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE,
-                                                       'identifier': new_identifier,
-                                                       'message': MessageGossipPeerInit(packed_data)})
-
-                                # Stop if the pool is full
-                                if self.p2p_connection_pool.get_capacity() <= 0:
-                                    break
+                    # Establish new connections as long as there is space in the pool, the others are kept in the
+                    # passive view
+                    received_server_identifiers = message.get_values()['data']
+                    connected = self.connect_to_peers(received_server_identifiers)
+
+                    # If the requested page did not provide a single new peer but there is space left, we request the
+                    # next page of the sample
+                    page = self.peer_request_pages.pop(senders_identifier, None)
+                    if page is not None and page < MAX_PEER_REQUEST_PAGE and received_server_identifiers and \
+                            connected == 0 and self.p2p_connection_pool.get_capacity() > 0:
+                        self.send_peer_request(senders_identifier, page=page + 1)
+
+                elif msg_code == MESSAGE_CODE_PEER_DELTA:
+                    # We received several membership events of someone, handle the ones we don't know yet
+                    logging.debug('P2PController | Handle received peer delta (%d): %s' % (MESSAGE_CODE_PEER_DELTA,
+                                                                                           message))
+                    for entry in message.get_values()['entries']:
+                        if self.membership.accept(entry):
+                            self.handle_membership_event(senders_identifier, entry)
+
+                elif msg_code == MESSAGE_CODE_PING:
+                    # A ping is echoed, a pong tells us the RTT of the connection
+                    if message.get_values()['ping_type'] == PING_TYPE_PING:
+                        pong_msg = MessageGossipPing(pack_gossip_ping(PING_TYPE_PONG,
+                                                                      message.get_values()['timestamp'])['data'])
+                        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': senders_identifier,
+                                               'message': pong_msg})
                     else:
-                        logging.debug('P2PController | Discarding message (%d) because pool is full!' % msg_code)
+                        rtt = time.monotonic() - message.get_values()['timestamp'] / 1000000
+                        if rtt >= 0:
+                            self.p2p_connection_pool.record_pong(senders_identifier, rtt)
 
                 elif msg_code == MESSAGE_CODE_PEER_UPDATE:
-                    # We received a peer update of someone
+                    # We received a single peer update of someone, which has no version. Peers send peer deltas
+                    # instead, so this only happens with peers of older versions.
                     logging.debug('P2PController | Handle received peer update (%d): %s' % (MESSAGE_CODE_PEER_UPDATE,
                                                                                             message))
 
-                    new_server_identifier = message.get_values()['address']
-                    update_type = message.get_values()['update_type']
-                    ttl = message.get_values()['ttl']
-
-                    if ttl < int(self.max_ttl/2):
-                        if update_type == PEER_UPDATE_TYPE_PEER_FOUND:
-                            # Use the peer update only if there is space for a new connection in the pool
-                            if self.p2p_connection_pool.get_capacity() > 0:
-                                new_identifiers = self.p2p_connection_pool.filter_new_server_identifiers(
-                                    [new_server_identifier])
-
-                                # If the peer update provides a new identifier, we establish a new connection with it
-                                for new_identifier in new_identifiers:
-                                    self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION,
-                                                           'identifier': new_identifier})
-
-                                    # Send initial message
-                                    logging.debug('P2PController | Sending peer init (%d): %s' % (MESSAGE_CODE_PEER_INIT,
-                                                                                                  message))
-                                    own_p2p_server_identifier = '%s:%d' % (self.p2p_server_address['host'],
-                                                                           self.p2p_server_address['port'])
-                                    packed_data = pack_gossip_peer_init(own_p2p_server_identifier)['data']
-                                    self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE,
-                                                           'identifier': new_identifier,
-                                                           'message': MessageGossipPeerInit(packed_data)})
-                            else:
-                                logging.debug('P2PController | Discarding message (%d) because pool is full' % msg_code)
-                        elif update_type == PEER_UPDATE_TYPE_PEER_LOST:
-                            # Currently a peer update of type PEER_UPDATE_TYPE_PEER_LOST does not need to be handled
-                            pass
-
-                    # If we don't know the peer update already, spread it
-                    if ttl > 1:
-                        ttl -= 1
-                        self.send_peer_update(senders_identifier, new_server_identifier, ttl)
-                    elif ttl == 0:  # A ttl of 0 means that the message is unstoppable!
-                        self.send_peer_update(senders_identifier, new_server_identifier, ttl)
+                    # If we don't know the peer update already, it is handled like an event of our own
+                    if self.update_message_cache.add_message(message, valid=True):
+                        entry = self.membership.record(message.get_values()['address'],
+                                                       message.get_values()['update_type'], message.get_values()['ttl'])
+                        self.handle_membership_event(senders_identifier, entry)
 
                 else:
                     logging.debug('P2PController | Discarding message (%d)' % msg_code)
@@ -229,60 +390,414 @@ class P2PController(multiprocessing.Process):
             elif queue_item_type == QUEUE_ITEM_TYPE_CONNECTION_LOST:
                 # A connection has been disconnected from this instance
                 logging.debug('P2PController | One connection lost, try to get a new one %s' % senders_identifier)
-
-                random_identifier = self.p2p_connection_pool.get_random_identifier(senders_identifier)
-                if random_identifier:
-                    self.send_peer_request(random_identifier)
+                self.membership.remove_peer(senders_identifier)
+                self.peer_request_pages.pop(senders_identifier, None)
+                # Both connection events are routed by the connection identifier, so the timer is always cancelled by
+                # the shard which scheduled it
+                if self.keepalive_timers is not None:
+                    self.keepalive_timers.cancel(senders_identifier)
+
+                # Promote a peer of the passive view, ask a random peer for new ones only if the passive view is empty
+                promoted_identifier = None
+                if self.passive_view is not None and self.p2p_connection_pool.get_capacity() > 0:
+                    promoted_identifier = self.passive_view.pop_random_identifier(
+                        identifiers_to_exclude=self.p2p_connection_pool.get_server_identifiers())
+                if promoted_identifier and not self.p2p_connection_pool.reserve_slots([promoted_identifier]):
+                    # Another dial has taken the last slot meanwhile
+                    self.passive_view.add_identifiers([promoted_identifier])
+                elif promoted_identifier:
+                    logging.debug('P2PController | Promoting %s from passive view' % promoted_identifier)
+                    self.connect_to_peer(promoted_identifier)
+                else:
+                    random_identifier = self.p2p_connection_pool.get_random_identifier(senders_identifier)
+                    if random_identifier:
+                        self.send_peer_request(random_identifier)
 
             elif queue_item_type == QUEUE_ITEM_TYPE_NEW_CONNECTION:
                 # Our instance know a new connection
                 senders_server_identifier = self.p2p_connection_pool.get_server_identifier(senders_identifier)
                 # We can inform everyone only if we know the server identifier of the sender
                 if senders_server_identifier:
-                    self.send_peer_update(senders_identifier, senders_server_identifier, self.max_ttl)
+                    self.announce_peer(senders_identifier, senders_server_identifier)
                 else:
                     logging.debug('P2PController | Don\'t know the server identifier of the new connection, wait for'
                                   ' peer server address of %s' % senders_identifier)
 
-                self.exchange_messages(senders_identifier)
+                # The new peer answers the summary with the messages we miss and vice versa
+                self.send_summary(senders_identifier)
+                self.send_ping(senders_identifier)
+                if self.keepalive_timers is not None:
+                    self.keepalive_timers.schedule(senders_identifier, time.monotonic() + self.keepalive_timeout)
+
+        if self.address_book is not None:
+            self.address_book.record(self.p2p_connection_pool.get_server_identifiers(
+                identifier_to_exclude=[self.own_p2p_server_identifier]), time.time())
+            self.address_book.close()
+
+    def bootstrap(self):
+        """ Contacts all bootstrappers at once. The sender only keeps the connection which is established first and
+        sends the peer request via this one. """
+        bootstrapper_identifiers = tuple(GossipPeerAddress.from_host_port(bootstrapper_address['host'],
+                                                                          bootstrapper_address['port'])
+                                         for bootstrapper_address in self.bootstrapper_addresses or []
+                                         if bootstrapper_address != self.p2p_server_address)
+        for bootstrapper_identifier in bootstrapper_identifiers:
+            self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': bootstrapper_identifier,
+                                   'race': bootstrapper_identifiers})
+            self.send_peer_request(bootstrapper_identifier, walk_length=self.random_walk_length)
+
+    def connect_to_peer(self, server_identifier):
+        """ Establishes a new connection and informs the peer about our server identifier. Callers which want to stay
+        within the size of the connection pool reserve a slot for the connection first (see
+        GossipConnectionPool.reserve_slots).
+
+        :param server_identifier: The server identifier of the peer
+        """
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': server_identifier})
+
+        # Send initial message
+        packed_data = pack_gossip_peer_init(self.own_p2p_server_identifier)['data']
+        peer_init_msg = MessageGossipPeerInit(packed_data)
+        logging.debug('P2PController | Sending peer init (%d): %s' % (MESSAGE_CODE_PEER_INIT, peer_init_msg))
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': server_identifier,
+                               'message': peer_init_msg})
+
+    def connect_to_peers(self, server_identifiers):
+        """ Establishes new connections to all unknown peers as long as there is space in the connection pool. The
+        space is reserved before dialing, so dials which are still in progress are taken into account. The remaining
+        peers are added to the passive view (if any).
+
+        :param server_identifiers: Server identifiers of peers, e.g. of a peer response
+        :returns: The amount of new connections
+        """
+        new_identifiers = self.p2p_connection_pool.filter_new_server_identifiers(server_identifiers)
+        new_identifiers = [identifier for identifier in new_identifiers if identifier != self.own_p2p_server_identifier]
+
+        reserved_identifiers = self.p2p_connection_pool.reserve_slots(new_identifiers)
+        for server_identifier in reserved_identifiers:
+            if self.passive_view is not None:
+                self.passive_view.remove_identifier(server_identifier)
+            self.connect_to_peer(server_identifier)
+
+        remaining_identifiers = [identifier for identifier in new_identifiers if identifier not in reserved_identifiers]
+        if self.passive_view is not None:
+            self.passive_view.add_identifiers(remaining_identifiers)
+        elif remaining_identifiers:
+            logging.debug('P2PController | Discarding %d peers because pool is full' % len(remaining_identifiers))
+        return len(reserved_identifiers)
+
+    def answer_peer_request(self, senders_identifier, peer_server_identifier, page, forwarded):
+        """ Sends a random sample of our peers to a requesting peer. If the request has reached us by a random walk,
+        we are not connected to the requesting peer yet, so we establish a connection for the answer. If there is no
+        space left in the connection pool, the walk ends without an answer and the peer is kept in the passive view.
+
+        :param senders_identifier: Identifier of the connection the peer request has been received from
+        :param peer_server_identifier: Server identifier of the requesting peer
+        :param page: The requested page of the sample
+        :param forwarded: True if the peer request has been forwarded by another peer
+        """
+        # Build a random sample of the identifiers BUT exclude the identifier of the requesting peer!
+        known_server_identifiers = self.p2p_connection_pool.sample_server_identifiers(
+            self.peer_response_size, self.peer_sample_salt + peer_server_identifier, page=page,
+            identifier_to_exclude=[peer_server_identifier, self.own_p2p_server_identifier])
+
+        receivers_identifier = senders_identifier
+        if forwarded:
+            if peer_server_identifier == self.own_p2p_server_identifier:
+                return
+            identifiers = self.p2p_connection_pool.get_identifiers_of_server(peer_server_identifier)
+            if identifiers:
+                receivers_identifier = identifiers[0]
+            elif self.p2p_connection_pool.reserve_slots([peer_server_identifier]):
+                logging.debug('P2PController | Random walk of %s ends here, connecting' % peer_server_identifier)
+                if self.passive_view is not None:
+                    self.passive_view.remove_identifier(peer_server_identifier)
+                self.connect_to_peer(peer_server_identifier)
+                receivers_identifier = peer_server_identifier
+            else:
+                logging.debug('P2PController | Random walk of %s ends here, dropping it because pool is full' %
+                              peer_server_identifier)
+                if self.passive_view is not None:
+                    self.passive_view.add_identifiers([peer_server_identifier])
+                return
+
+        # Send the assembled identifier list
+        peer_response_msg = MessageGossipPeerResponse(pack_gossip_peer_response(known_server_identifiers)['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receivers_identifier,
+                               'message': peer_response_msg})
+        logging.debug('P2PController | Answering with peer response (%d): %s' % (MESSAGE_CODE_PEER_RESPONSE,
+                                                                                 peer_response_msg))
+
+    def forward_random_walk(self, senders_identifier, peer_server_identifier, walk_length):
+        """ Passes a peer request on to a random peer, which is neither the sender nor the requesting peer.
+
+        :param senders_identifier: Identifier of the connection the peer request has been received from
+        :param peer_server_identifier: Server identifier of the requesting peer
+        :param walk_length: The remaining amount of hops after this one
+        :returns: True if the peer request has been forwarded, False if there is no suitable peer
+        """
+        identifiers_to_exclude = [senders_identifier] + self.p2p_connection_pool.get_identifiers_of_server(
+            peer_server_identifier)
+        next_hops = self.p2p_connection_pool.get_random_identifiers(1, identifiers_to_exclude=identifiers_to_exclude)
+        if not next_hops:
+            return False
+        packed_data = pack_gossip_peer_request(peer_server_identifier, walk_length=walk_length, forwarded=True)['data']
+        logging.debug('P2PController | Forwarding random walk of %s to %s' % (peer_server_identifier, next_hops[0]))
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': next_hops[0],
+                               'message': MessageGossipPeerRequest(packed_data)})
+        return True
+
+    def shuffle_passive_view(self):
+        """ Exchanges peers with a random connected peer: we send a sample of our active and passive view and request
+        its peers in return. Peers we receive extend the passive view, so it keeps track of the changing network. """
+        random_identifier = self.p2p_connection_pool.get_random_identifier(None)
+        if not random_identifier:
+            return
+        sample = self.p2p_connection_pool.get_server_identifiers(
+            identifier_to_exclude=[self.p2p_connection_pool.get_server_identifier(random_identifier)])
+        sample = random.sample(sample, min(SHUFFLE_ACTIVE_SAMPLE_SIZE, len(sample)))
+        sample += self.passive_view.get_random_identifiers(SHUFFLE_PASSIVE_SAMPLE_SIZE)
+        sample.append(self.own_p2p_server_identifier)
+        logging.debug('P2PController | Shuffling passive view with %s' % random_identifier)
+
+        peer_response_msg = MessageGossipPeerResponse(pack_gossip_peer_response(sample)['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': random_identifier,
+                               'message': peer_response_msg})
+        self.send_peer_request(random_identifier)
+
+    def announce_peer(self, senders_identifier, senders_server_identifier):
+        """ Spreads the information about a new connected peer.
+
+        :param senders_identifier: Identifier of the new connection
+        :param senders_server_identifier: Server identifier of the new connected peer
+        """
+        if senders_server_identifier != self.own_p2p_server_identifier:
+            logging.debug('P2PController | Spread information about new connection %s' % senders_identifier)
+            entry = self.membership.record(senders_server_identifier, PEER_UPDATE_TYPE_PEER_FOUND, self.max_ttl)
+            self.spread_membership_event(senders_identifier, entry)
 
-    def send_peer_update(self, senders_identifier, senders_server_identifier, ttl):
-        """ Sends peer updates to several peers.
+    def handle_membership_event(self, senders_identifier, entry):
+        """ Reacts on a new membership event of another peer and spreads it as long as its ttl allows it.
 
-        :param senders_identifier: Identifier of the sender we received this update from
-        :param senders_server_identifier: Server identifier of the changed peer
-        :param ttl: ttl to set in the new update messages
+        :param senders_identifier: Identifier of the sender we received this event from
+        :param entry: The membership event in the form {'address', 'update_type', 'ttl', 'version'}
+        """
+        if entry['address'] == self.own_p2p_server_identifier:
+            return
+        ttl = entry['ttl']
+        if ttl < int(self.max_ttl/2):
+            if entry['update_type'] == PEER_UPDATE_TYPE_PEER_FOUND:
+                # Connect to the new peer if there is space in the pool, otherwise keep it in the passive view
+                self.connect_to_peers([entry['address']])
+            elif entry['update_type'] == PEER_UPDATE_TYPE_PEER_LOST and self.passive_view is not None:
+                self.passive_view.remove_identifier(entry['address'])
+
+        if ttl > 1:
+            self.spread_membership_event(senders_identifier, dict(entry, ttl=ttl - 1))
+        elif ttl == 0:  # A ttl of 0 means that the event is unstoppable, the versions stop it nonetheless
+            self.spread_membership_event(senders_identifier, entry)
+
+    def spread_membership_event(self, senders_identifier, entry):
+        """ Adds a membership event to the next peer deltas of all peers, except for the sender and the affected peer.
+
+        :param senders_identifier: Identifier of the sender we received this event from
+        :param entry: The membership event in the form {'address', 'update_type', 'ttl', 'version'}
         """
-        packed_data = pack_gossip_peer_update(senders_server_identifier, ttl, PEER_UPDATE_TYPE_PEER_FOUND)['data']
-        peer_update_msg = MessageGossipPeerUpdate(packed_data)
-        msg_id = self.update_message_cache.add_message(peer_update_msg, valid=True)
+        receivers = self.p2p_connection_pool.get_random_identifiers(
+            0, identifiers_to_exclude=[senders_identifier, entry['address']] +
+            self.p2p_connection_pool.get_identifiers_of_server(entry['address']))
+        for receiver in receivers:
+            self.membership.add(receiver, entry)
+
+    def send_peer_deltas(self):
+        """ Sends the collected membership events to all peers which did not get a peer delta within the interval. """
+        put_many(self.to_p2p_queue, [{'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': receiver,
+                                      'message': MessageGossipPeerDelta(pack_gossip_peer_delta(entries)['data'])}
+                                     for receiver, entries in self.membership.pop_due(time.monotonic()).items()])
+
+    def send_tree_update(self, identifier, update_type, digests=()):
+        """ Changes the type of a link within the broadcast tree and informs the peer at the other end about it.
+
+        :param identifier: The identifier of the affected link
+        :param update_type: TREE_UPDATE_TYPE_PRUNE or TREE_UPDATE_TYPE_GRAFT
+        :param digests: (optional) Digests of the announces which are requested with a GRAFT
+        """
+        self.p2p_connection_pool.set_eager(identifier, update_type == TREE_UPDATE_TYPE_GRAFT)
+        tree_update_msg = MessageGossipTreeUpdate(pack_gossip_tree_update(update_type, digests)['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': identifier,
+                               'message': tree_update_msg})
 
-        if msg_id and senders_server_identifier != '%s:%d' % (self.p2p_server_address['host'],
-                                                              self.p2p_server_address['port']):
-            logging.debug('P2PController | Spread information about new connection %s' % senders_identifier)
-            identifiers = self.p2p_connection_pool.get_identifiers()
-            for identifier in identifiers:
-                if identifier not in [senders_identifier, senders_server_identifier]:
-                    self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': identifier,
-                                           'message': peer_update_msg})
+    def send_iwant(self, identifier, digests):
+        """ Requests advertised announces from a peer.
+
+        :param identifier: The identifier of the advertising peer
+        :param digests: Digests of the requested announces
+        """
+        iwant_msg = MessageGossipIWant(pack_gossip_iwant(digests)['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': identifier, 'message': iwant_msg})
+
+    def send_requested_messages(self, identifier, digests):
+        """ Sends requested announces (IWANT or GRAFT) to a peer, as long as they are still cached.
+
+        :param identifier: The identifier of the requesting peer
+        :param digests: Digests of the requested announces
+        """
+        queue_items = []
+        for digest in digests:
+            msg_id = self.announce_message_cache.find_digest(digest)
+            message_to_send = self.announce_message_cache.get_message(msg_id) if msg_id is not None else None
+            if message_to_send:
+                self.announce_message_cache.add_known_by(msg_id, [identifier])
+                queue_items.append({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': identifier,
+                                    'message': message_to_send})
+        put_many(self.to_p2p_queue, queue_items)
+
+    def send_ihave(self, identifier, digests, ihave_type=IHAVE_TYPE_ANNOUNCE):
+        """ Advertises announces to a peer, split into as many IHAVE messages as needed.
+
+        :param identifier: The identifier of the receiving peer
+        :param digests: Digests of the advertised announces
+        :param ihave_type: (optional) IHAVE_TYPE_ANNOUNCE, IHAVE_TYPE_ANTI_ENTROPY or IHAVE_TYPE_REPAIR
+        """
+        put_many(self.to_p2p_queue, [
+            {'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': identifier,
+             'message': MessageGossipIHave(pack_gossip_ihave(digests[i:i + MAX_DIGESTS], ihave_type)['data'])}
+            for i in range(0, len(digests), MAX_DIGESTS)])
+
+    def get_recent_digests(self):
+        """ Collects the digests of the newest cached announces which fit into the anti-entropy budget.
 
-    def send_peer_request(self, peer_request_identifier):
+        :returns: List of digests, from newest to oldest
+        """
+        max_digests = min(self.anti_entropy_budget // DIGEST_SIZE, MAX_DIGESTS)
+        digests = [message['message'].get_digest()
+                   for _, message in self.announce_message_cache.iterator(exclude_id=False)]
+        return list(reversed(digests))[:max_digests]
+
+    def start_anti_entropy_round(self):
+        """ Advertises the recent announces to a random peer. The peer requests the ones it misses and advertises the
+        recent announces we miss in return, so lost announces are repaired in both directions. The IHAVE is sent even
+        without any digests, so that a peer with an empty cache gets repaired as well. """
+        random_identifier = self.p2p_connection_pool.get_random_identifier(None)
+        if not random_identifier:
+            return
+        digests = self.get_recent_digests()
+        logging.debug('P2PController | Anti-entropy round with %s (%d digests)' % (random_identifier, len(digests)))
+        ihave_msg = MessageGossipIHave(pack_gossip_ihave(digests, IHAVE_TYPE_ANTI_ENTROPY)['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': random_identifier,
+                               'message': ihave_msg})
+
+    def request_missing_messages(self):
+        """ Requests all advertised announces which did not arrive in time. In tree mode the links to the advertising
+        peers become eager (GRAFT), since the broadcast tree obviously does not reach us over the current eager links.
+        In pull mode the announces are requested from the next advertising peer (IWANT). """
+        for identifier, digests in self.missing_messages.expire(time.monotonic()).items():
+            digests = [digest for digest in digests if self.announce_message_cache.find_digest(digest) is None]
+            if not digests:
+                continue
+            if self.broadcast == BROADCAST_MODE_TREE:
+                logging.debug('P2PController | Grafting link to %s for %d missing messages'
+                              % (identifier, len(digests)))
+                self.send_tree_update(identifier, TREE_UPDATE_TYPE_GRAFT, digests)
+            else:
+                logging.debug('P2PController | Requesting %d missing messages from %s' % (len(digests), identifier))
+                self.send_iwant(identifier, digests)
+
+    def send_peer_request(self, peer_request_identifier, page=0, walk_length=0):
         """ Sends a peer request
 
         :param peer_request_identifier: The identifier dict of the receiving peer
+        :param page: (optional) The index of the requested page of the peer sample
+        :param walk_length: (optional) The amount of hops the request is forwarded before another peer answers it
         """
-        own_p2p_server_identifier = '%s:%d' % (self.p2p_server_address['host'], self.p2p_server_address['port'])
-        packed_msg = pack_gossip_peer_request(own_p2p_server_identifier)
+        # The answer to a random walk arrives via another connection, so there is no page to continue
+        if not walk_length:
+            self.peer_request_pages[peer_request_identifier] = page
+        packed_msg = pack_gossip_peer_request(self.own_p2p_server_identifier, page, walk_length)
         peer_request_msg = MessageGossipPeerRequest(packed_msg['data'])
         self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': peer_request_identifier,
                                'message': peer_request_msg})
 
-    def exchange_messages(self, peer_identifier):
-        """ Send messages to new connected peer.
+    def send_ping(self, peer_identifier):
+        """ Sends a ping which carries the current time, so that the pong tells the RTT of the connection.
+
+        :param peer_identifier: Receiving peer
+        """
+        self.p2p_connection_pool.record_ping(peer_identifier)
+        ping_msg = MessageGossipPing(pack_gossip_ping(PING_TYPE_PING, int(time.monotonic() * 1000000))['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': peer_identifier,
+                               'message': ping_msg})
+
+    def check_keepalive_timers(self):
+        """ Closes the connections whose keepalive deadline has expired. The deadlines are not moved on every received
+        message, instead an expired deadline is set again relative to the last activity of the connection if the
+        connection has received something meanwhile. So the costs only depend on the amount of expiring deadlines. """
+        now = time.monotonic()
+        for identifier in self.keepalive_timers.advance(now):
+            try:
+                stats = self.p2p_connection_pool.get_connection_stats(identifier)
+            except GossipIdentifierNotFound:
+                continue
+            if stats is None:
+                # Without a slot in the stats table the activity of the connection is unknown
+                continue
+            last_activity = stats['last_activity']
+            if last_activity + self.keepalive_timeout > now:
+                self.keepalive_timers.schedule(identifier, last_activity + self.keepalive_timeout)
+            else:
+                self.close_dead_connection(identifier)
+
+    def close_dead_connection(self, peer_identifier):
+        """ Removes a connection which has not received anything for too long and shuts its socket down. Its receiver
+        wakes up and reports the lost connection, so it is handled like any other lost connection.
+
+        :param peer_identifier: The identifier of the dead connection
+        """
+        connection = self.p2p_connection_pool.remove_connection(peer_identifier)
+        if connection is None:
+            return
+        logging.info('P2PController | Connection %s has been silent for %.1f seconds, closing it'
+                     % (peer_identifier, self.keepalive_timeout))
+        try:
+            connection.shutdown(SHUT_RDWR)
+        except OSError:
+            pass
+        connection.close()
+
+    def send_summary(self, peer_identifier):
+        """ Sends a Bloom filter of the digests of all cached announces to a new connected peer.
 
         :param peer_identifier: Receiving peer
         """
+        digests = [message['message'].get_digest()
+                   for _, message in self.announce_message_cache.iterator(exclude_id=False)]
+        bloom_filter = create_bloom_filter(digests, MAX_SUMMARY_SIZE)
+        logging.debug('P2PController | Sending summary of %d messages (%d bytes) to %s'
+                      % (len(digests), len(bloom_filter), peer_identifier))
+        summary_msg = MessageGossipSummary(pack_gossip_summary(bloom_filter)['data'])
+        self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': peer_identifier,
+                               'message': summary_msg})
+
+    def exchange_messages(self, peer_identifier, bloom_filter):
+        """ Send messages to new connected peer, except for the ones it summarized or which it is known to have.
+
+        :param peer_identifier: Receiving peer
+        :param bloom_filter: GossipBloomFilter of the messages the peer has already
+        """
         logging.debug('P2PController | Exchanging messages with (%s)' % peer_identifier)
-        for message in self.announce_message_cache.iterator():
-            self.to_p2p_queue.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': peer_identifier,
-                                   'message': message["message"]})
+        digests = []
+        queue_items = []
+        for msg_id, message in self.announce_message_cache.iterator(exclude_id=False):
+            if peer_identifier in message['known_by'] or message['message'].get_digest() in bloom_filter:
+                continue
+            # Messages which used up their forwarding budget are not sent anymore
+            if self.announce_message_cache.reserve_forwards(msg_id, 1, self.forward_budget):
+                if self.broadcast == BROADCAST_MODE_PULL:
+                    # The new peer requests the announces it does not know yet
+                    digests.append(message["message"].get_digest())
+                else:
+                    self.announce_message_cache.add_known_by(msg_id, [peer_identifier])
+                    queue_items.append({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': peer_identifier,
+                                        'message': message["message"]})
+        put_many(self.to_p2p_queue, queue_items)
+        self.send_ihave(peer_identifier, digests)
@@ -0,0 +1,179 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import zlib
+
+from gossip.control.message_cache import GossipMessageCache
+from gossip.util.channel import put_many
+from gossip.util.message_code import MESSAGE_CODE_ANNOUNCE, MESSAGE_CODE_PEER_UPDATE
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_RECEIVED_MESSAGE
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def shard_of_digest(digest, shard_count):
+    """ Maps a message digest to a shard.
+
+    :param digest: The digest of a message (see MessageGossip.get_digest)
+    :param shard_count: The total amount of shards
+    :returns: The index of the responsible shard
+    """
+    return int.from_bytes(digest[:4], 'big') % shard_count
+
+
+def shard_of_identifier(identifier, shard_count):
+    """ Maps a peer identifier to a shard. The mapping is stable across processes.
+
+    :param identifier: A connection or server identifier (GossipPeerAddress)
+    :param shard_count: The total amount of shards
+    :returns: The index of the responsible shard
+    """
+    return zlib.crc32(identifier) % shard_count
+
+
+class GossipShardRouter:
+    """ Distributes the queue items of the P2P layer over several P2P controller shards. Announces and peer updates are
+    routed by their message digest, so each message is always handled by the same shard. All other items (peer
+    requests, peer inits, connection events, ...) are routed by the identifier of the affected connection. """
+
+    def __init__(self, shard_queues):
+        """ Constructor.
+
+        :param shard_queues: One channel per P2P controller shard
+        """
+        self.shard_queues = shard_queues
+
+    def put(self, queue_item):
+        """ Puts a queue item into the channel of the responsible shard.
+
+        :param queue_item: A queue item in the form {'type': <type>, 'identifier': <identifier>, 'message': <message>}
+        """
+        self.shard_queues[self.shard_of(queue_item)].put(queue_item)
+
+    def put_many(self, queue_items):
+        """ Puts several queue items into the channels of the responsible shards, one bulk per shard.
+
+        :param queue_items: An iterable of queue items, the order per shard is preserved
+        """
+        items_per_shard = {}
+        for queue_item in queue_items:
+            items_per_shard.setdefault(self.shard_of(queue_item), []).append(queue_item)
+        for shard, shard_items in items_per_shard.items():
+            put_many(self.shard_queues[shard], shard_items)
+
+    def shard_of(self, queue_item):
+        """ Determines the shard which is responsible for a queue item.
+
+        :param queue_item: The queue item to route
+        :returns: The index of the responsible shard
+        """
+        message = queue_item['message']
+        if queue_item['type'] == QUEUE_ITEM_TYPE_RECEIVED_MESSAGE and \
+                message.get_values()['code'] in [MESSAGE_CODE_ANNOUNCE, MESSAGE_CODE_PEER_UPDATE]:
+            return shard_of_digest(message.get_digest(), len(self.shard_queues))
+        return shard_of_identifier(queue_item['identifier'], len(self.shard_queues))
+
+
+class GossipShardedMessageCache:
+    """ Message cache which is split into several GossipMessageCache slices. A message is cached in the slice of the
+    shard which is responsible for its digest, message ids tell the slice they belong to. The interface is the same as
+    the one of GossipMessageCache. """
+
+    def __init__(self, message_cache_label, cache_size=30, shared=True, shard_count=1):
+        """ Constructor.
+
+        :param message_cache_label: A label to derive the concrete functionality of this cache
+        :param cache_size: (optional) The maximum numbers of messages that can be hold by all slices together
+        :param shared: (optional) If False, the cache can only be used by threads of the current process
+        :param shard_count: (optional) The amount of slices
+        """
+        slice_size = -(-cache_size // shard_count)
+        self._slices = [GossipMessageCache('%s%d' % (message_cache_label, shard_index), cache_size=slice_size,
+                                           shared=shared, shard_index=shard_index, shard_count=shard_count)
+                        for shard_index in range(shard_count)]
+
+    def add_message(self, message, valid=False, origin=None):
+        """ Adds new message to the slice which is responsible for its digest.
+
+        :param message: The new message to cache
+        :param valid: (optional) Flag which states whether this message is valid or not
+        :param origin: (optional) Identifier of the connection we received the message from, it is the first peer
+                       which is known to have the message
+        :returns: The generated random message identifier for the cached message (None if message is already in cache)
+        """
+        return self.__slice_of_message(message).add_message(message, valid=valid, origin=origin)
+
+    def get_message(self, msg_id):
+        """ Provides a cached message from the slice the message id belongs to (see GossipMessageCache.get_message) """
+        return self.__slice_of_id(msg_id).get_message(msg_id)
+
+    def is_valid(self, msg_id):
+        """ Checks the validity in the slice the message id belongs to (see GossipMessageCache.is_valid) """
+        return self.__slice_of_id(msg_id).is_valid(msg_id)
+
+    def set_validity(self, msg_id, valid):
+        """ Sets the validity in the slice the message id belongs to (see GossipMessageCache.set_validity) """
+        self.__slice_of_id(msg_id).set_validity(msg_id, valid)
+
+    def find_digest(self, digest):
+        """ Looks up a message in the slice which is responsible for the digest (see GossipMessageCache.find_digest) """
+        return self._slices[shard_of_digest(digest, len(self._slices))].find_digest(digest)
+
+    def get_known_by(self, msg_id):
+        """ Provides the known holders from the slice the message id belongs to (see GossipMessageCache.get_known_by)
+        """
+        return self.__slice_of_id(msg_id).get_known_by(msg_id)
+
+    def add_known_by(self, msg_id, identifiers):
+        """ Adds known holders in the slice the message id belongs to (see GossipMessageCache.add_known_by) """
+        self.__slice_of_id(msg_id).add_known_by(msg_id, identifiers)
+
+    def reserve_forwards(self, msg_id, amount, forward_budget):
+        """ Reserves forwards in the slice the message id belongs to (see GossipMessageCache.reserve_forwards) """
+        return self.__slice_of_id(msg_id).reserve_forwards(msg_id, amount, forward_budget)
+
+    def remove_message(self, msg_id):
+        """ Removes a message from the slice the message id belongs to (see GossipMessageCache.remove_message) """
+        return self.__slice_of_id(msg_id).remove_message(msg_id)
+
+    def iterator(self, exclude_id=True):
+        """ Creates a generator over all slices. Messages are ordered by date (from oldest to newest).
+
+        :return: An iterator over the ordered list of messages
+        """
+        sorted_messages = sorted([message for cache_slice in self._slices
+                                  for message in cache_slice.iterator(exclude_id=False)],
+                                 key=lambda x: x[1][GossipMessageCache.DATE_ADDED])
+        return (message[1] if exclude_id else message for message in sorted_messages)
+
+    def __slice_of_message(self, message):
+        return self._slices[shard_of_digest(message.get_digest(), len(self._slices))]
+
+    def __slice_of_id(self, msg_id):
+        return self._slices[msg_id % len(self._slices)]
+
+
+def create_message_cache(message_cache_label, cache_size=30, shared=True, shard_count=1):
+    """ Creates a message cache which matches the amount of P2P controller shards.
+
+    :param message_cache_label: A label to derive the concrete functionality of this cache
+    :param cache_size: (optional) The maximum numbers of messages that can be hold by the cache
+    :param shared: (optional) If False, the cache can only be used by threads of the current process
+    :param shard_count: (optional) The amount of P2P controller shards
+    :returns: A GossipMessageCache for a single shard, a GossipShardedMessageCache otherwise
+    """
+    if shard_count > 1:
+        return GossipShardedMessageCache(message_cache_label, cache_size=cache_size, shared=shared,
+                                         shard_count=shard_count)
+    return GossipMessageCache(message_cache_label, cache_size=cache_size, shared=shared)
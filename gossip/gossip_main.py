@@ -18,16 +18,24 @@ import os
 import signal
 import sys
 from argparse import ArgumentParser
-from multiprocessing import Queue
+from multiprocessing import Manager
 
 from gossip.communication.server import GossipServer
 from gossip.communication.client_sender import GossipSender
-from gossip.communication.connection import GossipConnectionPool
+from gossip.communication.connection import GossipConnectionPool, GossipPassiveView
+from gossip.communication.eviction import create_eviction_policy
+from gossip.communication.receiver_pool import create_receiver_pool
+
 from gossip.control.api_controller import APIController
+from gossip.control.broadcast import GossipMissingMessages
+from gossip.control.membership import GossipMembershipVersions
 from gossip.control.p2p_controller import P2PController
-from gossip.control.message_cache import GossipMessageCache
+from gossip.control.sharding import GossipShardRouter, create_message_cache
+
 from gossip.control.api_registrations import APIRegistrationHandler
 from gossip.util import config_parser
+from gossip.util.channel import create_channel
+from gossip.util.runtime import GossipRuntime
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
@@ -41,6 +49,16 @@ def signal_handler(signal, frame):
     sys.exit(0)
 
 
+def log_connection_stats(connection_pools):
+    """ Logs the statistics of all connections of the given pools, e.g. after SIGUSR1.
+
+    :param connection_pools: List of GossipConnectionPool
+    """
+    for connection_pool in connection_pools:
+        logging.warning('%s | Connection stats:\n%s', connection_pool.connection_pool_label,
+                        connection_pool.format_stats())
+
+
 def main():
     cli_parser = ArgumentParser()
     cli_parser.add_argument('-c', '--config', help='Configuration file path', default=DEFAULT_CONFIG_PATH)
@@ -83,54 +101,115 @@ def main():
 
     api_server_address = gossip_config['api_address']
     p2p_server_address = gossip_config['listen_address']
-    bootstrapper_address = gossip_config['bootstrapper']
+    bootstrapper_addresses = gossip_config['bootstrappers']
     max_connections = gossip_config['max_connections']
     cache_size = gossip_config['cache_size']
     max_ttl = gossip_config['max_ttl']
-
-    api_connection_pool = GossipConnectionPool('APIConnectionPool', cache_size=max_connections)
-    p2p_connection_pool = GossipConnectionPool('P2PConnectionPool', cache_size=max_connections)
-    announce_message_cache = GossipMessageCache('AnnounceMessageCache', cache_size=cache_size)
-    update_message_cache = GossipMessageCache('UpdateMessageCache', cache_size=cache_size)
-
-    api_registration_handler = APIRegistrationHandler()
+    channel_type = gossip_config['channel']
+    deployment_mode = gossip_config['deployment']
+    controller_shards = gossip_config['controller_shards']
+    receiver_workers = gossip_config['receiver_workers']
+    fanout = gossip_config['fanout']
+    forward_budget = gossip_config['forward_budget']
+    broadcast = gossip_config['broadcast']
+    graft_timeout = gossip_config['graft_timeout']
+    passive_view_size = gossip_config['passive_view_size']
+    shuffle_interval = gossip_config['shuffle_interval']
+    anti_entropy_interval = gossip_config['anti_entropy_interval']
+    anti_entropy_budget = gossip_config['anti_entropy_budget']
+    peer_delta_interval = gossip_config['peer_delta_interval']
+    peer_response_size = gossip_config['peer_response_size']
+    random_walk_length = gossip_config['random_walk_length']
+    address_book_path = gossip_config['address_book']
+    ping_interval = gossip_config['ping_interval']
+    keepalive_timeout = gossip_config['keepalive_timeout']
+    connection_headroom = gossip_config['connection_headroom']
+    eviction_policy = gossip_config['eviction_policy']
+    runtime = GossipRuntime(deployment_mode)
+    shared = runtime.shared
+    logging.info('Deploying gossip layers as %s', deployment_mode)
+
+    api_connection_pool = GossipConnectionPool('APIConnectionPool', cache_size=max_connections, shared=shared)
+    # Peers which do not fit into the P2P connection pool (active view) are kept in the passive view
+    p2p_passive_view = GossipPassiveView('P2PPassiveView', view_size=passive_view_size, shared=shared)
+    p2p_connection_pool = GossipConnectionPool('P2PConnectionPool', cache_size=max_connections, shared=shared,
+                                               passive_view=p2p_passive_view, headroom=connection_headroom,
+                                               eviction_policy=create_eviction_policy(eviction_policy))
+    announce_message_cache = create_message_cache('AnnounceMessageCache', cache_size=cache_size, shared=shared,
+                                                  shard_count=controller_shards)
+    update_message_cache = create_message_cache('UpdateMessageCache', cache_size=cache_size, shared=shared,
+                                                shard_count=controller_shards)
+
+    api_registration_handler = APIRegistrationHandler(shared=shared)
 
     # Layers for incoming API connections/messages
-    api_to_controller = Queue()
+    api_to_controller = create_channel(channel_type, shared=shared)
+    api_receiver_pool = create_receiver_pool('APIClientReceiver', receiver_workers, api_to_controller,
+                                             api_connection_pool)
     api_server = GossipServer('APIServer', 'APIClientReceiver', api_server_address['host'], api_server_address['port'],
-                              api_to_controller, api_connection_pool)
-    controller_to_p2p = Queue()
-    controller_to_api = Queue()
+                              api_to_controller, api_connection_pool, receiver_pool=api_receiver_pool)
+    controller_to_p2p = create_channel(channel_type, shared=shared)
+    controller_to_api = create_channel(channel_type, shared=shared)
     api_controller = APIController(api_to_controller, controller_to_api, controller_to_p2p, api_connection_pool,
-                                   p2p_connection_pool, announce_message_cache, api_registration_handler)
-    p2p_to_controller = Queue()
-    p2p_sender = GossipSender('P2PSender', controller_to_p2p, p2p_to_controller, p2p_connection_pool)
+                                   p2p_connection_pool, announce_message_cache, api_registration_handler,
+                                   fanout=fanout, forward_budget=forward_budget, broadcast=broadcast)
+    # With several P2P controller shards, every shard gets its own channel and the receivers use a router
+    p2p_to_controller_shards = [create_channel(channel_type, shared=shared) for _ in range(controller_shards)]
+    if controller_shards > 1:
+        p2p_to_controller = GossipShardRouter(p2p_to_controller_shards)
+    else:
+        p2p_to_controller = p2p_to_controller_shards[0]
+    # Incoming and outgoing P2P connections share the same receivers
+    p2p_receiver_pool = create_receiver_pool('P2PClientReceiver', receiver_workers, p2p_to_controller,
+                                             p2p_connection_pool)
+    p2p_sender = GossipSender('P2PSender', controller_to_p2p, p2p_to_controller, p2p_connection_pool,
+                              receiver_pool=p2p_receiver_pool)
 
     # Layers for incoming P2P connections/messages
     p2p_server = GossipServer('P2PServer', 'P2PClientReceiver', p2p_server_address['host'], p2p_server_address['port'],
-                              p2p_to_controller, p2p_connection_pool)
-    p2p_controller = P2PController(p2p_to_controller, controller_to_p2p, controller_to_api, p2p_connection_pool,
-                                   p2p_server_address, announce_message_cache, update_message_cache,
-                                   api_registration_handler, max_ttl, bootstrapper_address=bootstrapper_address)
+                              p2p_to_controller, p2p_connection_pool, receiver_pool=p2p_receiver_pool)
+    # The shards share the versions of the membership events, since peer deltas are routed by connection. They also
+    # share the missing messages and the pending peer requests: an IHAVE and its announce resp. a peer request and its
+    # response may be handled by different shards.
+    membership_versions, missing_messages, peer_request_pages = None, None, None
+    if controller_shards > 1:
+        membership_versions = GossipMembershipVersions(shared=shared)
+        missing_messages = GossipMissingMessages(graft_timeout, shared=shared)
+        peer_request_pages = Manager().dict() if shared else {}
+    # Only the first shard bootstraps, keeps the address book, shuffles, pings and starts anti-entropy rounds
+    p2p_controllers = [P2PController(p2p_to_controller_shards[shard_index], controller_to_p2p, controller_to_api,
+                                     p2p_connection_pool, p2p_server_address, announce_message_cache,
+                                     update_message_cache, api_registration_handler, max_ttl,
+                                     bootstrapper_addresses=bootstrapper_addresses if shard_index == 0 else None,
+                                     forward_budget=forward_budget, broadcast=broadcast, graft_timeout=graft_timeout,
+                                     passive_view=p2p_passive_view,
+                                     shuffle_interval=shuffle_interval if shard_index == 0 else 0,
+                                     anti_entropy_interval=anti_entropy_interval if shard_index == 0 else 0,
+                                     anti_entropy_budget=anti_entropy_budget, peer_delta_interval=peer_delta_interval,
+                                     peer_response_size=peer_response_size, random_walk_length=random_walk_length,
+                                     address_book_path=address_book_path if shard_index == 0 else None,
+                                     ping_interval=ping_interval if shard_index == 0 else 0,
+                                     keepalive_timeout=keepalive_timeout, membership_versions=membership_versions,
+                                     missing_messages=missing_messages, peer_request_pages=peer_request_pages)
+                       for shard_index in range(controller_shards)]
     api_sender = GossipSender('APISender', controller_to_api, api_to_controller, api_connection_pool)
 
-    api_server.start()
-    api_controller.start()
-    p2p_sender.start()
-    p2p_server.start()
-    p2p_controller.start()
-    api_sender.start()
-
-    api_server.join()
-    api_controller.join()
-    p2p_sender.join()
-    p2p_server.join()
-    p2p_controller.join()
-    api_sender.join()
+    workers = [api_server, api_controller, p2p_sender, p2p_server] + p2p_controllers + [api_sender]
+    for receiver_pool in [api_receiver_pool, p2p_receiver_pool]:
+        if receiver_pool:
+            workers += receiver_pool.workers
+    for worker in workers:
+        worker.start(runtime)
+    # Registered after starting the workers, so that only the main process dumps the stats tables
+    signal.signal(signal.SIGUSR1, lambda signum, frame: log_connection_stats([p2p_connection_pool,
+                                                                              api_connection_pool]))
+    for worker in workers:
+        worker.join()
 
     # Handle exit codes
-    exit_codes = api_server.exitcode | api_controller.exitcode | p2p_sender.exitcode
-    exit_codes = exit_codes | p2p_server.exitcode | p2p_controller.exitcode | api_sender.exitcode
+    exit_codes = 0
+    for worker in workers:
+        exit_codes |= worker.exitcode
 
     if exit_codes > 0:
         logging.error('Gossip subprocess exited with return code %d', exit_codes)
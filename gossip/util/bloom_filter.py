@@ -0,0 +1,82 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Probability that a digest which has not been added is reported to be contained in a Bloom filter """
+FALSE_POSITIVE_RATE = 0.01
+
+""" Min. amount of bytes of a Bloom filter """
+MIN_BLOOM_FILTER_SIZE = 8
+
+
+class GossipBloomFilter:
+    """ Compact summary of a set of message digests. A Bloom filter never misses a digest which has been added, but it
+    may report a digest which has not been added (false positive). Since message digests are hash values already, the
+    bit positions are derived from the digest itself by means of double hashing. """
+
+    def __init__(self, size, hash_count, bits=None):
+        """ Constructor.
+
+        :param size: Amount of bytes of the filter
+        :param hash_count: Amount of bits which are set per digest
+        :param bits: (optional) Content of an existing filter, e.g. a received one
+        """
+        if size <= 0 or hash_count <= 0:
+            raise ValueError('Size and hash count of a Bloom filter must be positive')
+        self.hash_count = hash_count
+        self.bits = bytearray(bits) if bits is not None else bytearray(size)
+        if len(self.bits) != size:
+            raise ValueError('Bloom filter must have a size of %d bytes' % size)
+
+    def __positions(self, digest):
+        bit_count = len(self.bits) * 8
+        first_hash = int.from_bytes(digest[:4], 'big')
+        second_hash = int.from_bytes(digest[4:], 'big') | 1
+        return [(first_hash + i * second_hash) % bit_count for i in range(self.hash_count)]
+
+    def add(self, digest):
+        """ Adds a digest to the filter.
+
+        :param digest: The digest of a message (see MessageGossip.get_digest)
+        """
+        for position in self.__positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(digest))
+
+    def __len__(self):
+        return len(self.bits)
+
+
+def create_bloom_filter(digests, max_size, false_positive_rate=FALSE_POSITIVE_RATE):
+    """ Creates a Bloom filter which contains the given digests. The filter is sized for the given false positive rate,
+    unless this exceeds the max. size.
+
+    :param digests: List of message digests
+    :param max_size: Max. amount of bytes of the filter
+    :param false_positive_rate: (optional) Desired probability of false positives
+    :returns: A GossipBloomFilter
+    """
+    digest_count = max(len(digests), 1)
+    bit_count = -digest_count * math.log(false_positive_rate) / (math.log(2) ** 2)
+    size = min(max(int(math.ceil(bit_count / 8)), MIN_BLOOM_FILTER_SIZE), max_size)
+    hash_count = min(max(int(round(size * 8 / digest_count * math.log(2))), 1), 0xff)
+    bloom_filter = GossipBloomFilter(size, hash_count)
+    for digest in digests:
+        bloom_filter.add(digest)
+    return bloom_filter
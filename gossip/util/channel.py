@@ -0,0 +1,152 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import time
+from collections import deque
+from multiprocessing import Pipe, Lock, Queue
+from multiprocessing.reduction import ForkingPickler
+from queue import Empty, Queue as LocalQueue
+
+from gossip.util.exceptions import GossipChannelClosedException
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+CHANNEL_TYPE_QUEUE = 'queue'
+CHANNEL_TYPE_PIPE = 'pipe'
+
+_END_OF_STREAM = 'EndOfStream'
+
+
+class GossipPipeChannel:
+    """ Process-safe FIFO channel which connects two Gossip layers. In contrast to multiprocessing.Queue there is no
+    feeder thread: Items are pickled and written to a pipe directly by the putting process. Several items can be
+    written as one frame (bulk framing), the receiving side buffers them and hands them out one by one.
+
+    Each channel is meant to be consumed by exactly one layer. Because there is no feeder thread buffering the items, a
+    full pipe blocks the putting process until the consuming layer catches up. """
+
+    def __init__(self):
+        """ Constructor. """
+        self._reader, self._writer = Pipe(duplex=False)
+        self._read_lock = Lock()
+        self._write_lock = Lock()
+        self._received_items = deque()
+        self._closed = False
+
+    def put(self, item):
+        """ Puts a single item into the channel.
+
+        :param item: Any picklable object
+        """
+        self.put_many([item])
+
+    def put_many(self, items):
+        """ Puts several items into the channel using one single frame.
+
+        :param items: An iterable of picklable objects, the order is preserved
+        """
+        frame = ForkingPickler.dumps(list(items))
+        self._write_lock.acquire()
+        try:
+            self._writer.send_bytes(frame)
+        finally:
+            self._write_lock.release()
+
+    def get(self, block=True, timeout=None):
+        """ Removes and returns the next item from the channel. The signature mirrors multiprocessing.Queue.get.
+
+        :param block: (optional) Wait for the next item if the channel is empty
+        :param timeout: (optional) Max. amount of seconds to wait for the next item
+        :returns: The next item
+        :raises queue.Empty: If no item arrived in time
+        :raises GossipChannelClosedException: If the channel has been closed and all items have been consumed
+        """
+        if not self._received_items:
+            self.__receive_frame(block, timeout)
+        if not self._received_items:
+            raise GossipChannelClosedException('Channel has been closed')
+        return self._received_items.popleft()
+
+    def close(self):
+        """ Closes the channel. Items which have been put before are still delivered, afterwards every call of get
+        raises a GossipChannelClosedException. """
+        self._write_lock.acquire()
+        try:
+            self._writer.send_bytes(ForkingPickler.dumps(_END_OF_STREAM))
+        finally:
+            self._write_lock.release()
+
+    def __receive_frame(self, block, timeout):
+        """ Reads the next frame from the pipe and buffers its items.
+
+        :param block: Wait for the next frame if the pipe is empty
+        :param timeout: Max. amount of seconds to wait for the next frame
+        """
+        if self._closed:
+            raise GossipChannelClosedException('Channel has been closed')
+        if not block:
+            timeout = 0
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        if not self._read_lock.acquire(True, timeout):
+            raise Empty
+        try:
+            if deadline is not None and not self._reader.poll(max(0, deadline - time.monotonic())):
+                raise Empty
+            frame = pickle.loads(self._reader.recv_bytes())
+        finally:
+            self._read_lock.release()
+
+        if frame == _END_OF_STREAM:
+            self._closed = True
+        else:
+            self._received_items.extend(frame)
+
+
+def put_many(channel, items):
+    """ Puts several items into a channel. Channels which support bulk framing (GossipPipeChannel, GossipShardRouter)
+    get all items at once, the other ones get them one by one.
+
+    :param channel: The channel to put the items into
+    :param items: An iterable of picklable objects, the order is preserved
+    """
+    items = list(items)
+    if not items:
+        return
+    if hasattr(channel, 'put_many'):
+        channel.put_many(items)
+    else:
+        for item in items:
+            channel.put(item)
+
+
+def create_channel(channel_type=CHANNEL_TYPE_QUEUE, shared=True):
+    """ Creates a new channel which connects two Gossip layers.
+
+    :param channel_type: (optional) CHANNEL_TYPE_QUEUE for multiprocessing.Queue, CHANNEL_TYPE_PIPE for a
+                         GossipPipeChannel
+    :param shared: (optional) If False, both layers live in the current process and a plain queue.Queue is used
+                   regardless of the channel type
+    :returns: The new channel, which provides at least put(item) and get(block=True, timeout=None)
+    """
+    if channel_type not in [CHANNEL_TYPE_QUEUE, CHANNEL_TYPE_PIPE]:
+        raise ValueError('Unknown channel type: %s' % channel_type)
+
+    if not shared:
+        return LocalQueue()
+    elif channel_type == CHANNEL_TYPE_QUEUE:
+        return Queue()
+    elif channel_type == CHANNEL_TYPE_PIPE:
+        return GossipPipeChannel()
@@ -15,6 +15,13 @@
 from configparser import RawConfigParser
 import logging
 
+from gossip.communication.eviction import EVICTION_POLICY_SCORE, EVICTION_POLICIES
+from gossip.control.broadcast import BROADCAST_MODE_FANOUT, BROADCAST_MODES
+from gossip.control.membership import PEER_DELTA_INTERVAL
+from gossip.util.channel import CHANNEL_TYPE_QUEUE
+
+from gossip.util.runtime import DEPLOYMENT_MODE_PROCESSES
+
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
 
@@ -43,14 +50,48 @@ def read_config(config_path):
     hostkey = config_parser.get('GLOBAL', 'HOSTKEY')
     cache_size = config_parser.getint('GOSSIP', 'cache_size')
     max_connections = config_parser.getint('GOSSIP', 'max_connections')
-    bootstrapper = split_host_address(config_parser.get('GOSSIP', 'bootstrapper'))
+    bootstrappers = [split_host_address(host_address.strip())
+                     for host_address in config_parser.get('GOSSIP', 'bootstrapper').split(',')]
+    bootstrappers = [bootstrapper for bootstrapper in bootstrappers if bootstrapper]
     listen_address = split_host_address(config_parser.get('GOSSIP', 'listen_address'))
     api_address = split_host_address(config_parser.get('GOSSIP', 'api_address'))
     max_ttl = int(config_parser.get('GOSSIP', 'max_ttl'))
+    channel = config_parser.get('GOSSIP', 'channel', fallback=CHANNEL_TYPE_QUEUE)
+    deployment = config_parser.get('GOSSIP', 'deployment', fallback=DEPLOYMENT_MODE_PROCESSES)
+    controller_shards = config_parser.getint('GOSSIP', 'controller_shards', fallback=1)
+    receiver_workers = config_parser.getint('GOSSIP', 'receiver_workers', fallback=2)
+    fanout = config_parser.getint('GOSSIP', 'fanout', fallback=4)
+    forward_budget = config_parser.getint('GOSSIP', 'forward_budget', fallback=0)
+    broadcast = config_parser.get('GOSSIP', 'broadcast', fallback=BROADCAST_MODE_FANOUT)
+    if broadcast not in BROADCAST_MODES:
+        raise ValueError('Unknown broadcast mode: %s' % broadcast)
+    graft_timeout = config_parser.getfloat('GOSSIP', 'graft_timeout', fallback=1.0)
+    passive_view_size = config_parser.getint('GOSSIP', 'passive_view_size', fallback=60)
+    shuffle_interval = config_parser.getfloat('GOSSIP', 'shuffle_interval', fallback=30.0)
+    anti_entropy_interval = config_parser.getfloat('GOSSIP', 'anti_entropy_interval', fallback=10.0)
+    anti_entropy_budget = config_parser.getint('GOSSIP', 'anti_entropy_budget', fallback=4096)
+    peer_delta_interval = config_parser.getfloat('GOSSIP', 'peer_delta_interval', fallback=PEER_DELTA_INTERVAL)
+    peer_response_size = config_parser.getint('GOSSIP', 'peer_response_size', fallback=16)
+    random_walk_length = config_parser.getint('GOSSIP', 'random_walk_length', fallback=3)
+    address_book = config_parser.get('GOSSIP', 'address_book', fallback='') or None
+    ping_interval = config_parser.getfloat('GOSSIP', 'ping_interval', fallback=5.0)
+    keepalive_timeout = config_parser.getfloat('GOSSIP', 'keepalive_timeout', fallback=20.0)
+    connection_headroom = config_parser.getint('GOSSIP', 'connection_headroom', fallback=3)
+    eviction_policy = config_parser.get('GOSSIP', 'eviction_policy', fallback=EVICTION_POLICY_SCORE)
+    if eviction_policy not in EVICTION_POLICIES:
+        raise ValueError('Unknown eviction policy: %s' % eviction_policy)
 
     # Build dictionary
     config = {'hostkey': hostkey, 'cache_size': cache_size, 'max_connections': max_connections,
-              'bootstrapper': bootstrapper, 'listen_address': listen_address, 'api_address': api_address,
-              'max_ttl': max_ttl}
+              'bootstrappers': bootstrappers, 'listen_address': listen_address, 'api_address': api_address,
+              'max_ttl': max_ttl, 'channel': channel, 'deployment': deployment,
+              'controller_shards': controller_shards, 'receiver_workers': receiver_workers, 'fanout': fanout,
+              'forward_budget': forward_budget, 'broadcast': broadcast, 'graft_timeout': graft_timeout,
+              'passive_view_size': passive_view_size, 'shuffle_interval': shuffle_interval,
+              'anti_entropy_interval': anti_entropy_interval, 'anti_entropy_budget': anti_entropy_budget,
+              'peer_delta_interval': peer_delta_interval, 'peer_response_size': peer_response_size,
+              'random_walk_length': random_walk_length, 'address_book': address_book, 'ping_interval': ping_interval,
+              'keepalive_timeout': keepalive_timeout, 'connection_headroom': connection_headroom,
+              'eviction_policy': eviction_policy}
 
     return config
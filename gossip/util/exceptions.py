@@ -38,3 +38,8 @@ class GossipQueueException(Exception):
 class GossipIdentifierNotFound(Exception):
     def __init__(self, msg):
         super().__init__(msg)
+
+
+class GossipChannelClosedException(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
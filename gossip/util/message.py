@@ -12,17 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import struct
 from abc import ABCMeta
 
 from gossip.util.message_code import MESSAGE_CODE_ANNOUNCE, MESSAGE_CODE_PEER_REQUEST, MESSAGE_CODE_PEER_RESPONSE, \
     MESSAGE_CODE_NOTIFICATION, MESSAGE_CODE_NOTIFY, MESSAGE_CODE_PEER_UPDATE, MESSAGE_CODE_VALIDATION, \
-    MESSAGE_CODE_PEER_INIT
+    MESSAGE_CODE_PEER_INIT, MESSAGE_CODE_IHAVE, MESSAGE_CODE_TREE_UPDATE, MESSAGE_CODE_IWANT, MESSAGE_CODE_SUMMARY, \
+    MESSAGE_CODE_PEER_DELTA, MESSAGE_CODE_PING
 
+from gossip.util.bloom_filter import GossipBloomFilter
 from gossip.util.byte_formatting import short_to_bytes, bytes_to_short
+from gossip.util.peer_address import GossipPeerAddress, PEER_ADDRESS_SIZE
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
+""" Amount of bytes of a message digest """
+DIGEST_SIZE = 8
+
+""" Amount of bytes of one entry of a peer delta: IPv4 address, port, ttl, update type and version """
+PEER_DELTA_ENTRY_SIZE = 10
+
+""" Flag within the last byte of a peer request, which marks requests forwarded on behalf of the requesting peer """
+PEER_REQUEST_FORWARDED = 0x80
+
 
 class MessageGossip:
     """
@@ -64,6 +77,15 @@ class MessageGossip:
         """
         return '%s' % self.get_values()
 
+    def get_digest(self):
+        """
+        Method by which a compact, network-wide identifier of this message is computed. Two messages which are equal
+        have the same digest.
+
+        :return: DIGEST_SIZE bytes
+        """
+        return hashlib.blake2b(short_to_bytes(self.code) + self.data, digest_size=DIGEST_SIZE).digest()
+
     def encode(self):
         """
         Encodes this message into a byte array
@@ -162,6 +184,15 @@ class MessageGossipAnnounce(MessageGossip):
         """
         return {'message': self.msg, 'code': self.code, 'TTL': self.ttl, 'type': self.data_type}
 
+    def get_digest(self):
+        """
+        Method by which a compact, network-wide identifier of this message is computed. The TTL is not part of the
+        digest because it changes on every hop.
+
+        :return: DIGEST_SIZE bytes
+        """
+        return hashlib.blake2b(short_to_bytes(self.code) + self.data[2:], digest_size=DIGEST_SIZE).digest()
+
     def __hash__(self):
         return hash((self.msg, self.code, self.data_type))
 
@@ -266,15 +297,15 @@ class MessageGossipPeerRequest(MessageGossip51x):
         """
         super().__init__(MESSAGE_CODE_PEER_REQUEST, data)
         self.data = data
-        ipv4_part_1 = int(self.data[0])
-        ipv4_part_2 = int(self.data[1])
-        ipv4_part_3 = int(self.data[2])
-        ipv4_part_4 = int(self.data[3])
-        port = bytes_to_short(self.data[4], self.data[5])
-        self.address = '%s.%s.%s.%s:%s' % (ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4, port)
+        self.address = GossipPeerAddress(self.data[:PEER_ADDRESS_SIZE])
+        self.page = int(self.data[6]) if len(self.data) > 6 else 0
+        walk = int(self.data[7]) if len(self.data) > 7 else 0
+        self.walk_length = walk & ~PEER_REQUEST_FORWARDED
+        self.forwarded = bool(walk & PEER_REQUEST_FORWARDED)
 
     def get_values(self):
-        return {'code': MESSAGE_CODE_PEER_REQUEST, 'p2p_server_address': self.address}
+        return {'code': MESSAGE_CODE_PEER_REQUEST, 'p2p_server_address': self.address, 'page': self.page,
+                'walk_length': self.walk_length, 'forwarded': self.forwarded}
 
 
 class MessageGossipPeerUpdate(MessageGossip51x):
@@ -290,12 +321,7 @@ class MessageGossipPeerUpdate(MessageGossip51x):
         """
         super().__init__(MESSAGE_CODE_PEER_UPDATE, data)
         self.data = data
-        ipv4_part_1 = int(self.data[0])
-        ipv4_part_2 = int(self.data[1])
-        ipv4_part_3 = int(self.data[2])
-        ipv4_part_4 = int(self.data[3])
-        port = bytes_to_short(self.data[4], self.data[5])
-        self.address = '%s.%s.%s.%s:%s' % (ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4, port)
+        self.address = GossipPeerAddress(self.data[:PEER_ADDRESS_SIZE])
         self.ttl = int(self.data[6])
         self.update_type = int(self.data[7])
 
@@ -308,6 +334,16 @@ class MessageGossipPeerUpdate(MessageGossip51x):
         return {'code': MESSAGE_CODE_PEER_UPDATE, 'address': self.address, 'ttl': self.ttl,
                 'update_type': self.update_type}
 
+    def get_digest(self):
+        """
+        Method by which a compact, network-wide identifier of this message is computed. The TTL is not part of the
+        digest because it changes on every hop.
+
+        :return: DIGEST_SIZE bytes
+        """
+        return hashlib.blake2b(short_to_bytes(self.code) + self.data[:6] + self.data[7:8],
+                               digest_size=DIGEST_SIZE).digest()
+
     def __hash__(self):
         return hash((self.address, self.update_type))
 
@@ -321,7 +357,7 @@ class MessageGossipPeerUpdate(MessageGossip51x):
 class MessageGossipPeerResponse(MessageGossip51x):
     """
         Message that is sent as an answer to a previously sent peer request.
-        It contains a list of server identifiers (address:port)
+        It contains a list of server identifiers (GossipPeerAddress)
     """
 
     def __init__(self, data):
@@ -332,17 +368,10 @@ class MessageGossipPeerResponse(MessageGossip51x):
         """
         super().__init__(MESSAGE_CODE_PEER_RESPONSE, data)
         self.data = data
-        self.connections = []
-        if len(self.data) > 0:
-            data = struct.unpack('{}B'.format(len(self.data)), self.data)
-            for i in range(0, len(self.data), 6):
-                ipv4_part_1 = int(data[i])
-                ipv4_part_2 = int(data[i + 1])
-                ipv4_part_3 = int(data[i + 2])
-                ipv4_part_4 = int(data[i + 3])
-                port = bytes_to_short(self.data[i + 4], self.data[i + 5])
-                address = '%s.%s.%s.%s:%s' % (ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4, port)
-                self.connections.append(address)
+        if len(self.data) % PEER_ADDRESS_SIZE != 0:
+            raise ValueError('Invalid size of peer response')
+        self.connections = [GossipPeerAddress(self.data[i:i + PEER_ADDRESS_SIZE])
+                            for i in range(0, len(self.data), PEER_ADDRESS_SIZE)]
 
     def get_values(self):
         """
@@ -353,6 +382,39 @@ class MessageGossipPeerResponse(MessageGossip51x):
         return {'code': MESSAGE_CODE_PEER_RESPONSE, 'data': self.connections}
 
 
+class MessageGossipPeerDelta(MessageGossip51x):
+    """
+        Message that carries several membership events (peer found/lost) at once, every event has a version per
+        address
+    """
+
+    def __init__(self, data):
+        """
+        C'Tor
+
+        :param data: the data from this message
+        """
+        super().__init__(MESSAGE_CODE_PEER_DELTA, data)
+        self.data = data
+        if len(self.data) < 2 or (len(self.data) - 2) % PEER_DELTA_ENTRY_SIZE != 0:
+            raise ValueError('Invalid size of peer delta')
+        self.entries = []
+        for i in range(2, len(self.data), PEER_DELTA_ENTRY_SIZE):
+            entry = self.data[i:i + PEER_DELTA_ENTRY_SIZE]
+            self.entries.append({'address': GossipPeerAddress(entry[:PEER_ADDRESS_SIZE]),
+                                 'ttl': int(entry[6]),
+                                 'update_type': int(entry[7]),
+                                 'version': bytes_to_short(entry[8], entry[9])})
+
+    def get_values(self):
+        """
+        Method by which the values of this message are retrieved
+
+        :return: a dictionary with the values of this message (keys: code, entries)
+        """
+        return {'code': MESSAGE_CODE_PEER_DELTA, 'entries': self.entries}
+
+
 class MessageGossipPeerInit(MessageGossip51x):
     """
         Initial message that is sent from the connection peer to the remote peer
@@ -367,12 +429,7 @@ class MessageGossipPeerInit(MessageGossip51x):
         """
         super().__init__(MESSAGE_CODE_PEER_INIT, data)
         self.data = data
-        ipv4_part_1 = int(self.data[0])
-        ipv4_part_2 = int(self.data[1])
-        ipv4_part_3 = int(self.data[2])
-        ipv4_part_4 = int(self.data[3])
-        port = bytes_to_short(self.data[4], self.data[5])
-        self.address = '%s.%s.%s.%s:%s' % (ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4, port)
+        self.address = GossipPeerAddress(self.data[:PEER_ADDRESS_SIZE])
 
     def get_values(self):
         """
@@ -383,6 +440,149 @@ class MessageGossipPeerInit(MessageGossip51x):
         return {'code': MESSAGE_CODE_PEER_INIT, 'p2p_server_address': self.address}
 
 
+class MessageGossipDigests(MessageGossip51x):
+    """
+        Baseclass for messages which carry a type, a reserved byte and a list of message digests
+    """
+
+    def __init__(self, code, data):
+        """
+        C'Tor
+
+        :param code: the code of this message
+        :param data: the data from this message
+        """
+        super().__init__(code, data)
+        self.data = data
+        if len(self.data) < 2 or (len(self.data) - 2) % DIGEST_SIZE != 0:
+            raise ValueError('Invalid size of digest list')
+        self.digest_type = int(self.data[0])
+        self.digests = [bytes(self.data[i:i + DIGEST_SIZE]) for i in range(2, len(self.data), DIGEST_SIZE)]
+
+
+class MessageGossipIHave(MessageGossipDigests):
+    """
+        Message that is sent from one peer to another to advertise the digests of messages it has, so that the other
+        peer is able to fetch the messages it misses
+    """
+
+    def __init__(self, data):
+        """
+        C'Tor
+
+        :param data: the data from this message
+        """
+        super().__init__(MESSAGE_CODE_IHAVE, data)
+
+    def get_values(self):
+        """
+        Method by which the values of this message are retrieved
+
+        :return: a dictionary with the values of this message (keys: code, ihave_type, digests)
+        """
+        return {'code': MESSAGE_CODE_IHAVE, 'ihave_type': self.digest_type, 'digests': self.digests}
+
+
+class MessageGossipIWant(MessageGossipDigests):
+    """
+        Message that is sent as an answer to an IHAVE to request the advertised messages which are missing
+    """
+
+    def __init__(self, data):
+        """
+        C'Tor
+
+        :param data: the data from this message
+        """
+        super().__init__(MESSAGE_CODE_IWANT, data)
+
+    def get_values(self):
+        """
+        Method by which the values of this message are retrieved
+
+        :return: a dictionary with the values of this message (keys: code, digests)
+        """
+        return {'code': MESSAGE_CODE_IWANT, 'digests': self.digests}
+
+
+class MessageGossipTreeUpdate(MessageGossipDigests):
+    """
+        Message that is sent from one peer to another to change the type of their link within the broadcast tree.
+        A PRUNE turns the link into a lazy link, a GRAFT turns it into an eager link and requests missing messages.
+    """
+
+    def __init__(self, data):
+        """
+        C'Tor
+
+        :param data: the data from this message
+        """
+        super().__init__(MESSAGE_CODE_TREE_UPDATE, data)
+
+    def get_values(self):
+        """
+        Method by which the values of this message are retrieved
+
+        :return: a dictionary with the values of this message (keys: code, update_type, digests)
+        """
+        return {'code': MESSAGE_CODE_TREE_UPDATE, 'update_type': self.digest_type, 'digests': self.digests}
+
+
+class MessageGossipSummary(MessageGossip51x):
+    """
+        Message that is sent to a new connected peer to summarize the messages we have, so that the peer only sends
+        the messages which are missing
+    """
+
+    def __init__(self, data):
+        """
+        C'Tor
+
+        :param data: the data from this message
+        """
+        super().__init__(MESSAGE_CODE_SUMMARY, data)
+        self.data = data
+        if len(self.data) < 3 or int(self.data[0]) == 0:
+            raise ValueError('Invalid summary')
+        self.bloom_filter = GossipBloomFilter(len(self.data) - 2, int(self.data[0]), bits=self.data[2:])
+
+    def get_values(self):
+        """
+        Method by which the values of this message are retrieved
+
+        :return: a dictionary with the values of this message (keys: code, bloom_filter)
+        """
+        return {'code': MESSAGE_CODE_SUMMARY, 'bloom_filter': self.bloom_filter}
+
+
+class MessageGossipPing(MessageGossip51x):
+    """
+        Message that is sent from one peer to another to measure the RTT of their connection. A ping is answered with
+        a pong which echoes the timestamp of the ping.
+    """
+
+    def __init__(self, data):
+        """
+        C'Tor
+
+        :param data: the data from this message
+        """
+        super().__init__(MESSAGE_CODE_PING, data)
+        self.data = data
+        if len(self.data) != 10:
+            raise ValueError('Invalid size of ping')
+        self.ping_type = int(self.data[0])
+        self.timestamp = int.from_bytes(self.data[2:], 'big')
+
+    def get_values(self):
+        """
+        Method by which the values of this message are retrieved
+
+        :return: a dictionary with the values of this message (keys: code, ping_type, timestamp)
+        """
+        return {'code': MESSAGE_CODE_PING, 'ping_type': self.ping_type, 'timestamp': self.timestamp}
+
+
 """ Dictionary of all known message types within Gossip """
 GOSSIP_MESSAGE_TYPES = {MESSAGE_CODE_ANNOUNCE: MessageGossipAnnounce,
                         MESSAGE_CODE_NOTIFY: MessageGossipNotify,
@@ -391,4 +591,10 @@ GOSSIP_MESSAGE_TYPES = {MESSAGE_CODE_ANNOUNCE: MessageGossipAnnounce,
                         MESSAGE_CODE_PEER_REQUEST: MessageGossipPeerRequest,
                         MESSAGE_CODE_PEER_RESPONSE: MessageGossipPeerResponse,
                         MESSAGE_CODE_PEER_UPDATE: MessageGossipPeerUpdate,
-                        MESSAGE_CODE_PEER_INIT: MessageGossipPeerInit}
+                        MESSAGE_CODE_PEER_INIT: MessageGossipPeerInit,
+                        MESSAGE_CODE_IHAVE: MessageGossipIHave,
+                        MESSAGE_CODE_TREE_UPDATE: MessageGossipTreeUpdate,
+                        MESSAGE_CODE_IWANT: MessageGossipIWant,
+                        MESSAGE_CODE_SUMMARY: MessageGossipSummary,
+                        MESSAGE_CODE_PEER_DELTA: MessageGossipPeerDelta,
+                        MESSAGE_CODE_PING: MessageGossipPing}
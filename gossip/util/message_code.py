@@ -23,6 +23,12 @@ MESSAGE_CODE_PEER_REQUEST = 510
 MESSAGE_CODE_PEER_RESPONSE = 511
 MESSAGE_CODE_PEER_UPDATE = 512
 MESSAGE_CODE_PEER_INIT = 513
+MESSAGE_CODE_IHAVE = 514
+MESSAGE_CODE_TREE_UPDATE = 515
+MESSAGE_CODE_IWANT = 516
+MESSAGE_CODE_SUMMARY = 517
+MESSAGE_CODE_PEER_DELTA = 518
+MESSAGE_CODE_PING = 519
 
 MESSAGE_CODE_GOSSIP_MIN = 500
 MESSAGE_CODE_GOSSIP_MAX = 520
@@ -18,8 +18,12 @@ import struct
 from gossip.util.exceptions import GossipMessageException, GossipClientDisconnectedException
 from gossip.util.message_code import MESSAGE_CODE_ANNOUNCE, MESSAGE_CODE_PEER_REQUEST, MESSAGE_CODE_PEER_RESPONSE, \
     MESSAGE_CODE_NOTIFICATION, MESSAGE_CODE_NOTIFY, MESSAGE_CODE_PEER_UPDATE, MESSAGE_CODE_VALIDATION, \
-    MESSAGE_CODE_GOSSIP_MAX, MESSAGE_CODE_GOSSIP_MIN, MESSAGE_CODE_PEER_INIT
+    MESSAGE_CODE_GOSSIP_MAX, MESSAGE_CODE_GOSSIP_MIN, MESSAGE_CODE_PEER_INIT, MESSAGE_CODE_IHAVE, \
+    MESSAGE_CODE_TREE_UPDATE, MESSAGE_CODE_IWANT, MESSAGE_CODE_SUMMARY, MESSAGE_CODE_PEER_DELTA, MESSAGE_CODE_PING
 from gossip.util.byte_formatting import bytes_to_short, short_to_bytes
+from gossip.util.message import DIGEST_SIZE, PEER_DELTA_ENTRY_SIZE, PEER_REQUEST_FORWARDED
+from gossip.util.peer_address import PEER_ADDRESS_SIZE
+
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
@@ -96,38 +100,45 @@ def pack_gossip_validation(msg_id, valid_bit):
     return {'code': MESSAGE_CODE_VALIDATION, 'data': b_msg_id + bytes([0]) + b_valid_bit}
 
 
-def pack_gossip_peer_request(address_port):
+""" Max. page index of a peer request """
+MAX_PEER_REQUEST_PAGE = 0xff
+
+""" Max. amount of hops of a random walk, the highest bit of the walk byte marks forwarded peer requests """
+MAX_RANDOM_WALK_LENGTH = PEER_REQUEST_FORWARDED - 1
+
+""" Max. amount of server identifiers within one peer response, so that the message size still fits into two bytes """
+MAX_PEER_RESPONSE_SIZE = (0xffff - 4) // PEER_ADDRESS_SIZE
+
+
+def pack_gossip_peer_request(address_port, page=0, walk_length=0, forwarded=False):
     """
     Method by which a message of type MESSAGE_CODE_PEER_REQUEST is packed/encoded
 
+    :param address_port: the server identifier (GossipPeerAddress) of the requesting peer
+    :param page: (optional) the index of the requested page of the peer sample
+    :param walk_length: (optional) the amount of hops the request is forwarded before it is answered
+    :param forwarded: (optional) True if the request is forwarded on behalf of the requesting peer
     :return: dict, code and data
     """
-    address, port = address_port.split(':')
-    ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4 = address.split('.')
-    b_address = bytes([int(ipv4_part_1)]) + bytes([int(ipv4_part_2)]) + bytes([int(ipv4_part_3)]) + bytes(
-        [int(ipv4_part_4)])
-    b_port = short_to_bytes(port)
-    b_reserved = b'\x00'
-    return {'code': MESSAGE_CODE_PEER_REQUEST, 'data': b_address + b_port + b_reserved + b_reserved}
+    if not 0 <= page <= MAX_PEER_REQUEST_PAGE:
+        raise ValueError('Page may not be larger than 1 byte')
+    if not 0 <= walk_length <= MAX_RANDOM_WALK_LENGTH:
+        raise ValueError('Walk length may not be larger than %d' % MAX_RANDOM_WALK_LENGTH)
+    b_page = bytes([page])
+    b_walk = bytes([walk_length | (PEER_REQUEST_FORWARDED if forwarded else 0)])
+    return {'code': MESSAGE_CODE_PEER_REQUEST, 'data': bytes(address_port) + b_page + b_walk}
 
 
 def pack_gossip_peer_response(local_connections):
     """
     Method by which a message of type MESSAGE_CODE_PEER_RESPONSE is packed/encoded
 
-    :param local_connections: list with all local connections
+    :param local_connections: list with the server identifiers (GossipPeerAddress) of all local connections
     :return: dict with format {'code': <message_code>, 'data': <data>}
     """
-    b_connections = b''
-    for key in local_connections:
-        address, port = key.split(':')
-        ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4 = address.split('.')
-        b_address = bytes([int(ipv4_part_1)]) + bytes([int(ipv4_part_2)]) + bytes([int(ipv4_part_3)]) + bytes(
-            [int(ipv4_part_4)])
-        b_port = short_to_bytes(port)
-        b_connections += b_address + b_port
-
-    return {'code': MESSAGE_CODE_PEER_RESPONSE, 'data': b_connections}
+    if len(local_connections) > MAX_PEER_RESPONSE_SIZE:
+        raise ValueError('At most %d connections fit into one peer response' % MAX_PEER_RESPONSE_SIZE)
+    return {'code': MESSAGE_CODE_PEER_RESPONSE, 'data': b''.join(local_connections)}
 
 
 PEER_UPDATE_TYPE_PEER_LOST = 0
@@ -138,13 +149,9 @@ def pack_gossip_peer_update(identifier, ttl, update_type):
     """
     Method by which a message of type MESSAGE_CODE_PEER_UPDATE is packed/encoded
 
+    :param identifier: the server identifier (GossipPeerAddress) of the peer
     :return: dict, code and data
     """
-    address, port = identifier.split(':')
-    ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4 = address.split('.')
-    b_address = bytes([int(ipv4_part_1)]) + bytes([int(ipv4_part_2)]) + bytes([int(ipv4_part_3)]) + bytes(
-        [int(ipv4_part_4)])
-    b_port = short_to_bytes(port)
     b_ttl = bytes([(int(ttl) & 0xff)])
     if update_type == PEER_UPDATE_TYPE_PEER_LOST:
         b_update = b'\x00'
@@ -152,22 +159,142 @@ def pack_gossip_peer_update(identifier, ttl, update_type):
         b_update = b'\x01'
     else:
         raise ValueError('update type may only be 0 or 1')
-    return {'code': MESSAGE_CODE_PEER_UPDATE, 'data': b_address + b_port + b_ttl + b_update}
+    return {'code': MESSAGE_CODE_PEER_UPDATE, 'data': bytes(identifier) + b_ttl + b_update}
+
+
+""" Max. amount of entries within one peer delta, so that the message size still fits into two bytes """
+MAX_PEER_DELTA_ENTRIES = (0xffff - 6) // PEER_DELTA_ENTRY_SIZE
+
+
+def pack_gossip_peer_delta(entries):
+    """
+    Method by which a message of type MESSAGE_CODE_PEER_DELTA is packed/encoded
+
+    :param entries: list of membership events in the form {'address', 'update_type', 'ttl', 'version'}, the
+                    addresses are GossipPeerAddress objects
+    :return: dict, code and data
+    """
+    if len(entries) > MAX_PEER_DELTA_ENTRIES:
+        raise ValueError('At most %d entries fit into one peer delta' % MAX_PEER_DELTA_ENTRIES)
+    b_reserved = b'\x00'
+    data = b_reserved + b_reserved
+    for entry in entries:
+        if entry['update_type'] not in [PEER_UPDATE_TYPE_PEER_LOST, PEER_UPDATE_TYPE_PEER_FOUND]:
+            raise ValueError('update type may only be 0 or 1')
+        data += bytes(entry['address']) + bytes([int(entry['ttl']) & 0xff, entry['update_type']]) + \
+            short_to_bytes(entry['version'])
+    return {'code': MESSAGE_CODE_PEER_DELTA, 'data': data}
 
 
 def pack_gossip_peer_init(identifier):
     """
     Method by which a message of type MESSAGE_CODE_PEER_INIT is packed/encoded
 
+    :param identifier: the server identifier (GossipPeerAddress) of this peer
+    :return: dict, code and data
+    """
+    return {'code': MESSAGE_CODE_PEER_INIT, 'data': bytes(identifier)}
+
+
+IHAVE_TYPE_ANNOUNCE = 0
+IHAVE_TYPE_ANTI_ENTROPY = 1
+IHAVE_TYPE_REPAIR = 2
+
+TREE_UPDATE_TYPE_PRUNE = 0
+TREE_UPDATE_TYPE_GRAFT = 1
+
+PING_TYPE_PING = 0
+PING_TYPE_PONG = 1
+
+""" Max. amount of digests within one message, so that the message size still fits into two bytes """
+MAX_DIGESTS = (0xffff - 6) // DIGEST_SIZE
+
+""" Max. amount of bytes of the Bloom filter within a summary, so that the message size still fits into two bytes """
+MAX_SUMMARY_SIZE = 0xffff - 6
+
+
+def pack_digests(digests):
+    """
+    Method by which a list of digests is packed/encoded
+
+    :param digests: list of digests with DIGEST_SIZE bytes each
+    :return: the concatenated digests
+    """
+    if len(digests) > MAX_DIGESTS:
+        raise ValueError('At most %d digests fit into one message' % MAX_DIGESTS)
+    for digest in digests:
+        if len(digest) != DIGEST_SIZE:
+            raise ValueError('Digests must have a size of %d bytes' % DIGEST_SIZE)
+    return b''.join(digests)
+
+
+def pack_gossip_ihave(digests, ihave_type=IHAVE_TYPE_ANNOUNCE):
+    """
+    Method by which a message of type MESSAGE_CODE_IHAVE is packed/encoded
+
+    :param digests: list of digests of the messages we have
+    :param ihave_type: (optional) the type of the advertised messages
+    :return: dict, code and data
+    """
+    b_reserved = b'\x00'
+    return {'code': MESSAGE_CODE_IHAVE, 'data': bytes([ihave_type]) + b_reserved + pack_digests(digests)}
+
+
+def pack_gossip_iwant(digests):
+    """
+    Method by which a message of type MESSAGE_CODE_IWANT is packed/encoded
+
+    :param digests: list of digests of the announces we want to receive
+    :return: dict, code and data
+    """
+    b_reserved = b'\x00'
+    return {'code': MESSAGE_CODE_IWANT, 'data': b_reserved + b_reserved + pack_digests(digests)}
+
+
+def pack_gossip_tree_update(update_type, digests=()):
+    """
+    Method by which a message of type MESSAGE_CODE_TREE_UPDATE is packed/encoded
+
+    :param update_type: TREE_UPDATE_TYPE_PRUNE or TREE_UPDATE_TYPE_GRAFT
+    :param digests: (optional) list of digests of the messages which are missing (GRAFT only)
     :return: dict, code and data
     """
-    address, port = identifier.split(':')
-    ipv4_part_1, ipv4_part_2, ipv4_part_3, ipv4_part_4 = address.split('.')
-    b_address = bytes([int(ipv4_part_1)]) + bytes([int(ipv4_part_2)]) + bytes([int(ipv4_part_3)]) + bytes(
-        [int(ipv4_part_4)])
-    b_port = short_to_bytes(port)
+    if update_type == TREE_UPDATE_TYPE_PRUNE:
+        b_update = b'\x00'
+    elif update_type == TREE_UPDATE_TYPE_GRAFT:
+        b_update = b'\x01'
+    else:
+        raise ValueError('update type may only be 0 or 1')
+    b_reserved = b'\x00'
+    return {'code': MESSAGE_CODE_TREE_UPDATE, 'data': b_update + b_reserved + pack_digests(digests)}
 
-    return {'code': MESSAGE_CODE_PEER_INIT, 'data': b_address + b_port}
+
+def pack_gossip_summary(bloom_filter):
+    """
+    Method by which a message of type MESSAGE_CODE_SUMMARY is packed/encoded
+
+    :param bloom_filter: GossipBloomFilter which contains the digests of all cached messages
+    :return: dict, code and data
+    """
+    if len(bloom_filter) > MAX_SUMMARY_SIZE:
+        raise ValueError('Bloom filter may not be larger than %d bytes' % MAX_SUMMARY_SIZE)
+    b_reserved = b'\x00'
+    return {'code': MESSAGE_CODE_SUMMARY, 'data': bytes([bloom_filter.hash_count]) + b_reserved +
+            bytes(bloom_filter.bits)}
+
+
+def pack_gossip_ping(ping_type, timestamp):
+    """
+    Method by which a message of type MESSAGE_CODE_PING is packed/encoded
+
+    :param ping_type: PING_TYPE_PING or PING_TYPE_PONG
+    :param timestamp: microseconds of the monotonic clock of the pinging peer, a pong echoes the one of the ping
+    :return: dict, code and data
+    """
+    if ping_type not in [PING_TYPE_PING, PING_TYPE_PONG]:
+        raise ValueError('ping type may only be 0 or 1')
+    b_reserved = b'\x00'
+    return {'code': MESSAGE_CODE_PING, 'data': bytes([ping_type]) + b_reserved + timestamp.to_bytes(8, 'big')}
 
 
 def pack_message_other(code, data):
@@ -229,3 +356,30 @@ def receive_msg(sock):
     logging.info('Received message: %d | %d | %s' % (size, code, data))
     msg = {'size': size, 'code': code, 'message': data}
     return msg
+
+
+def parse_msgs(data):
+    """
+    Method by which all complete messages are decoded from a byte buffer, e.g. from data which has been read from a
+    non-blocking socket
+
+    :param data: the received bytes
+    :return: a tuple of a list with a dict of the decoded values per complete message (see receive_msg) and the bytes
+        of an incomplete message at the end of the buffer
+    """
+    msgs = []
+    offset = 0
+    while len(data) - offset >= 4:
+        # the first and the second byte encode the message length
+        size = bytes_to_short(data[offset], data[offset + 1])
+        if size < 4:
+            raise GossipMessageException('Invalid size (< 4)')
+        # third and forth byte encode the message code
+        code = bytes_to_short(data[offset + 2], data[offset + 3])
+        if not MESSAGE_CODE_GOSSIP_MIN <= code < MESSAGE_CODE_GOSSIP_MAX:
+            raise GossipMessageException('Invalid message code')
+        if len(data) - offset < size:
+            break
+        msgs.append({'size': size, 'code': code, 'message': bytes(data[offset + 4:offset + size])})
+        offset += size
+    return msgs, data[offset:]
@@ -0,0 +1,82 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+
+from gossip.util.byte_formatting import bytes_to_short, short_to_bytes
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Amount of bytes of a peer address on the wire: IPv4 address and TCP port """
+PEER_ADDRESS_SIZE = 6
+
+
+class GossipPeerAddress(bytes):
+    """ Immutable address of a peer or connection (IPv4 address and TCP port) in the 6 byte form which is used on the
+    wire. Peers are keyed by these addresses in messages, pools and controllers, so they are hashed and compared as
+    bytes and copied into messages as they are. The familiar form '192.168.1.2:6001' is only built for logging and
+    parsed from configs (see from_string). """
+    __slots__ = ()
+
+    def __new__(cls, packed):
+        """ Constructor.
+
+        :param packed: The 6 bytes of the address (e.g. a slice of a message)
+        """
+        if len(packed) != PEER_ADDRESS_SIZE:
+            raise ValueError('A peer address consists of %d bytes, not %d' % (PEER_ADDRESS_SIZE, len(packed)))
+        return super().__new__(cls, packed)
+
+    @classmethod
+    def from_host_port(cls, host, port):
+        """ Creates an address from an IPv4 address and a port, e.g. the address of a socket.
+
+        :param host: The IPv4 address, e.g. '192.168.1.2'
+        :param port: The TCP port
+        :returns: The peer address
+        """
+        try:
+            return cls(socket.inet_pton(socket.AF_INET, host) + short_to_bytes(port))
+        except OSError:
+            raise ValueError('Invalid IPv4 address %s' % host)
+
+    @classmethod
+    def from_string(cls, identifier):
+        """ Parses an address in the form '192.168.1.2:6001'.
+
+        :param identifier: The address as string
+        :returns: The peer address
+        """
+        host, separator, port = identifier.rpartition(':')
+        if not separator or not port.isdigit() or int(port) > 0xffff:
+            raise ValueError('Invalid peer address %s' % identifier)
+        return cls.from_host_port(host, int(port))
+
+    @property
+    def host(self):
+        """ The IPv4 address as string, e.g. to connect to the peer """
+        return socket.inet_ntoa(self[:4])
+
+    @property
+    def port(self):
+        """ The TCP port """
+        return bytes_to_short(self[4], self[5])
+
+    def __int__(self):
+        return int.from_bytes(self, 'big')
+
+    def __str__(self):
+        return '%d.%d.%d.%d:%d' % (self[0], self[1], self[2], self[3], bytes_to_short(self[4], self[5]))
+
+    __repr__ = __str__
@@ -0,0 +1,172 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import logging
+import multiprocessing
+import sys
+import threading
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+DEPLOYMENT_MODE_PROCESSES = 'processes'
+DEPLOYMENT_MODE_THREADS = 'threads'
+
+""" Max. amount of seconds a worker may block before it checks whether it has been stopped """
+WORKER_POLL_INTERVAL = 0.5
+
+
+class GossipWorker(abc.ABC):
+    """ Base class for all Gossip stages (servers, senders, receivers and controllers). A worker only implements run,
+    the GossipRuntime which starts the worker decides whether it runs as a process or as a thread. """
+
+    def __init__(self, worker_label):
+        """ Constructor.
+
+        :param worker_label: A label to derive the concrete functionality of this worker
+        """
+        self.worker_label = worker_label
+        self.runtime = None
+        self._handle = None
+        self._stop_event = None
+
+    @abc.abstractmethod
+    def run(self):
+        """ Does the actual work of this worker. Long running implementations check stopped() at least every
+        WORKER_POLL_INTERVAL seconds. """
+
+    def start(self, runtime):
+        """ Starts this worker.
+
+        :param runtime: The runtime which places this worker
+        """
+        runtime.start(self)
+
+    def stop(self):
+        """ Asks this worker to stop. The worker finishes its current item and returns from run. """
+        if self._stop_event:
+            self._stop_event.set()
+
+    def stopped(self):
+        """ Tells whether this worker has been asked to stop.
+
+        :returns: True if stop has been called
+        """
+        return self._stop_event is not None and self._stop_event.is_set()
+
+    def join(self, timeout=None):
+        """ Waits until this worker has finished.
+
+        :param timeout: (optional) Max. amount of seconds to wait
+        """
+        self._handle.join(timeout)
+
+    def is_alive(self):
+        """ Tells whether this worker is still running.
+
+        :returns: True if the worker has been started and did not finish until now
+        """
+        return self._handle is not None and self._handle.is_alive()
+
+    @property
+    def exitcode(self):
+        """ The exit code of this worker: None while running, 0 if run returned normally, > 0 otherwise """
+        return self._handle.exitcode if self._handle else None
+
+
+class GossipRuntime:
+    """ Places Gossip workers as processes or threads. """
+
+    def __init__(self, deployment_mode=DEPLOYMENT_MODE_PROCESSES):
+        """ Constructor.
+
+        :param deployment_mode: (optional) DEPLOYMENT_MODE_PROCESSES or DEPLOYMENT_MODE_THREADS
+        """
+        if deployment_mode not in [DEPLOYMENT_MODE_PROCESSES, DEPLOYMENT_MODE_THREADS]:
+            raise ValueError('Unknown deployment mode: %s' % deployment_mode)
+        self.deployment_mode = deployment_mode
+
+    @property
+    def shared(self):
+        """ True if pools, caches and channels have to be shared between several processes """
+        return self.deployment_mode == DEPLOYMENT_MODE_PROCESSES
+
+    def start(self, worker):
+        """ Starts a worker according to the deployment mode.
+
+        :param worker: The GossipWorker to start
+        :returns: The started worker
+        """
+        worker.runtime = self
+        if self.deployment_mode == DEPLOYMENT_MODE_PROCESSES:
+            worker._stop_event = multiprocessing.Event()
+            worker._handle = _ProcessHandle(worker)
+        else:
+            worker._stop_event = threading.Event()
+            worker._handle = _ThreadHandle(worker)
+        return worker
+
+
+def _run_worker(worker):
+    """ Runs a worker and turns its outcome into an exit code.
+
+    :param worker: The worker to run
+    :returns: 0 if the worker returned normally, 1 if it raised an exception
+    """
+    try:
+        worker.run()
+        return 0
+    except Exception as e:
+        logging.exception('%s crashed: %s' % (worker.worker_label, e))
+        return 1
+
+
+class _ProcessHandle:
+    """ Runs a worker in a separate process. """
+
+    def __init__(self, worker):
+        self._process = multiprocessing.Process(target=self.__run, args=(worker,), name=worker.worker_label)
+        self._process.start()
+
+    @staticmethod
+    def __run(worker):
+        sys.exit(_run_worker(worker))
+
+    def join(self, timeout=None):
+        self._process.join(timeout)
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+    @property
+    def exitcode(self):
+        return self._process.exitcode
+
+
+class _ThreadHandle:
+    """ Runs a worker in a daemon thread of the current process. """
+
+    def __init__(self, worker):
+        self.exitcode = None
+        self._thread = threading.Thread(target=self.__run, args=(worker,), name=worker.worker_label, daemon=True)
+        self._thread.start()
+
+    def __run(self, worker):
+        self.exitcode = _run_worker(worker)
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
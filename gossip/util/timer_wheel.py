@@ -0,0 +1,136 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+""" Seconds per tick of the lowest wheel, deadlines are rounded up to full ticks """
+TIMER_RESOLUTION = 0.1
+
+""" Amount of slots per wheel (a power of two), every wheel covers this many slots of the wheel below """
+WHEEL_SIZE_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_SIZE_BITS
+
+""" Amount of wheels, timers beyond the range of all wheels are parked in the top wheel until they come in range """
+WHEEL_COUNT = 4
+
+
+class GossipTimerWheel:
+    """ Hierarchical timer wheel which keeps deadlines of many keys, e.g. one keepalive deadline per connection.
+    Scheduling and cancelling a timer costs O(1), advancing the time costs O(1) per tick plus the expired timers, no
+    matter how many timers are pending. A timer waits in the wheel whose slots are just fine enough for its distance to
+    the current time, and is moved down to the finer wheels when the lower wheel has turned once (cascading). This is
+    local state of one controller, so it is not thread-safe. """
+
+    def __init__(self, now, resolution=TIMER_RESOLUTION):
+        """ Constructor.
+
+        :param now: The current time in seconds (time.monotonic)
+        :param resolution: (optional) Seconds per tick of the lowest wheel
+        """
+        self.resolution = resolution
+        self._tick = self.__to_tick(now, math.floor)
+        self._wheels = [[{} for _ in range(WHEEL_SIZE)] for _ in range(WHEEL_COUNT)]
+        self._deadlines = {}
+        self._locations = {}
+        self._counts = [0] * WHEEL_COUNT
+        self._expired = {}
+
+    def __to_tick(self, point_in_time, rounding):
+        return int(rounding(point_in_time / self.resolution))
+
+    def schedule(self, key, deadline):
+        """ Sets the deadline of a key, a previous deadline of the key is replaced.
+
+        :param key: A hashable key, e.g. the identifier of a connection
+        :param deadline: The point in time (time.monotonic) after which the key expires
+        """
+        self.cancel(key)
+        self._deadlines[key] = self.__to_tick(deadline, math.ceil)
+        self.__place(key)
+
+    def cancel(self, key):
+        """ Removes the deadline of a key if there is one.
+
+        :param key: The key
+        """
+        if self._deadlines.pop(key, None) is None:
+            return
+        location = self._locations.pop(key, None)
+        if location is None:
+            self._expired.pop(key, None)
+        else:
+            del self._wheels[location[0]][location[1]][key]
+            self._counts[location[0]] -= 1
+
+    def __place(self, key):
+        delta = self._deadlines[key] - self._tick
+        if delta <= 0:
+            self._expired[key] = None
+            return
+        # The finest wheel whose range covers the deadline takes it, the top wheel takes everything beyond
+        tick = min(self._deadlines[key], self._tick + (1 << (WHEEL_SIZE_BITS * WHEEL_COUNT)) - 1)
+        for level in range(WHEEL_COUNT):
+            if delta < 1 << (WHEEL_SIZE_BITS * (level + 1)) or level == WHEEL_COUNT - 1:
+                slot = (tick >> (WHEEL_SIZE_BITS * level)) & (WHEEL_SIZE - 1)
+                self._wheels[level][slot][key] = None
+                self._locations[key] = (level, slot)
+                self._counts[level] += 1
+                return
+
+    def __cascade(self, level):
+        slot = (self._tick >> (WHEEL_SIZE_BITS * level)) & (WHEEL_SIZE - 1)
+        keys = self._wheels[level][slot]
+        self._wheels[level][slot] = {}
+        self._counts[level] -= len(keys)
+        for key in keys:
+            del self._locations[key]
+            self.__place(key)
+
+    def advance(self, now):
+        """ Turns the wheels up to the current time and removes all expired keys.
+
+        :param now: The current time in seconds (time.monotonic)
+        :returns: List of the expired keys in the order of their deadlines
+        """
+        target_tick = self.__to_tick(now, math.floor)
+        while self._tick < target_tick:
+            if not self._locations:
+                self._tick = target_tick
+                break
+            # Nothing happens before the next turn of the finest wheel which holds timers
+            lowest_level = min(level for level in range(WHEEL_COUNT) if self._counts[level])
+            if lowest_level > 0:
+                next_turn = ((self._tick >> (WHEEL_SIZE_BITS * lowest_level)) + 1) << (WHEEL_SIZE_BITS * lowest_level)
+                self._tick = min(target_tick, next_turn) - 1
+            self._tick += 1
+            # Refill the finer wheels from the coarser ones whenever a finer wheel has completed a turn
+            levels = 0
+            while levels < WHEEL_COUNT - 1 and not self._tick & ((1 << (WHEEL_SIZE_BITS * (levels + 1))) - 1):
+                levels += 1
+            for level in range(levels, 0, -1):
+                self.__cascade(level)
+            self.__cascade(0)
+        expired = sorted(self._expired, key=lambda x: self._deadlines[x])
+        for key in expired:
+            del self._deadlines[key]
+        self._expired = {}
+        return expired
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines)
@@ -0,0 +1,138 @@
+import socket
+import unittest
+from queue import Queue
+
+from gossip.communication.client_sender import GossipSender
+from gossip.communication.connection import GossipConnectionPool
+from gossip.util.message import MessageGossipPeerInit
+from gossip.util.packing import pack_gossip_peer_init
+from gossip.util.peer_address import GossipPeerAddress
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_SEND_MESSAGE, QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, \
+    QUEUE_ITEM_TYPE_CONNECTION_LOST
+from gossip.util.runtime import GossipRuntime, DEPLOYMENT_MODE_THREADS
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+class MockedConnection:
+    def close(self):
+        pass
+
+    def shutdown(self, arg):
+        pass
+
+
+class MockedReceiverPool:
+    def __init__(self):
+        self.identifiers = Queue()
+
+    def add_connection(self, identifier, client_socket):
+        self.identifiers.put(identifier)
+
+
+class TestSender(unittest.TestCase):
+    """
+    Test class for GossipSender class
+    """
+
+    def setUp(self):
+        self.to_sender = Queue()
+        self.to_controller = Queue()
+        self.receiver_pool = MockedReceiverPool()
+        self.connection_pool = GossipConnectionPool('TestPool', shared=False)
+        self.sender = GossipSender('TestSender', self.to_sender, self.to_controller, self.connection_pool,
+                                   receiver_pool=self.receiver_pool)
+
+    def tearDown(self):
+        self.sender.stop()
+        self.sender.join(timeout=5)
+
+    def listen(self):
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.bind(('127.0.0.1', 0))
+        server_socket.listen(1)
+        server_socket.settimeout(5)
+        self.addCleanup(server_socket.close)
+        return server_socket, GossipPeerAddress.from_host_port(*server_socket.getsockname())
+
+    def closed_port(self):
+        server_socket, identifier = self.listen()
+        server_socket.close()
+        return identifier
+
+    def test_race(self):
+        """
+            This test method lets connections to two listening peers and one closed port race against each other, a
+            message is sent to every one of them right away
+            It fails if not exactly one connection is kept, its message is not delivered, or the controller is
+            informed about the refused connection
+            :return: None
+        """
+        listeners = dict(self.listen()[::-1] for _ in range(2))
+        message = MessageGossipPeerInit(pack_gossip_peer_init(GossipPeerAddress.from_string('10.0.0.1:6001'))['data'])
+        race = (self.closed_port(),) + tuple(listeners)
+        for identifier in race:
+            self.to_sender.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': identifier, 'race': race})
+            self.to_sender.put({'type': QUEUE_ITEM_TYPE_SEND_MESSAGE, 'identifier': identifier, 'message': message})
+        self.sender.start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+
+        winner = self.receiver_pool.identifiers.get(timeout=5)
+        assert winner in listeners
+        assert self.connection_pool.get_identifiers() == [winner]
+        client_socket, _ = listeners[winner].accept()
+        self.addCleanup(client_socket.close)
+        client_socket.settimeout(5)
+        assert client_socket.recv(1024) == message.encode()
+        assert self.to_controller.empty(), "expected refused connection to be ignored within a race"
+
+    def test_all_failed(self):
+        """
+            This test method lets two connections to closed ports race against each other
+            It fails if the controller is not informed exactly once
+            :return: None
+        """
+        race = (self.closed_port(), self.closed_port())
+        for identifier in race:
+            self.to_sender.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': identifier, 'race': race})
+        self.sender.start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+
+        assert self.to_controller.get(timeout=5)['type'] == QUEUE_ITEM_TYPE_CONNECTION_LOST
+        self.sender.stop()
+        self.sender.join(timeout=5)
+        assert self.to_controller.empty(), "expected only one lost connection for the whole race"
+
+    def test_race_state_dropped(self):
+        """
+            This test method lets a race be won and another one fail completely
+            It fails if the sender keeps the state of a decided race
+            :return: None
+        """
+        listeners = dict(self.listen()[::-1] for _ in range(2))
+        races = [tuple(listeners), (self.closed_port(), self.closed_port())]
+        for race in races:
+            for identifier in race:
+                self.to_sender.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': identifier,
+                                    'race': race})
+        self.sender.start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+
+        assert self.receiver_pool.identifiers.get(timeout=5) in listeners
+        assert self.to_controller.get(timeout=5)['type'] == QUEUE_ITEM_TYPE_CONNECTION_LOST
+        self.sender.stop()
+        self.sender.join(timeout=5)
+        assert self.sender._races == {}, "expected no state of decided races but got %s" % self.sender._races
+
+    def test_already_connected(self):
+        """
+            This test method lets the sender establish a connection to a peer which is already in the connection pool
+            It fails if a second connection to the peer is opened
+            :return: None
+        """
+        server_socket, identifier = self.listen()
+        self.connection_pool.add_connection(identifier, MockedConnection(), server_identifier=identifier)
+        self.to_sender.put({'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, 'identifier': identifier})
+        self.sender.start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+
+        server_socket.settimeout(0.5)
+        with self.assertRaises(socket.timeout):
+            server_socket.accept()
+        assert self.receiver_pool.identifiers.empty()
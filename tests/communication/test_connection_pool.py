@@ -14,11 +14,20 @@
 
 import unittest
 
-from gossip.communication.connection import GossipConnectionPool
+from gossip.communication.connection import GossipConnectionPool, GossipPassiveView
+from gossip.util.peer_address import GossipPeerAddress
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
 
+def peer(port):
+    return GossipPeerAddress.from_host_port('127.0.0.1', port)
+
+
+def server(index):
+    return GossipPeerAddress.from_host_port('10.0.0.%d' % index, 6001)
+
+
 class MockedConnection:
     def __init__(self, name):
         self.name = name
@@ -45,15 +54,275 @@ class TestConnectionPool(unittest.TestCase):
         max_pool_size = 3
         connection_list = GossipConnectionPool('TestPool', max_pool_size)
 
-        connection_list.add_connection('127.0.0.1:2', MockedConnection('DummyConnection2'))
-        connection_list.add_connection('127.0.0.1:1', MockedConnection('DummyConnection1'))
+        connection_list.add_connection(peer(2), MockedConnection('DummyConnection2'))
+        connection_list.add_connection(peer(1), MockedConnection('DummyConnection1'))
 
         pool_size = len(connection_list._connections)
         assert pool_size == 2, "expected pool size to be %s but was %s" % (max_pool_size, pool_size)
 
-        connection_list.add_connection('127.0.0.1:3', MockedConnection('DummyConnection3'))
-        connection_list.add_connection('127.0.0.1:0', MockedConnection('DummyConnection0'))
+        connection_list.add_connection(peer(3), MockedConnection('DummyConnection3'))
+        connection_list.add_connection(peer(0), MockedConnection('DummyConnection0'))
 
         pool_size = len(connection_list._connections)
         assert pool_size == max_pool_size, "expected pool size to be %s but was %s" % (max_pool_size, pool_size)
 
+    def test_maintain_connections_list_unshared(self):
+        """
+            This test method repeats the maintenance test for a pool which is only used within one process
+            :return: None
+        """
+        max_pool_size = 3
+        connection_list = GossipConnectionPool('TestPool', max_pool_size, shared=False)
+
+        for port in range(4):
+            connection_list.add_connection(peer(port), MockedConnection('DummyConnection%d' % port))
+
+        pool_size = len(connection_list.get_identifiers())
+        assert pool_size == max_pool_size, "expected pool size to be %s but was %s" % (max_pool_size, pool_size)
+
+    def test_random_identifiers(self):
+        """
+            This test method draws random identifiers from a pool with ten connections
+            It fails if more identifiers than requested are returned, identifiers are duplicated, an excluded identifier
+            is returned, or an amount of 0 does not return all remaining identifiers
+            :return: None
+        """
+        connection_list = GossipConnectionPool('TestPool', 10, shared=False)
+        for port in range(10):
+            connection_list.add_connection(peer(port), MockedConnection('DummyConnection%d' % port))
+
+        for _ in range(20):
+            identifiers = connection_list.get_random_identifiers(4, identifiers_to_exclude=[peer(0)])
+            assert len(set(identifiers)) == 4, "expected 4 distinct identifiers but got %s" % identifiers
+            assert peer(0) not in identifiers
+
+        identifiers = connection_list.get_random_identifiers(0, identifiers_to_exclude=[peer(0)])
+        assert sorted(identifiers) == [peer(port) for port in range(1, 10)]
+
+    def test_sample_server_identifiers(self):
+        """
+            This test method samples the server identifiers of a pool with 20 connections page by page
+            It fails if a page exceeds the requested size, pages overlap, the pages do not cover all server identifiers,
+            an excluded server identifier is returned, or different seeds do not lead to different samples
+            :return: None
+        """
+        connection_list = GossipConnectionPool('TestPool', 20, shared=False)
+        for port in range(20):
+            identifier = peer(port)
+            connection_list.add_connection(identifier, MockedConnection('DummyConnection%d' % port),
+                                           server_identifier=identifier)
+
+        excluded = peer(0)
+        pages = [connection_list.sample_server_identifiers(6, b'seed', page=page,
+                                                           identifier_to_exclude=[excluded])
+                 for page in range(4)]
+        assert [len(page) for page in pages] == [6, 6, 6, 1], "unexpected page sizes: %s" % pages
+        sampled = [identifier for page in pages for identifier in page]
+        assert len(set(sampled)) == len(sampled), "expected no repetitions across pages"
+        assert set(sampled) == {peer(port) for port in range(1, 20)}
+        assert pages[0] == connection_list.sample_server_identifiers(6, b'seed', identifier_to_exclude=[excluded])
+
+        samples = {tuple(connection_list.sample_server_identifiers(6, ('seed%d' % i).encode())) for i in range(5)}
+        assert len(samples) > 1, "expected different samples for different seeds"
+
+    def test_server_index(self):
+        """
+            This test method adds, updates and removes connections (two of them to the same server) in a shared and an
+            unshared pool and filters peer responses against them
+            It fails if the server identifiers of the pool or of a single server do not follow the connections, or if
+            known or excluded server identifiers are not filtered out while the order of new ones is kept
+            :return: None
+        """
+        for shared in [True, False]:
+            connection_list = GossipConnectionPool('TestPool', 10, shared=shared)
+            connection_list.add_connection(peer(1), MockedConnection('DummyConnection1'), server_identifier=server(1))
+            connection_list.add_connection(peer(2), MockedConnection('DummyConnection2'), server_identifier=server(1))
+            connection_list.add_connection(peer(3), MockedConnection('DummyConnection3'))
+            assert connection_list.get_server_identifiers() == [server(1)]
+            assert sorted(connection_list.get_identifiers_of_server(server(1))) == [peer(1), peer(2)]
+
+            connection_list.update_connection(peer(3), server(3))
+            connection_list.update_connection(peer(2), server(2))
+            assert sorted(connection_list.get_server_identifiers()) == [server(1), server(2), server(3)]
+            assert connection_list.get_identifiers_of_server(server(1)) == [peer(1)]
+
+            response = [server(9), server(1), server(3), server(8), server(2)]
+            assert connection_list.filter_new_server_identifiers(response) == [server(9), server(8)]
+            assert connection_list.filter_new_server_identifiers(response, identifier_to_exclude=[server(3)]) \
+                == [server(9), server(3), server(8)]
+
+            connection_list.remove_connection(peer(1))
+            connection_list.remove_connection(peer(3))
+            assert connection_list.get_server_identifiers() == [server(2)]
+            assert connection_list.get_identifiers_of_server(server(1)) == []
+            assert connection_list.filter_new_server_identifiers(response) == [server(9), server(1),
+                                                                               server(3), server(8)]
+
+    def test_snapshot(self):
+        """
+            This test method takes snapshots of a shared and an unshared pool while connections are added, updated,
+            turned into lazy links and removed
+            It fails if a snapshot is taken again although the membership has not changed, if a change does not lead
+            to a new version, if a former snapshot changes, or if a snapshot does not match the pool
+            :return: None
+        """
+        for shared in [True, False]:
+            connection_list = GossipConnectionPool('TestPool', 10, shared=shared)
+            empty = connection_list.get_snapshot()
+            assert connection_list.get_snapshot() is empty
+            assert empty.identifiers == ()
+
+            for port in range(3):
+                connection_list.add_connection(peer(port), MockedConnection('DummyConnection%d' % port))
+            connection_list.update_connection(peer(1), server(1))
+            connection_list.set_eager(peer(2), False)
+            snapshot = connection_list.get_snapshot()
+            assert snapshot.version > empty.version
+            assert connection_list.get_snapshot() is snapshot
+            connection_list.get_random_identifiers(2)
+            connection_list.get_server_identifier(peer(1))
+            assert connection_list.get_snapshot() is snapshot, "expected lookups to reuse the snapshot"
+            assert sorted(snapshot.identifiers) == [peer(0), peer(1), peer(2)]
+            assert dict(snapshot.server_identifier_of) == {peer(0): None, peer(1): server(1),
+                                                           peer(2): None}
+            assert dict(snapshot.identifiers_of_server) == {server(1): (peer(1),)}
+            assert snapshot.lazy_identifiers == {peer(2)}
+            assert empty.identifiers == ()
+
+            connection_list.set_eager(peer(1), True)
+            assert connection_list.get_snapshot() is snapshot, "expected an eager link to stay eager silently"
+            connection_list.remove_connection(peer(2))
+            assert connection_list.get_snapshot().version > snapshot.version
+            assert sorted(connection_list.get_identifiers()) == [peer(0), peer(1)]
+            assert connection_list.get_link_identifiers(False) == []
+            assert len(snapshot.identifiers) == 3
+
+    def test_eviction_to_passive_view(self):
+        """
+            This test method adds connections to a full pool which moves evicted peers to a passive view
+            It fails if the connection which has just been added is evicted, or if the server identifier of an evicted
+            connection does not end up in the passive view
+            :return: None
+        """
+        passive_view = GossipPassiveView('TestView', view_size=10, shared=False)
+        connection_list = GossipConnectionPool('TestPool', 2, shared=False, passive_view=passive_view)
+
+        for port in range(6):
+            identifier = peer(port)
+            connection_list.add_connection(identifier, MockedConnection('DummyConnection%d' % port),
+                                           server_identifier=identifier)
+            assert identifier in connection_list.get_identifiers(), "expected new connection to stay in the pool"
+
+        active = set(connection_list.get_server_identifiers())
+        passive = set(passive_view.get_random_identifiers(10))
+        assert len(active) == 2 and len(passive) == 4
+        assert active | passive == {peer(port) for port in range(6)}
+
+    def test_scores(self):
+        """
+            This test method records pings and pongs of three connections and overfills the pool
+            It fails if unanswered pings or long RTTs do not worsen the score of a connection, or if not the connection
+            with the worst score is evicted and handed to the passive view together with its score
+            :return: None
+        """
+        passive_view = GossipPassiveView('TestView', view_size=10, shared=False)
+        connection_list = GossipConnectionPool('TestPool', 3, shared=False, passive_view=passive_view)
+        for port in range(3):
+            identifier = peer(port)
+            connection_list.add_connection(identifier, MockedConnection('DummyConnection%d' % port),
+                                           server_identifier=identifier)
+        unmeasured_score = connection_list.get_score(peer(0))
+
+        connection_list.record_ping(peer(0))
+        connection_list.record_pong(peer(0), 0.01)
+        connection_list.record_ping(peer(1))
+        connection_list.record_pong(peer(1), 0.5)
+        connection_list.record_ping(peer(2))
+        connection_list.record_ping(peer(2))
+        assert connection_list.get_score(peer(0)) < unmeasured_score < connection_list.get_score(peer(1))
+        assert connection_list.get_score(peer(1)) > connection_list.get_score(peer(2)) > unmeasured_score
+
+        connection_list.add_connection(peer(3), MockedConnection('DummyConnection3'), server_identifier=peer(3))
+        assert sorted(connection_list.get_identifiers()) == [peer(0), peer(2), peer(3)]
+        assert passive_view.get_random_identifiers(10) == [peer(1)]
+        passive_view.add_identifiers([peer(1), peer(4)])
+        assert passive_view.pop_random_identifier() == peer(4), "expected score of evicted peer to be kept"
+
+    def test_reservations(self):
+        """
+            This test method reserves slots for dials in a pool with a maximum size of 3 and completes or fails them
+            It fails if more dials than free slots get a reservation, a peer being dialed gets a second reservation,
+            or if an established resp. failed dial does not free its reservation
+            :return: None
+        """
+        connection_list = GossipConnectionPool('TestPool', 3, shared=False)
+        connection_list.add_connection(peer(0), MockedConnection('DummyConnection0'))
+        assert connection_list.reserve_slots([peer(1), peer(2), peer(3)]) == [peer(1), peer(2)]
+        assert connection_list.get_capacity() == 0
+        assert connection_list.reserve_slots([peer(3)]) == []
+
+        connection_list.add_connection(peer(1), MockedConnection('DummyConnection1'), server_identifier=peer(1))
+        assert connection_list.get_capacity() == 0
+        connection_list.release_reservation(peer(2))
+        assert connection_list.get_capacity() == 1
+        assert connection_list.reserve_slots([peer(1), peer(3)]) == [peer(1)]
+        assert sorted(connection_list.get_identifiers()) == [peer(0), peer(1)]
+
+    def test_watermarks(self):
+        """
+            This test method adds connections to a pool with a maximum size of 3 and a headroom of 2
+            It fails if a connection is evicted before the high watermark is exceeded, or if the pool is not trimmed to
+            the low watermark at once, sparing the connection which has just been added
+            :return: None
+        """
+        passive_view = GossipPassiveView('TestView', view_size=10, shared=False)
+        connection_list = GossipConnectionPool('TestPool', 3, shared=False, passive_view=passive_view, headroom=2)
+        for port in range(5):
+            identifier = peer(port)
+            connection_list.add_connection(identifier, MockedConnection('DummyConnection%d' % port),
+                                           server_identifier=identifier)
+        assert len(connection_list.get_identifiers()) == 5
+        assert connection_list.get_capacity() == -2
+
+        connection_list.add_connection(peer(5), MockedConnection('DummyConnection5'), server_identifier=peer(5))
+        assert len(connection_list.get_identifiers()) == 3
+        assert peer(5) in connection_list.get_identifiers()
+        assert len(passive_view) == 3
+
+
+class TestPassiveView(unittest.TestCase):
+    """
+    Test class for GossipPassiveView class
+    """
+
+    def test_view_size(self):
+        """
+            This test method adds more server identifiers than the passive view can hold and promotes them afterwards
+            It fails if the view exceeds its size, excluded identifiers are added, or a promoted identifier is not
+            removed from the view
+            :return: None
+        """
+        passive_view = GossipPassiveView('TestView', view_size=5, shared=False)
+        passive_view.add_identifiers([peer(port) for port in range(10)], identifiers_to_exclude=[peer(0)])
+        assert len(passive_view) == 5
+        assert peer(0) not in passive_view.get_random_identifiers(5)
+
+        promoted = set()
+        while len(passive_view):
+            promoted.add(passive_view.pop_random_identifier())
+        assert len(promoted) == 5
+        assert passive_view.pop_random_identifier() is None
+
+    def test_promote_best_score(self):
+        """
+            This test method adds peers with different scores to a passive view which is smaller than the sample
+            It fails if not the peer with the best score is promoted first, or if a peer without score does not count
+            as an unmeasured peer
+            :return: None
+        """
+        passive_view = GossipPassiveView('TestView', view_size=3, shared=False)
+        passive_view.add_identifiers([peer(1)], score=0.5)
+        passive_view.add_identifiers([peer(2)])
+        passive_view.add_identifiers([peer(3)], score=0.05)
+
+        assert [passive_view.pop_random_identifier() for _ in range(3)] == [peer(3), peer(2), peer(1)]
@@ -0,0 +1,81 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.communication.eviction import create_eviction_policy, EVICTION_POLICY_LEAST_RECENTLY_ACTIVE, \
+    EVICTION_POLICY_YOUNGEST_FIRST, EVICTION_POLICY_INBOUND_RATIO, EVICTION_POLICY_SCORE, EVICTION_POLICIES
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+class MockedConnection:
+    def close(self):
+        pass
+
+    def shutdown(self, arg):
+        pass
+
+
+def candidates():
+    """ Four connections: 1 is the oldest and the most silent, 4 the youngest, 2 has the worst score, 3 and 4 are
+    inbound """
+    return {'127.0.0.1:1': {'score': 0.1, 'last_activity': 1.0, 'connected': 1.0, 'outbound': True},
+            '127.0.0.1:2': {'score': 0.9, 'last_activity': 8.0, 'connected': 2.0, 'outbound': True},
+            '127.0.0.1:3': {'score': 0.2, 'last_activity': 7.0, 'connected': 3.0, 'outbound': False},
+            '127.0.0.1:4': {'score': 0.3, 'last_activity': 9.0, 'connected': 4.0, 'outbound': False}}
+
+
+class TestEvictionPolicies(unittest.TestCase):
+    """
+    Test class for the eviction policies
+    """
+
+    def test_select_victims(self):
+        """
+            This test method lets every policy choose victims out of four connections
+            It fails if a policy does not choose the expected connections or more connections than requested
+            :return: None
+        """
+        assert create_eviction_policy(EVICTION_POLICY_LEAST_RECENTLY_ACTIVE).select_victims(candidates(), 2) == \
+            ['127.0.0.1:1', '127.0.0.1:3']
+        assert create_eviction_policy(EVICTION_POLICY_YOUNGEST_FIRST).select_victims(candidates(), 1) == \
+            ['127.0.0.1:4']
+        # Outbound connections are protected as long as inbound connections take more than their half
+        assert create_eviction_policy(EVICTION_POLICY_INBOUND_RATIO).select_victims(candidates(), 3) == \
+            ['127.0.0.1:4', '127.0.0.1:2', '127.0.0.1:3']
+        policy = create_eviction_policy(EVICTION_POLICY_SCORE)
+        policy.sample_size = 4
+        assert policy.select_victims(candidates(), 1) == ['127.0.0.1:2']
+        for policy_name in EVICTION_POLICIES:
+            victims = create_eviction_policy(policy_name).select_victims(candidates(), 5)
+            assert sorted(victims) == sorted(candidates()), 'unexpected victims of %s: %s' % (policy_name, victims)
+        self.assertRaises(ValueError, create_eviction_policy, 'unknown')
+
+    def test_pool_policy(self):
+        """
+            This test method overfills a pool which evicts the youngest connections, one of them being outbound
+            It fails if the pool does not evict the connection chosen by its policy or does not tell the policy the
+            direction of a connection
+            :return: None
+        """
+        connection_pool = GossipConnectionPool('TestPool', 2, shared=False,
+                                               eviction_policy=create_eviction_policy(EVICTION_POLICY_INBOUND_RATIO))
+        connection_pool.add_connection('127.0.0.1:1', MockedConnection(), server_identifier='127.0.0.1:1',
+                                       outbound=True)
+        connection_pool.add_connection('127.0.0.1:2', MockedConnection())
+        connection_pool.add_connection('127.0.0.1:3', MockedConnection(), server_identifier='127.0.0.1:3',
+                                       outbound=True)
+        assert sorted(connection_pool.get_identifiers()) == ['127.0.0.1:1', '127.0.0.1:3']
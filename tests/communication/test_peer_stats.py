@@ -0,0 +1,98 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.communication.peer_stats import GossipPeerStats
+from gossip.util.peer_address import GossipPeerAddress
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def peer(port):
+    return GossipPeerAddress.from_host_port('127.0.0.1', port)
+
+
+class MockedConnection:
+    def close(self):
+        pass
+
+    def shutdown(self, arg):
+        pass
+
+
+class TestPeerStats(unittest.TestCase):
+    """
+    Test class for GossipPeerStats class
+    """
+
+    def test_slots(self):
+        """
+            This test method allocates all slots of a shared and of a local stats table and records traffic and pings
+            It fails if a slot is handed out twice, a released slot is not reused with reset statistics, a counter or
+            the RTT average is wrong, or an active slot is reported as idle
+            :return: None
+        """
+        for shared in [True, False]:
+            stats = GossipPeerStats(2, shared=shared)
+            assert [stats.allocate(10.0), stats.allocate(10.0), stats.allocate(10.0)] == [0, 1, None]
+
+            stats.record_received(1, 100, 2, 12.0)
+            stats.record_sent(1, 40)
+            stats.record_ping(1, 12.0)
+            assert stats.get(1)['ping_pending']
+            assert stats.record_pong(1, 0.1) == 0.1
+            stats.record_ping(1, 13.0)
+            assert abs(stats.record_pong(1, 0.2) - 0.12) < 1e-9
+            values = stats.get(1)
+            assert (values['bytes_in'], values['messages_in'], values['bytes_out'], values['messages_out']) == \
+                (100, 2, 40, 1)
+            assert values['last_activity'] == 12.0 and values['error_rate'] == 0.0 and not values['ping_pending']
+            assert stats.get_idle_slots(11.0) == [0]
+
+            stats.release(1)
+            assert stats.get_idle_slots(11.0) == [0]
+            assert stats.allocate(20.0) == 1
+            assert stats.get(1)['bytes_in'] == 0 and stats.get(1)['rtt'] is None
+
+    def test_pool_stats(self):
+        """
+            This test method adds connections to a pool, records traffic and removes a connection again
+            It fails if the pool does not provide the statistics and the idle connections per identifier, or if the slot
+            of a removed connection is not handed to the next connection
+            :return: None
+        """
+        connection_pool = GossipConnectionPool('TestPool', 3, shared=False)
+        for port in range(2):
+            identifier = peer(port)
+            connection_pool.add_connection(identifier, MockedConnection(), server_identifier=identifier)
+        connection, slot = connection_pool.get_connection_slot(peer(1))
+        connection_pool.stats.record_received(slot, 8, 1, float('inf'))
+        connection_pool.record_ping(peer(1))
+        connection_pool.record_pong(peer(1), 0.05)
+
+        all_stats = connection_pool.get_stats()
+        assert sorted(all_stats) == [peer(0), peer(1)]
+        assert all_stats[peer(1)]['server_identifier'] == peer(1)
+        assert all_stats[peer(1)]['bytes_in'] == 8 and all_stats[peer(1)]['rtt'] == 0.05
+        assert all_stats[peer(0)]['rtt'] is None
+        assert connection_pool.get_idle_identifiers(float('inf')) == [peer(0)]
+        assert '127.0.0.1:1' in connection_pool.format_stats()
+
+        connection_pool.remove_connection(peer(1))
+        assert connection_pool.get_slot(peer(1)) is None
+        connection_pool.add_connection(peer(2), MockedConnection())
+        assert connection_pool.get_slot(peer(2)) == slot
+        assert connection_pool.get_stats()[peer(2)]['bytes_in'] == 0
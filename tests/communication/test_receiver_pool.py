@@ -0,0 +1,78 @@
+import socket
+import unittest
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.communication.receiver_pool import GossipReceiverPool
+from gossip.util.channel import create_channel
+from gossip.util.message import MessageGossipAnnounce
+from gossip.util.packing import pack_gossip_announce
+from gossip.util.peer_address import GossipPeerAddress
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_NEW_CONNECTION, QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, \
+    QUEUE_ITEM_TYPE_CONNECTION_LOST
+from gossip.util.runtime import GossipRuntime, DEPLOYMENT_MODE_PROCESSES, DEPLOYMENT_MODE_THREADS
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def announce(identifier):
+    return MessageGossipAnnounce(pack_gossip_announce(0, 540, identifier)['data'])
+
+
+class TestReceiverPool(unittest.TestCase):
+    """
+    Test class for GossipReceiverPool class
+    """
+
+    def test_multiplexed_connections(self):
+        """
+            This test method hands four connections to a pool of two receiver workers and sends fragmented messages
+            It fails if a connection is not announced, a message is lost or mixed up or not counted in the stats table,
+            a lost connection is not detected, or the connections are not spread evenly over the workers
+            :return: None
+        """
+        for deployment_mode in [DEPLOYMENT_MODE_PROCESSES, DEPLOYMENT_MODE_THREADS]:
+            runtime = GossipRuntime(deployment_mode)
+            to_controller = create_channel(shared=runtime.shared)
+            connection_pool = GossipConnectionPool('TestPool', shared=runtime.shared)
+            receiver_pool = GossipReceiverPool('TestReceiver', 2, to_controller, connection_pool)
+            for worker in receiver_pool.workers:
+                worker.start(runtime)
+                self.addCleanup(worker.stop)
+
+            remote_sockets = {}
+            for port in range(4):
+                identifier = GossipPeerAddress.from_host_port('127.0.0.1', port)
+                local_socket, remote_sockets[identifier] = socket.socketpair()
+                connection_pool.add_connection(identifier, local_socket)
+                receiver_pool.add_connection(identifier, local_socket)
+            assert [worker.load.value for worker in receiver_pool.workers] == [2, 2]
+
+            for identifier, remote_socket in remote_sockets.items():
+                encoded = announce(identifier).encode()
+                remote_socket.send(encoded[:3])
+                remote_socket.send(encoded[3:] + encoded)
+
+            received = {identifier: [] for identifier in remote_sockets}
+            new_connections = set()
+            for _ in range(len(remote_sockets) * 3):
+                queue_item = to_controller.get(timeout=5)
+                if queue_item['type'] == QUEUE_ITEM_TYPE_NEW_CONNECTION:
+                    new_connections.add(queue_item['identifier'])
+                elif queue_item['type'] == QUEUE_ITEM_TYPE_RECEIVED_MESSAGE:
+                    received[queue_item['identifier']].append(queue_item['message'])
+            assert new_connections == set(remote_sockets)
+            for identifier, messages in received.items():
+                assert messages == [announce(identifier)] * 2, 'unexpected messages from %s: %s' % (identifier,
+                                                                                                    messages)
+                stats = connection_pool.get_stats()[identifier]
+                assert (stats['messages_in'], stats['bytes_in']) == (2, 2 * len(announce(identifier).encode()))
+
+            remote_sockets[GossipPeerAddress.from_host_port('127.0.0.1', 0)].close()
+            queue_item = to_controller.get(timeout=5)
+            assert queue_item['type'] == QUEUE_ITEM_TYPE_CONNECTION_LOST
+            assert queue_item['identifier'] == GossipPeerAddress.from_host_port('127.0.0.1', 0)
+
+            for worker in receiver_pool.workers:
+                worker.stop()
+                worker.join(timeout=5)
+                assert worker.exitcode == 0, 'expected exit code 0 in mode %s' % deployment_mode
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from gossip.control.address_book import GossipAddressBook
+from gossip.util.peer_address import GossipPeerAddress
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def peers(*identifiers):
+    return [GossipPeerAddress.from_string(identifier) for identifier in identifiers]
+
+
+class TestAddressBook(unittest.TestCase):
+    """
+    Test class for GossipAddressBook class
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'peers.db')
+
+    def test_healthy_peers(self):
+        """
+            This test method records three snapshots of connected peers
+            It fails if the peers are not ordered by the amount of snapshots and by their last snapshot, or if more
+            peers than requested are returned
+            :return: None
+        """
+        address_book = GossipAddressBook(self.path)
+        self.addCleanup(address_book.close)
+        address_book.record(peers('10.0.0.1:6001', '10.0.0.2:6001'), 100.0)
+        address_book.record(peers('10.0.0.1:6001', '10.0.0.3:6001'), 110.0)
+        address_book.record(peers('10.0.0.1:6001', '10.0.0.4:6001', '10.0.0.4:6001'), 120.0)
+
+        assert len(address_book) == 4
+        assert address_book.get_healthy_peers(10, 130.0) == peers('10.0.0.1:6001', '10.0.0.4:6001', '10.0.0.3:6001',
+                                                                  '10.0.0.2:6001')
+        assert address_book.get_healthy_peers(2, 130.0) == peers('10.0.0.1:6001', '10.0.0.4:6001')
+
+    def test_persistence(self):
+        """
+            This test method records peers, reopens the address book and lets time pass beyond the max. age
+            It fails if the peers are lost by reopening the book or if old peers are not forgotten
+            :return: None
+        """
+        address_book = GossipAddressBook(self.path, max_age=60.0)
+        address_book.record(peers('10.0.0.1:6001'), 100.0)
+        address_book.record(peers('10.0.0.2:6001'), 150.0)
+        address_book.close()
+
+        address_book = GossipAddressBook(self.path, max_age=60.0)
+        self.addCleanup(address_book.close)
+        assert sorted(address_book.get_healthy_peers(10, 150.0)) == peers('10.0.0.1:6001', '10.0.0.2:6001')
+        assert address_book.get_healthy_peers(10, 200.0) == peers('10.0.0.2:6001')
+        address_book.record([], 200.0)
+        assert len(address_book) == 1
@@ -0,0 +1,300 @@
+import unittest
+from queue import Queue, Empty
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.control.api_registrations import APIRegistrationHandler
+from gossip.control.broadcast import GossipMissingMessages, GossipDigestBatches, BROADCAST_MODE_TREE, \
+    BROADCAST_MODE_PULL, BROADCAST_MODE_FANOUT
+from gossip.control.message_cache import GossipMessageCache
+from gossip.control.p2p_controller import P2PController
+from gossip.util.bloom_filter import create_bloom_filter
+from gossip.util.message import MessageGossipAnnounce, MessageGossipIHave, MessageGossipTreeUpdate, \
+    MessageGossipIWant, MessageGossipSummary
+from gossip.util.message_code import MESSAGE_CODE_TREE_UPDATE, MESSAGE_CODE_IWANT, MESSAGE_CODE_SUMMARY, \
+    MESSAGE_CODE_IHAVE, MESSAGE_CODE_PING
+from gossip.util.packing import pack_gossip_announce, pack_gossip_ihave, pack_gossip_tree_update, \
+    pack_gossip_iwant, pack_gossip_summary, TREE_UPDATE_TYPE_GRAFT, TREE_UPDATE_TYPE_PRUNE, MAX_SUMMARY_SIZE, \
+    IHAVE_TYPE_ANTI_ENTROPY, IHAVE_TYPE_REPAIR
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, QUEUE_ITEM_TYPE_NEW_CONNECTION
+from gossip.util.runtime import GossipRuntime, DEPLOYMENT_MODE_THREADS
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def announce(payload):
+    return MessageGossipAnnounce(pack_gossip_announce(0, 540, payload)['data'])
+
+
+class MockedConnection:
+    def close(self):
+        pass
+
+    def shutdown(self, arg):
+        pass
+
+
+class TestMissingMessages(unittest.TestCase):
+    """
+    Test class for GossipMissingMessages class
+    """
+
+    def test_expire(self):
+        """
+            This test method lets two peers advertise the same message and lets the timeout expire twice
+            It fails if the message is requested before the timeout, not from the first advertising peer first, or if
+            a received message is requested at all
+            :return: None
+        """
+        missing_messages = GossipMissingMessages(1.0)
+        missing_messages.add(b'digest01', '127.0.0.1:1', 10.0)
+        missing_messages.add(b'digest01', '127.0.0.1:2', 10.5)
+        missing_messages.add(b'digest02', '127.0.0.1:2', 10.5)
+
+        assert missing_messages.expire(10.9) == {}
+        assert missing_messages.expire(11.0) == {'127.0.0.1:1': [b'digest01']}
+        missing_messages.remove(b'digest02')
+        assert missing_messages.expire(12.0) == {'127.0.0.1:2': [b'digest01']}
+        assert len(missing_messages) == 0
+
+    def test_requested(self):
+        """
+            This test method adds a message which has already been requested from the first advertising peer
+            It fails if the message is requested from the same peer again or not from the second peer after the timeout
+            :return: None
+        """
+        missing_messages = GossipMissingMessages(1.0)
+        assert missing_messages.add(b'digest01', '127.0.0.1:1', 10.0, requested=True)
+        assert not missing_messages.add(b'digest01', '127.0.0.1:1', 10.2)
+        assert not missing_messages.add(b'digest01', '127.0.0.1:2', 10.5)
+
+        assert missing_messages.expire(11.0) == {'127.0.0.1:2': [b'digest01']}
+        assert missing_messages.expire(12.0) == {}
+        assert len(missing_messages) == 0
+
+
+class TestDigestBatches(unittest.TestCase):
+    """
+    Test class for GossipDigestBatches class
+    """
+
+    def test_pop_due(self):
+        """
+            This test method collects digests for two peers, one of them exceeding the max. batch size
+            It fails if a batch is sent before its interval elapsed although it is not full, or if digests get lost
+            :return: None
+        """
+        batches = GossipDigestBatches(interval=0.1, max_digests=3)
+        batches.add('127.0.0.1:1', b'digest01', 10.0)
+        batches.add('127.0.0.1:1', b'digest01', 10.0)
+        batches.add('127.0.0.1:2', b'digest01', 10.0)
+        for digest in [b'digest02', b'digest03', b'digest04']:
+            batches.add('127.0.0.1:2', digest, 10.0)
+
+        assert batches.pop_due(10.05) == {'127.0.0.1:2': [b'digest01', b'digest02', b'digest03']}
+        assert batches.pop_due(10.1) == {'127.0.0.1:1': [b'digest01'], '127.0.0.1:2': [b'digest04']}
+        assert len(batches) == 0
+
+
+class ControllerTestCase(unittest.TestCase):
+    """
+    Base class for tests which run a P2PController with three P2P connections in a thread
+    """
+
+    broadcast = None
+
+    def setUp(self):
+        self.runtime = GossipRuntime(DEPLOYMENT_MODE_THREADS)
+        self.from_p2p = Queue()
+        self.to_p2p = Queue()
+        self.connection_pool = GossipConnectionPool('TestPool', shared=False)
+        for port in range(1, 4):
+            self.connection_pool.add_connection('127.0.0.1:%d' % port, MockedConnection())
+        self.message_cache = GossipMessageCache('TestCache', shared=False)
+        self.controller = P2PController(self.from_p2p, self.to_p2p, Queue(), self.connection_pool,
+                                        {'host': '127.0.0.1', 'port': 6001}, self.message_cache,
+                                        GossipMessageCache('TestUpdateCache', shared=False),
+                                        APIRegistrationHandler(shared=False), 0, broadcast=self.broadcast,
+                                        graft_timeout=0.1)
+        self.controller.start(self.runtime)
+
+    def tearDown(self):
+        self.controller.stop()
+        self.controller.join(timeout=5)
+
+    def receive(self, identifier, message):
+        self.from_p2p.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': identifier, 'message': message})
+
+
+class TestBroadcastTree(ControllerTestCase):
+    """
+    Test class for the broadcast tree handling of the P2PController
+    """
+
+    broadcast = BROADCAST_MODE_TREE
+
+    def test_prune_on_duplicate(self):
+        """
+            This test method delivers the same announce over two links
+            It fails if the second link is not pruned
+            :return: None
+        """
+        self.receive('127.0.0.1:1', announce(b'Msg1'))
+        self.receive('127.0.0.1:2', announce(b'Msg1'))
+
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:2'
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_TREE_UPDATE,
+                                                      'update_type': TREE_UPDATE_TYPE_PRUNE, 'digests': []}
+        assert self.connection_pool.get_link_identifiers(False) == ['127.0.0.1:2']
+
+    def test_graft_on_missing_message(self):
+        """
+            This test method advertises an announce which is never pushed, and grafts the link of another peer
+            It fails if the missing announce is not requested from the advertising peer or if a grafted link does not
+            get the requested announce
+            :return: None
+        """
+        self.connection_pool.set_eager('127.0.0.1:3', False)
+        digest = announce(b'Msg2').get_digest()
+        self.receive('127.0.0.1:3', MessageGossipIHave(pack_gossip_ihave([digest])['data']))
+
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:3'
+        assert queue_item['message'].get_values()['update_type'] == TREE_UPDATE_TYPE_GRAFT
+        assert queue_item['message'].get_values()['digests'] == [digest]
+        assert '127.0.0.1:3' in self.connection_pool.get_link_identifiers(True)
+
+        self.receive('127.0.0.1:3', announce(b'Msg2'))
+        self.connection_pool.set_eager('127.0.0.1:1', False)
+        self.receive('127.0.0.1:1', MessageGossipTreeUpdate(pack_gossip_tree_update(TREE_UPDATE_TYPE_GRAFT,
+                                                                                    [digest])['data']))
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:1'
+        assert queue_item['message'] == announce(b'Msg2')
+        assert '127.0.0.1:1' in self.connection_pool.get_link_identifiers(True)
+
+
+class TestPull(ControllerTestCase):
+    """
+    Test class for the pull handling of the P2PController
+    """
+
+    broadcast = BROADCAST_MODE_PULL
+
+    def test_iwant(self):
+        """
+            This test method lets two peers advertise the same announce and requests an announce
+            It fails if the missing announce is not requested right away and only once, if it is not requested from
+            the second peer after the timeout, or if a requested announce is not sent
+            :return: None
+        """
+        digest = announce(b'Msg3').get_digest()
+        self.receive('127.0.0.1:1', MessageGossipIHave(pack_gossip_ihave([digest])['data']))
+        self.receive('127.0.0.1:2', MessageGossipIHave(pack_gossip_ihave([digest])['data']))
+
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:1'
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_IWANT, 'digests': [digest]}
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:2'
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_IWANT, 'digests': [digest]}
+
+        self.receive('127.0.0.1:2', announce(b'Msg3'))
+        self.receive('127.0.0.1:3', MessageGossipIWant(pack_gossip_iwant([digest])['data']))
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:3'
+        assert queue_item['message'] == announce(b'Msg3')
+
+
+class TestDeltaSync(ControllerTestCase):
+    """
+    Test class for the synchronization of new connected peers by the P2PController
+    """
+
+    broadcast = BROADCAST_MODE_FANOUT
+
+    def test_summary(self):
+        """
+            This test method announces a new connection and receives the summary of the new peer
+            It fails if the new peer does not get a summary of all cached announces, or if it gets announces which are
+            contained in its summary
+            :return: None
+        """
+        for payload in [b'Msg1', b'Msg2', b'Msg3']:
+            self.message_cache.add_message(announce(payload))
+
+        self.from_p2p.put({'type': QUEUE_ITEM_TYPE_NEW_CONNECTION, 'identifier': '127.0.0.1:1', 'message': None})
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:1'
+        assert queue_item['message'].get_values()['code'] == MESSAGE_CODE_SUMMARY
+        for payload in [b'Msg1', b'Msg2', b'Msg3']:
+            assert announce(payload).get_digest() in queue_item['message'].get_values()['bloom_filter']
+        assert self.to_p2p.get(timeout=5)['message'].get_values()['code'] == MESSAGE_CODE_PING
+
+        bloom_filter = create_bloom_filter([announce(b'Msg1').get_digest(), announce(b'Msg3').get_digest()],
+                                           MAX_SUMMARY_SIZE)
+        self.receive('127.0.0.1:1', MessageGossipSummary(pack_gossip_summary(bloom_filter)['data']))
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:1'
+        assert queue_item['message'] == announce(b'Msg2')
+        with self.assertRaises(Empty):
+            self.to_p2p.get(timeout=0.5)
+
+    def test_known_by(self):
+        """
+            This test method lets a peer advertise an announce we have, and receives an empty summary of the peer
+            It fails if the announce is sent to the peer although it is known to have it
+            :return: None
+        """
+        self.message_cache.add_message(announce(b'Msg1'))
+        self.receive('127.0.0.1:1', MessageGossipIHave(pack_gossip_ihave([announce(b'Msg1').get_digest()])['data']))
+        self.receive('127.0.0.1:1', MessageGossipSummary(pack_gossip_summary(create_bloom_filter([], 8))['data']))
+        with self.assertRaises(Empty):
+            self.to_p2p.get(timeout=0.5)
+
+
+class TestAntiEntropy(ControllerTestCase):
+    """
+    Test class for the anti-entropy rounds of the P2PController
+    """
+
+    broadcast = BROADCAST_MODE_FANOUT
+
+    def test_push_pull(self):
+        """
+            This test method lets a peer start an anti-entropy round with recent announces we partly miss
+            It fails if the missing announce is not requested right away, or if the peer does not get the digests of
+            the announces it misses in return
+            :return: None
+        """
+        for payload in [b'Msg1', b'Msg2']:
+            self.message_cache.add_message(announce(payload))
+
+        digests = [announce(b'Msg2').get_digest(), announce(b'Msg3').get_digest()]
+        self.receive('127.0.0.1:1', MessageGossipIHave(pack_gossip_ihave(digests, IHAVE_TYPE_ANTI_ENTROPY)['data']))
+
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:1'
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_IWANT,
+                                                      'digests': [announce(b'Msg3').get_digest()]}
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == '127.0.0.1:1'
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_IHAVE, 'ihave_type': IHAVE_TYPE_REPAIR,
+                                                      'digests': [announce(b'Msg1').get_digest()]}
+
+    def test_budget(self):
+        """
+            This test method starts an anti-entropy round with a budget of two digests
+            It fails if the round advertises other announces than the two newest ones
+            :return: None
+        """
+        for payload in [b'Msg1', b'Msg2', b'Msg3']:
+            self.message_cache.add_message(announce(payload))
+
+        self.controller.anti_entropy_budget = 16
+        self.controller.start_anti_entropy_round()
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_IHAVE,
+                                                      'ihave_type': IHAVE_TYPE_ANTI_ENTROPY,
+                                                      'digests': [announce(b'Msg3').get_digest(),
+                                                                  announce(b'Msg2').get_digest()]}
@@ -0,0 +1,69 @@
+import unittest
+
+from gossip.control.membership import GossipMembershipDeltas
+from gossip.util.message import MessageGossipPeerDelta
+from gossip.util.packing import pack_gossip_peer_delta, PEER_UPDATE_TYPE_PEER_FOUND, PEER_UPDATE_TYPE_PEER_LOST
+from gossip.util.peer_address import GossipPeerAddress
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def peer(identifier):
+    return GossipPeerAddress.from_string(identifier)
+
+
+def entry(address, version, update_type=PEER_UPDATE_TYPE_PEER_FOUND, ttl=0):
+    return {'address': peer(address), 'update_type': update_type, 'ttl': ttl, 'version': version}
+
+
+class TestMembershipDeltas(unittest.TestCase):
+    """
+    Test class for GossipMembershipDeltas class
+    """
+
+    def test_versions(self):
+        """
+            This test method reports events of the same address with several versions
+            It fails if an event with a known or older version is accepted, if a recorded event does not get the next
+            version, or if a wrapped around version is not accepted as newer one
+            :return: None
+        """
+        membership = GossipMembershipDeltas()
+        assert membership.accept(entry('10.0.0.1:6001', 3))
+        assert not membership.accept(entry('10.0.0.1:6001', 3))
+        assert not membership.accept(entry('10.0.0.1:6001', 2, PEER_UPDATE_TYPE_PEER_LOST))
+        assert membership.record(peer('10.0.0.1:6001'), PEER_UPDATE_TYPE_PEER_LOST, 0)['version'] == 4
+        assert not membership.accept(entry('10.0.0.1:6001', 4))
+
+        assert membership.accept(entry('10.0.0.2:6001', 0xffff))
+        assert membership.accept(entry('10.0.0.2:6001', 1))
+
+    def test_pop_due(self):
+        """
+            This test method adds several events for two peers within one interval
+            It fails if the events are not sent at once, if two events of the same address are both sent, or if a peer
+            gets more than one peer delta per interval
+            :return: None
+        """
+        membership = GossipMembershipDeltas(interval=1.0)
+        membership.add('127.0.0.1:1', entry('10.0.0.1:6001', 1))
+        assert membership.pop_due(10.0) == {'127.0.0.1:1': [entry('10.0.0.1:6001', 1)]}
+
+        membership.add('127.0.0.1:1', entry('10.0.0.1:6001', 2))
+        membership.add('127.0.0.1:1', entry('10.0.0.2:6001', 1))
+        membership.add('127.0.0.1:1', entry('10.0.0.1:6001', 3))
+        membership.add('127.0.0.1:2', entry('10.0.0.1:6001', 3))
+        assert membership.pop_due(10.5) == {'127.0.0.1:2': [entry('10.0.0.1:6001', 3)]}
+        assert membership.pop_due(11.0) == {'127.0.0.1:1': [entry('10.0.0.1:6001', 3), entry('10.0.0.2:6001', 1)]}
+        assert len(membership) == 0
+
+    def test_peer_delta(self):
+        """
+            This test method packs several events into a peer delta and decodes it again
+            It fails if an event is lost or changed
+            :return: None
+        """
+        entries = [entry('10.0.0.1:6001', 300, ttl=5), entry('192.168.1.2:7001', 1, PEER_UPDATE_TYPE_PEER_LOST)]
+        encoded = MessageGossipPeerDelta(pack_gossip_peer_delta(entries)['data']).encode()
+        peer_delta = MessageGossipPeerDelta(encoded[4:])
+        assert peer_delta.get_values()['entries'] == entries
@@ -12,13 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
 import unittest
 
 from gossip.control.message_cache import GossipMessageCache
+from gossip.util.message import MessageGossipAnnounce
+from gossip.util.packing import pack_gossip_announce
 
 __author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
 
 
+def announce(payload, ttl=0):
+    return MessageGossipAnnounce(pack_gossip_announce(ttl, 540, payload)['data'])
+
+
 class TestMessageCache(unittest.TestCase):
     """
     Test class for GossipMessageCache class
@@ -34,14 +41,14 @@ class TestMessageCache(unittest.TestCase):
         max_pool_size = 3
         message_cache = GossipMessageCache('TestCache1', max_pool_size)
 
-        id1 = message_cache.add_message("Msg1")
-        id2 = message_cache.add_message("Msg2")
+        id1 = message_cache.add_message(announce(b"Msg1"))
+        id2 = message_cache.add_message(announce(b"Msg2"))
 
         cache_size = len(message_cache._msg_cache)
         assert cache_size == 2, "expected cache_size to be %s but was %s" % (max_pool_size, cache_size)
 
-        id3 = message_cache.add_message("Msg3")
-        id4 = message_cache.add_message("Msg4")
+        id3 = message_cache.add_message(announce(b"Msg3"))
+        id4 = message_cache.add_message(announce(b"Msg4"))
 
         cache_size = len(message_cache._msg_cache)
         assert cache_size == max_pool_size, "expected pool size to be %s but was %s" % (max_pool_size, cache_size)
@@ -50,3 +57,97 @@ class TestMessageCache(unittest.TestCase):
         assert message_cache.get_message(id2), "Expected second message added to be deleted but wasn't"
         assert message_cache.get_message(id3), "Expected third message added to be deleted but wasn't"
         assert message_cache.get_message(id4), "Expected fourth message added to be deleted but wasn't"
+
+    def test_digest_index(self):
+        """
+            This test method adds four announces to a shared and an unshared cache with a maximum size of 3 and removes
+            one of them afterwards
+            It fails if the digest of the evicted or removed announce is still found, if the digest of a cached announce
+            is not found, or if an announce which differs only in its TTL is not detected as duplicate
+            :return: None
+        """
+        for shared in [True, False]:
+            message_cache = GossipMessageCache('TestCache6', 3, shared=shared)
+            ids = [message_cache.add_message(announce(('Msg%d' % i).encode())) for i in range(4)]
+
+            assert message_cache.find_digest(announce(b'Msg0').get_digest()) is None, "expected evicted digest to go"
+            assert [message_cache.find_digest(announce(('Msg%d' % i).encode()).get_digest()) for i in range(1, 4)] == \
+                ids[1:]
+            assert message_cache.add_message(announce(b'Msg2', ttl=5)) is None, "expected duplicate to be discarded"
+            assert message_cache.add_message(announce(b'Msg0')) is not None, "expected evicted announce to be new"
+
+            message_cache.remove_message(ids[2])
+            assert message_cache.find_digest(announce(b'Msg2').get_digest()) is None
+            assert message_cache.find_digest(announce(b'Msg3').get_digest()) == ids[3]
+
+    def test_forward_budget(self):
+        """
+            This test method reserves forwards of a message with a forwarding budget of 5
+            It fails if more forwards than the budget are granted or if an unlimited budget restricts the forwards
+            :return: None
+        """
+        message_cache = GossipMessageCache('TestCache2', shared=False)
+        msg_id = message_cache.add_message(announce(b"Msg1"), origin='127.0.0.1:1')
+
+        assert message_cache.get_known_by(msg_id) == ['127.0.0.1:1']
+        assert message_cache.reserve_forwards(msg_id, 4, 5) == 4
+        assert message_cache.reserve_forwards(msg_id, 4, 5) == 1
+        assert message_cache.reserve_forwards(msg_id, 4, 5) == 0
+        assert message_cache.reserve_forwards(msg_id, 4, 0) == 4
+        assert message_cache.reserve_forwards(msg_id + 1, 4, 0) == 0
+
+    def test_concurrent_forwards(self):
+        """
+            This test method lets eight threads reserve forwards of the same message with a forwarding budget of 100
+            It fails if the threads get more forwards than the budget allows in total
+            :return: None
+        """
+        message_cache = GossipMessageCache('TestCache4', shared=False)
+        msg_id = message_cache.add_message(announce(b"Msg1"))
+        granted = []
+
+        def reserve():
+            granted.append(sum(message_cache.reserve_forwards(msg_id, 1, 100) for _ in range(50)))
+
+        threads = [threading.Thread(target=reserve) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sum(granted) == 100, "expected 100 forwards but got %d" % sum(granted)
+
+    def test_known_by(self):
+        """
+            This test method remembers the peers which have a message
+            It fails if a peer is remembered twice, if a local message starts with known peers, or if the peers of an
+            unknown message are not empty
+            :return: None
+        """
+        message_cache = GossipMessageCache('TestCache3', shared=False)
+        msg_id = message_cache.add_message(announce(b"Msg1"))
+        assert message_cache.get_known_by(msg_id) == []
+
+        message_cache.add_known_by(msg_id, ['127.0.0.1:1', '127.0.0.1:2'])
+        message_cache.add_known_by(msg_id, ['127.0.0.1:2', '127.0.0.1:3'])
+        assert message_cache.get_known_by(msg_id) == ['127.0.0.1:1', '127.0.0.1:2', '127.0.0.1:3']
+        assert message_cache.get_known_by(msg_id + 1) == []
+
+    def test_concurrent_known_by(self):
+        """
+            This test method lets eight threads remember different peers of the same message at the same time
+            It fails if a peer gets lost
+            :return: None
+        """
+        message_cache = GossipMessageCache('TestCache5', shared=False)
+        msg_id = message_cache.add_message(announce(b"Msg1"))
+
+        def remember(thread_index):
+            for i in range(25):
+                message_cache.add_known_by(msg_id, ['127.0.%d.%d:1' % (thread_index, i)])
+
+        threads = [threading.Thread(target=remember, args=(thread_index,)) for thread_index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(message_cache.get_known_by(msg_id)) == 200
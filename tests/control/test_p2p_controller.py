@@ -0,0 +1,221 @@
+import time
+import unittest
+from queue import Queue
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.control.api_registrations import APIRegistrationHandler
+from gossip.control.message_cache import GossipMessageCache
+from gossip.control.p2p_controller import P2PController
+from gossip.util.message import MessageGossipPing, MessageGossipPeerRequest
+from gossip.util.message_code import MESSAGE_CODE_PING, MESSAGE_CODE_PEER_REQUEST, MESSAGE_CODE_PEER_RESPONSE
+from gossip.util.packing import pack_gossip_ping, pack_gossip_peer_request, PING_TYPE_PING, PING_TYPE_PONG
+from gossip.util.peer_address import GossipPeerAddress
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, QUEUE_ITEM_TYPE_NEW_CONNECTION, \
+    QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION
+from gossip.util.runtime import GossipRuntime, DEPLOYMENT_MODE_THREADS
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def peer(port):
+    return GossipPeerAddress.from_host_port('127.0.0.1', port)
+
+
+def server(index):
+    return GossipPeerAddress.from_host_port('10.0.0.%d' % index, 6001)
+
+
+class MockedConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def shutdown(self, arg):
+        pass
+
+
+class ControllerTestCase(unittest.TestCase):
+    """
+    Base class for tests which run a P2PController with three P2P connections in a thread
+    """
+
+    keepalive_timeout = 0
+
+    def setUp(self):
+        self.from_p2p = Queue()
+        self.to_p2p = Queue()
+        self.connection_pool = GossipConnectionPool('TestPool', shared=False)
+        for port in range(1, 4):
+            self.connection_pool.add_connection(peer(port), MockedConnection())
+        self.controller = P2PController(self.from_p2p, self.to_p2p, Queue(), self.connection_pool,
+                                        {'host': '127.0.0.1', 'port': 6001},
+                                        GossipMessageCache('TestCache', shared=False),
+                                        GossipMessageCache('TestUpdateCache', shared=False),
+                                        APIRegistrationHandler(shared=False), 0,
+                                        keepalive_timeout=self.keepalive_timeout)
+        self.controller.start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+
+    def tearDown(self):
+        self.controller.stop()
+        self.controller.join(timeout=5)
+
+    def receive(self, identifier, message):
+        self.from_p2p.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': identifier, 'message': message})
+
+
+class TestPing(ControllerTestCase):
+    """
+    Test class for the RTT measurement of the P2PController
+    """
+
+    def test_ping_pong(self):
+        """
+            This test method lets the controller answer a ping and receive the pong to its own ping
+            It fails if the pong does not echo the timestamp of the ping, or if the RTT of the connection is not
+            recorded by the connection pool
+            :return: None
+        """
+        self.receive(peer(1), MessageGossipPing(pack_gossip_ping(PING_TYPE_PING, 4711)['data']))
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['identifier'] == peer(1)
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_PING, 'ping_type': PING_TYPE_PONG,
+                                                      'timestamp': 4711}
+
+        self.controller.send_ping(peer(2))
+        queue_item = self.to_p2p.get(timeout=5)
+        assert queue_item['message'].get_values()['ping_type'] == PING_TYPE_PING
+        time.sleep(0.3)
+        self.receive(peer(2), MessageGossipPing(
+            pack_gossip_ping(PING_TYPE_PONG, queue_item['message'].get_values()['timestamp'])['data']))
+        for _ in range(50):
+            if self.connection_pool.get_score(peer(2)) != self.connection_pool.get_score(peer(3)):
+                break
+            time.sleep(0.1)
+        assert self.connection_pool.get_score(peer(2)) >= 0.3
+
+
+class TestKeepalive(ControllerTestCase):
+    """
+    Test class for the detection of dead connections by the P2PController
+    """
+
+    keepalive_timeout = 0.5
+
+    def test_close_silent_connection(self):
+        """
+            This test method announces two new connections and lets only one of them receive data
+            It fails if the silent connection is not removed from the pool and closed after the keepalive timeout, or
+            if the active connection is closed
+            :return: None
+        """
+        silent_connection = self.connection_pool.get_connection(peer(1))
+        for identifier in [peer(1), peer(2)]:
+            self.from_p2p.put({'type': QUEUE_ITEM_TYPE_NEW_CONNECTION, 'identifier': identifier, 'message': None})
+        slot = self.connection_pool.get_slot(peer(2))
+        for _ in range(15):
+            self.connection_pool.stats.record_received(slot, 8, 1, time.monotonic())
+            time.sleep(0.1)
+        assert peer(1) not in self.connection_pool.get_identifiers()
+        assert silent_connection.closed
+        assert peer(2) in self.connection_pool.get_identifiers()
+
+
+class TestRandomWalk(unittest.TestCase):
+    """
+    Test class for the random walks of peer requests handled by the P2PController
+    """
+
+    def setUp(self):
+        self.from_p2p = Queue()
+        self.to_p2p = Queue()
+        self.connection_pool = GossipConnectionPool('TestPool', shared=False)
+        self.controller = P2PController(self.from_p2p, self.to_p2p, Queue(), self.connection_pool,
+                                        {'host': '127.0.0.1', 'port': 6001},
+                                        GossipMessageCache('TestCache', shared=False),
+                                        GossipMessageCache('TestUpdateCache', shared=False),
+                                        APIRegistrationHandler(shared=False), 0)
+
+    def run_controller(self, identifier, message):
+        self.from_p2p.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': identifier, 'message': message})
+        self.controller.start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+        self.addCleanup(self.controller.join, 5)
+        self.addCleanup(self.controller.stop)
+
+    def next_item(self, message_code):
+        while True:
+            queue_item = self.to_p2p.get(timeout=5)
+            if queue_item['type'] == QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION or \
+                    queue_item['message'].get_values()['code'] == message_code:
+                return queue_item
+
+    def test_forward(self):
+        """
+            This test method lets a peer with three connections receive a peer request with a walk length of 3
+            It fails if the peer answers the request itself or does not forward it to another peer with a walk length
+            of 2 on behalf of the requesting peer
+            :return: None
+        """
+        for port in range(1, 4):
+            self.connection_pool.add_connection(peer(port), MockedConnection(), server_identifier=server(port))
+        self.run_controller(peer(1), MessageGossipPeerRequest(
+            pack_gossip_peer_request(server(1), walk_length=3)['data']))
+
+        queue_item = self.next_item(MESSAGE_CODE_PEER_REQUEST)
+        assert queue_item['identifier'] in [peer(2), peer(3)]
+        assert queue_item['message'].get_values() == {'code': MESSAGE_CODE_PEER_REQUEST,
+                                                      'p2p_server_address': server(1), 'page': 0, 'walk_length': 2,
+                                                      'forwarded': True}
+
+    def test_end_of_walk(self):
+        """
+            This test method lets a peer receive a forwarded peer request whose walk is used up
+            It fails if the peer does not connect to the requesting peer and answer it via the new connection, or if
+            the sample contains the requesting peer
+            :return: None
+        """
+        for port in range(2, 4):
+            self.connection_pool.add_connection(peer(port), MockedConnection(), server_identifier=server(port))
+        self.run_controller(peer(2), MessageGossipPeerRequest(
+            pack_gossip_peer_request(server(1), forwarded=True)['data']))
+
+        assert self.next_item(MESSAGE_CODE_PEER_RESPONSE) == {'type': QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION,
+                                                              'identifier': server(1)}
+        queue_item = self.next_item(MESSAGE_CODE_PEER_RESPONSE)
+        assert queue_item['identifier'] == server(1)
+        assert sorted(queue_item['message'].get_values()['data']) == [server(2), server(3)]
+
+    def test_end_of_walk_full_pool(self):
+        """
+            This test method lets a peer with a full connection pool receive a forwarded peer request whose walk is used
+            up, followed by a direct peer request of a connected peer
+            It fails if the peer dials the requesting peer or answers it, instead of only answering the direct request
+            :return: None
+        """
+        self.connection_pool = GossipConnectionPool('TestPool', 1, shared=False)
+        self.controller.p2p_connection_pool = self.connection_pool
+        self.connection_pool.add_connection(peer(2), MockedConnection(), server_identifier=server(2))
+        self.from_p2p.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': peer(2),
+                           'message': MessageGossipPeerRequest(
+                               pack_gossip_peer_request(server(1), forwarded=True)['data'])})
+        self.run_controller(peer(2), MessageGossipPeerRequest(pack_gossip_peer_request(server(2))['data']))
+
+        queue_item = self.next_item(MESSAGE_CODE_PEER_RESPONSE)
+        assert queue_item['type'] != QUEUE_ITEM_TYPE_ESTABLISH_CONNECTION, "expected no dial with a full pool"
+        assert queue_item['identifier'] == peer(2)
+        assert self.connection_pool.get_capacity() == 0
+
+    def test_no_next_hop(self):
+        """
+            This test method lets a peer which is only connected to the requesting peer receive a random walk
+            It fails if the peer does not answer the request itself
+            :return: None
+        """
+        self.connection_pool.add_connection(peer(1), MockedConnection())
+        self.run_controller(peer(1), MessageGossipPeerRequest(
+            pack_gossip_peer_request(server(1), walk_length=3)['data']))
+
+        queue_item = self.next_item(MESSAGE_CODE_PEER_RESPONSE)
+        assert queue_item['identifier'] == peer(1)
+        assert queue_item['message'].get_values()['data'] == []
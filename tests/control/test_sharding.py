@@ -0,0 +1,226 @@
+import unittest
+from queue import Queue
+
+from gossip.communication.connection import GossipConnectionPool
+from gossip.control.api_registrations import APIRegistrationHandler
+from gossip.control.broadcast import GossipMissingMessages
+from gossip.control.membership import GossipMembershipDeltas, GossipMembershipVersions
+from gossip.control.message_cache import GossipMessageCache
+from gossip.control.p2p_controller import P2PController
+from gossip.control.sharding import GossipShardRouter, GossipShardedMessageCache
+from gossip.util.channel import GossipPipeChannel, put_many
+from gossip.util.message import MessageGossipAnnounce, MessageGossipPeerUpdate, MessageGossipPeerInit, \
+    MessageGossipPeerDelta, MessageGossipPeerResponse
+from gossip.util.message_code import MESSAGE_CODE_PEER_REQUEST
+from gossip.util.packing import pack_gossip_announce, pack_gossip_peer_update, pack_gossip_peer_init, \
+    pack_gossip_peer_delta, pack_gossip_peer_response, PEER_UPDATE_TYPE_PEER_FOUND, PEER_UPDATE_TYPE_PEER_LOST
+from gossip.util.peer_address import GossipPeerAddress
+from gossip.util.queue_item_types import QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, QUEUE_ITEM_TYPE_CONNECTION_LOST
+from gossip.util.runtime import GossipRuntime, DEPLOYMENT_MODE_THREADS
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def peer(identifier):
+    return GossipPeerAddress.from_string(identifier)
+
+
+def announce(ttl, payload):
+    return MessageGossipAnnounce(pack_gossip_announce(ttl, 540, payload)['data'])
+
+
+class MockedConnection:
+    def close(self):
+        pass
+
+    def shutdown(self, arg):
+        pass
+
+
+class TestShardRouter(unittest.TestCase):
+    """
+    Test class for GossipShardRouter class
+    """
+
+    def test_route_by_digest(self):
+        """
+            This test method routes the same announce and the same peer update via different connections
+            It fails if a message does not always end up in the same shard, independent of sender and TTL
+            :return: None
+        """
+        shard_queues = [Queue() for _ in range(4)]
+        router = GossipShardRouter(shard_queues)
+
+        for payload in [b'Msg1', b'Msg2', b'Msg3', b'Msg4', b'Msg5']:
+            shards = {router.shard_of({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE,
+                                       'identifier': peer('127.0.0.1:%d' % port), 'message': announce(ttl, payload)})
+                      for port, ttl in [(1, 0), (2, 5), (3, 7)]}
+            assert len(shards) == 1, "expected one shard per announce but got %s" % shards
+
+        shards = {router.shard_of({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': peer('127.0.0.1:%d' % port),
+                                   'message': MessageGossipPeerUpdate(
+                                       pack_gossip_peer_update(peer('10.0.0.1:6001'), ttl, PEER_UPDATE_TYPE_PEER_FOUND)
+                                       ['data'])})
+                  for port, ttl in [(1, 0), (2, 5)]}
+        assert len(shards) == 1, "expected one shard per peer update but got %s" % shards
+
+    def test_route_by_connection(self):
+        """
+            This test method routes a peer init and a lost connection of the same connection
+            It fails if both queue items are not handled by the same shard
+            :return: None
+        """
+        shard_queues = [Queue() for _ in range(4)]
+        router = GossipShardRouter(shard_queues)
+
+        for port in range(20):
+            identifier = peer('127.0.0.1:%d' % port)
+            router.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': identifier,
+                        'message': MessageGossipPeerInit(pack_gossip_peer_init(peer('10.0.0.1:6001'))['data'])})
+            router.put({'type': QUEUE_ITEM_TYPE_CONNECTION_LOST, 'identifier': identifier, 'message': None})
+
+        for shard_queue in shard_queues:
+            identifiers = []
+            while not shard_queue.empty():
+                identifiers.append(shard_queue.get()['identifier'])
+            assert identifiers[0::2] == identifiers[1::2], "expected both items of a connection in the same shard"
+
+    def test_put_many(self):
+        """
+            This test method puts lost connections of 20 peers at once into a router with pipe channels
+            It fails if an item ends up in another shard than with put or if the order within a shard changes
+            :return: None
+        """
+        shard_queues = [GossipPipeChannel() for _ in range(4)]
+        router = GossipShardRouter(shard_queues)
+        queue_items = [{'type': QUEUE_ITEM_TYPE_CONNECTION_LOST, 'identifier': peer('127.0.0.1:%d' % port),
+                        'message': None} for port in range(20)]
+        put_many(router, queue_items)
+
+        for shard, shard_queue in enumerate(shard_queues):
+            expected = [queue_item['identifier'] for queue_item in queue_items if router.shard_of(queue_item) == shard]
+            received = [shard_queue.get(timeout=1)['identifier'] for _ in expected]
+            assert received == expected, "expected %s in shard %d but got %s" % (expected, shard, received)
+
+    def test_peer_delta_via_several_shards(self):
+        """
+            This test method lets the same peer delta arrive via one connection per shard of a router with four shards
+            It fails if an event is accepted by more than one shard
+            :return: None
+        """
+        shard_queues = [Queue() for _ in range(4)]
+        router = GossipShardRouter(shard_queues)
+        versions = GossipMembershipVersions(shared=False)
+        memberships = [GossipMembershipDeltas(versions=versions) for _ in shard_queues]
+
+        entries = [{'address': peer('10.0.0.%d:6001' % i), 'update_type': update_type, 'ttl': 3, 'version': i}
+                   for i, update_type in [(1, PEER_UPDATE_TYPE_PEER_FOUND), (2, PEER_UPDATE_TYPE_PEER_LOST)]]
+        peer_delta_msg = MessageGossipPeerDelta(pack_gossip_peer_delta(entries)['data'])
+        queue_items = [{'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': peer('127.0.0.1:%d' % port),
+                        'message': peer_delta_msg} for port in range(20)]
+        shards = {router.shard_of(queue_item): queue_item for queue_item in queue_items}
+        assert len(shards) > 1, "expected connections of several shards"
+        for queue_item in shards.values():
+            router.put(queue_item)
+
+        accepted = []
+        for shard_queue, membership in zip(shard_queues, memberships):
+            while not shard_queue.empty():
+                accepted += [received_entry for received_entry in shard_queue.get()['message'].get_values()['entries']
+                             if membership.accept(received_entry)]
+        assert accepted == entries, "expected every event to be accepted once but got %s" % accepted
+
+
+class TestShardedMessageCache(unittest.TestCase):
+    """
+    Test class for GossipShardedMessageCache class
+    """
+
+    def test_message_ids_identify_slices(self):
+        """
+            This test method adds announces to a cache with four slices and works with the returned ids
+            It fails if duplicates are accepted or if lookups via the returned ids do not work
+            :return: None
+        """
+        message_cache = GossipShardedMessageCache('TestCache', cache_size=40, shared=False, shard_count=4)
+
+        ids = [message_cache.add_message(announce(0, ('Msg%d' % i).encode())) for i in range(10)]
+        assert None not in ids
+        assert message_cache.add_message(announce(3, b'Msg1')) is None, "expected duplicate to be discarded"
+
+        message_cache.set_validity(ids[4], True)
+        assert message_cache.is_valid(ids[4])
+        assert not message_cache.is_valid(ids[5])
+        assert message_cache.get_message(ids[7]) == announce(0, b'Msg7')
+        assert len(list(message_cache.iterator())) == 10
+
+        message_cache.remove_message(ids[7])
+        assert message_cache.get_message(ids[7]) is None
+
+
+class TestShardedController(unittest.TestCase):
+    """
+    Test class for the state which the P2PController shards share
+    """
+
+    def test_paginated_peer_response(self):
+        """
+            This test method lets the first of two shards send a peer request, whose response is routed to the second
+            shard. The response only contains a peer which is already connected.
+            It fails if the second shard does not request the next page of the peer sample
+            :return: None
+        """
+        shard_queues = [Queue() for _ in range(2)]
+        router = GossipShardRouter(shard_queues)
+        to_p2p = Queue()
+        connection_pool = GossipConnectionPool('TestPool', shared=False)
+        peer_request_pages = {}
+        controllers = [P2PController(shard_queue, to_p2p, Queue(), connection_pool, {'host': '127.0.0.1', 'port': 6001},
+                                     GossipMessageCache('TestCache', shared=False),
+                                     GossipMessageCache('TestUpdateCache', shared=False),
+                                     APIRegistrationHandler(shared=False), 0, peer_request_pages=peer_request_pages)
+                       for shard_queue in shard_queues]
+
+        identifier = next(identifier for identifier in [GossipPeerAddress.from_host_port('127.0.0.1', port)
+                                                        for port in range(1, 20)]
+                          if router.shard_of({'type': QUEUE_ITEM_TYPE_CONNECTION_LOST, 'identifier': identifier,
+                                              'message': None}) == 1)
+        connection_pool.add_connection(identifier, MockedConnection(),
+                                       server_identifier=GossipPeerAddress.from_host_port('10.0.0.1', 6001))
+        controllers[0].send_peer_request(identifier)
+        assert to_p2p.get(timeout=5)['message'].get_values()['page'] == 0
+
+        router.put({'type': QUEUE_ITEM_TYPE_RECEIVED_MESSAGE, 'identifier': identifier,
+                    'message': MessageGossipPeerResponse(pack_gossip_peer_response(
+                        [GossipPeerAddress.from_host_port('10.0.0.1', 6001)])['data'])})
+        assert shard_queues[0].empty(), "expected the peer response in the second shard"
+        controllers[1].start(GossipRuntime(DEPLOYMENT_MODE_THREADS))
+        self.addCleanup(controllers[1].join, 5)
+        self.addCleanup(controllers[1].stop)
+
+        while True:
+            queue_item = to_p2p.get(timeout=5)
+            if queue_item['message'].get_values()['code'] == MESSAGE_CODE_PEER_REQUEST:
+                break
+        assert queue_item['identifier'] == identifier
+        assert queue_item['message'].get_values()['page'] == 1
+
+    def test_shared_missing_messages(self):
+        """
+            This test method lets two peers advertise the same announce to a table which is shared between processes,
+            afterwards another announce is advertised and received
+            It fails if the second advertising peer is lost because the shared entry is not updated, or if the received
+            announce is still requested
+            :return: None
+        """
+        missing_messages = GossipMissingMessages(1, shared=True)
+        first_digest, second_digest = announce(0, b'Msg1').get_digest(), announce(0, b'Msg2').get_digest()
+
+        for port in [1, 2]:
+            missing_messages.add(first_digest, GossipPeerAddress.from_host_port('127.0.0.1', port), 0)
+        missing_messages.add(second_digest, GossipPeerAddress.from_host_port('127.0.0.1', 1), 0)
+        missing_messages.remove(second_digest)
+
+        assert missing_messages.expire(1) == {GossipPeerAddress.from_host_port('127.0.0.1', 1): [first_digest]}
+        assert missing_messages.expire(2) == {GossipPeerAddress.from_host_port('127.0.0.1', 2): [first_digest]}
+        assert len(missing_messages) == 0
@@ -0,0 +1,44 @@
+import unittest
+
+from gossip.util.bloom_filter import create_bloom_filter
+from gossip.util.message import MessageGossipAnnounce, MessageGossipSummary
+from gossip.util.packing import pack_gossip_announce, pack_gossip_summary, MAX_SUMMARY_SIZE
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def digests(first, last):
+    return [MessageGossipAnnounce(pack_gossip_announce(0, 540, ('Msg%d' % i).encode())['data']).get_digest()
+            for i in range(first, last)]
+
+
+class TestBloomFilter(unittest.TestCase):
+    """
+    Test class for GossipBloomFilter class
+    """
+
+    def test_contains(self):
+        """
+            This test method adds 1000 digests to a Bloom filter and checks 10000 other digests against it
+            It fails if an added digest is missing or if clearly more than 1% of the other digests are reported
+            :return: None
+        """
+        bloom_filter = create_bloom_filter(digests(0, 1000), MAX_SUMMARY_SIZE)
+        assert all(digest in bloom_filter for digest in digests(0, 1000))
+
+        false_positives = sum(1 for digest in digests(1000, 11000) if digest in bloom_filter)
+        assert false_positives < 200, "expected about 100 false positives but got %d" % false_positives
+
+    def test_summary(self):
+        """
+            This test method packs a Bloom filter into a summary message and decodes it again
+            It fails if the decoded filter differs from the original one or if the max. size is exceeded
+            :return: None
+        """
+        bloom_filter = create_bloom_filter(digests(0, 10), MAX_SUMMARY_SIZE)
+        summary = MessageGossipSummary(MessageGossipSummary(pack_gossip_summary(bloom_filter)['data']).encode()[4:])
+        received_filter = summary.get_values()['bloom_filter']
+        assert received_filter.hash_count == bloom_filter.hash_count
+        assert received_filter.bits == bloom_filter.bits
+
+        assert len(create_bloom_filter(digests(0, 100000), MAX_SUMMARY_SIZE)) == MAX_SUMMARY_SIZE
@@ -0,0 +1,68 @@
+import unittest
+from multiprocessing import Process
+from queue import Empty
+
+from gossip.util.channel import create_channel, GossipPipeChannel, CHANNEL_TYPE_QUEUE, CHANNEL_TYPE_PIPE
+from gossip.util.exceptions import GossipChannelClosedException
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+def produce(channel, amount):
+    for i in range(0, amount, 10):
+        channel.put(i)
+        if hasattr(channel, 'put_many'):
+            channel.put_many(range(i + 1, i + 10))
+        else:
+            for j in range(i + 1, i + 10):
+                channel.put(j)
+
+
+class TestChannel(unittest.TestCase):
+    """
+    Test class for the channels between the gossip layers
+    """
+
+    def test_ordering_across_processes(self):
+        """
+            This test method lets another process put 1000 items into each channel type
+            It fails if the items arrive in a different order than they have been put
+            :return: None
+        """
+        for channel_type in [CHANNEL_TYPE_QUEUE, CHANNEL_TYPE_PIPE]:
+            channel = create_channel(channel_type)
+            producer = Process(target=produce, args=(channel, 1000))
+            producer.start()
+            received = [channel.get(timeout=5) for _ in range(1000)]
+            producer.join()
+            assert received == list(range(1000)), "expected ordered items for channel %s" % channel_type
+
+    def test_shutdown(self):
+        """
+            This test method closes a pipe channel with pending items
+            It fails if pending items are lost or if get does not signal the shutdown afterwards
+            :return: None
+        """
+        channel = GossipPipeChannel()
+        channel.put('Item1')
+        channel.put_many(['Item2', 'Item3'])
+        channel.close()
+
+        assert [channel.get(), channel.get(), channel.get()] == ['Item1', 'Item2', 'Item3']
+        self.assertRaises(GossipChannelClosedException, channel.get)
+        self.assertRaises(GossipChannelClosedException, channel.get)
+
+    def test_get_timeout(self):
+        """
+            This test method reads from an empty pipe channel
+            It fails if get does not raise queue.Empty after the timeout
+            :return: None
+        """
+        channel = GossipPipeChannel()
+        self.assertRaises(Empty, channel.get, timeout=0.05)
+        self.assertRaises(Empty, channel.get, block=False)
+        channel.put('Item')
+        assert channel.get(block=False) == 'Item'
+
+    def test_unknown_channel_type(self):
+        self.assertRaises(ValueError, create_channel, 'carrier pigeon')
@@ -0,0 +1,64 @@
+# Copyright 2016 Anselm Binninger, Thomas Maier, Ralph Schaumann
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import unittest
+
+from gossip.util.message import MessageGossipPeerResponse, MessageGossipPeerInit
+from gossip.util.packing import pack_gossip_peer_response, pack_gossip_peer_init
+from gossip.util.peer_address import GossipPeerAddress
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+class TestPeerAddress(unittest.TestCase):
+    """
+    Test class for GossipPeerAddress class
+    """
+
+    def test_conversions(self):
+        """
+            This test method parses an address and converts it into its other forms
+            It fails if the wire form, the text form, host, port or the 48 bit integer do not match, if the address
+            does not survive pickling (queues between processes), or if invalid addresses are accepted
+            :return: None
+        """
+        address = GossipPeerAddress.from_string('192.168.1.2:6001')
+        assert address == b'\xc0\xa8\x01\x02\x17\x71'
+        assert address == GossipPeerAddress.from_host_port('192.168.1.2', 6001)
+        assert str(address) == '192.168.1.2:6001'
+        assert (address.host, address.port) == ('192.168.1.2', 6001)
+        assert int(address) == (0xc0a80102 << 16) | 6001
+        assert pickle.loads(pickle.dumps(address)) == address
+        assert type(pickle.loads(pickle.dumps(address))) is GossipPeerAddress
+        assert {address: 1}[GossipPeerAddress(bytes(address))] == 1
+
+        for invalid in ['192.168.1.2', '192.168.1:6001', 'localhost:6001', '192.168.1.2:70000', '192.168.1.2:']:
+            with self.assertRaises(ValueError):
+                GossipPeerAddress.from_string(invalid)
+        with self.assertRaises(ValueError):
+            GossipPeerAddress(b'\x00' * 4)
+
+    def test_messages(self):
+        """
+            This test method packs addresses into a peer init and a peer response and decodes them again
+            It fails if an address is lost or changed
+            :return: None
+        """
+        addresses = [GossipPeerAddress.from_host_port('10.0.0.%d' % i, 6000 + i) for i in range(5)]
+        peer_init = MessageGossipPeerInit(pack_gossip_peer_init(addresses[0])['data'])
+        assert peer_init.get_values()['p2p_server_address'] == addresses[0]
+        peer_response = MessageGossipPeerResponse(pack_gossip_peer_response(addresses)['data'])
+        assert peer_response.get_values()['data'] == addresses
+        assert all(type(address) is GossipPeerAddress for address in peer_response.get_values()['data'])
@@ -0,0 +1,85 @@
+import unittest
+from queue import Empty
+
+from gossip.util.channel import create_channel
+from gossip.util.runtime import GossipRuntime, GossipWorker, DEPLOYMENT_MODE_PROCESSES, DEPLOYMENT_MODE_THREADS, \
+    WORKER_POLL_INTERVAL
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+class EchoWorker(GossipWorker):
+    """ Worker which answers every item until it is stopped """
+
+    def __init__(self, from_queue, to_queue):
+        GossipWorker.__init__(self, 'EchoWorker')
+        self.from_queue = from_queue
+        self.to_queue = to_queue
+
+    def run(self):
+        while not self.stopped():
+            try:
+                item = self.from_queue.get(timeout=WORKER_POLL_INTERVAL)
+            except Empty:
+                continue
+            if item == 'crash':
+                raise ValueError('Crash requested')
+            self.to_queue.put(item)
+
+
+class TestRuntime(unittest.TestCase):
+    """
+    Test class for the GossipRuntime and its deployment modes
+    """
+
+    def test_lifecycle(self):
+        """
+            This test method starts, uses, stops and joins a worker in every deployment mode
+            It fails if the worker does not answer, does not stop or does not report a clean exit code
+            :return: None
+        """
+        for deployment_mode in [DEPLOYMENT_MODE_PROCESSES, DEPLOYMENT_MODE_THREADS]:
+            runtime = GossipRuntime(deployment_mode)
+            from_queue = create_channel(shared=runtime.shared)
+            to_queue = create_channel(shared=runtime.shared)
+            worker = EchoWorker(from_queue, to_queue)
+            worker.start(runtime)
+
+            from_queue.put('Ping')
+            assert to_queue.get(timeout=5) == 'Ping', 'expected an answer in mode %s' % deployment_mode
+            assert worker.is_alive()
+
+            worker.stop()
+            worker.join(timeout=5)
+            assert not worker.is_alive(), 'expected worker to stop in mode %s' % deployment_mode
+            assert worker.exitcode == 0, 'expected exit code 0 in mode %s' % deployment_mode
+
+    def test_crash(self):
+        """
+            This test method lets a worker crash in every deployment mode
+            It fails if the crash is not reported by the exit code
+            :return: None
+        """
+        for deployment_mode in [DEPLOYMENT_MODE_PROCESSES, DEPLOYMENT_MODE_THREADS]:
+            runtime = GossipRuntime(deployment_mode)
+            from_queue = create_channel(shared=runtime.shared)
+            worker = EchoWorker(from_queue, create_channel(shared=runtime.shared))
+            worker.start(runtime)
+
+            from_queue.put('crash')
+            worker.join(timeout=5)
+            assert worker.exitcode == 1, 'expected exit code 1 in mode %s' % deployment_mode
+
+    def test_unknown_deployment_mode(self):
+        self.assertRaises(ValueError, GossipRuntime, 'carrier pigeon')
+
+    def test_run_is_abstract(self):
+        """
+            This test method creates a worker which does not implement run
+            It fails if the worker can be instantiated
+            :return: None
+        """
+        class IdleWorker(GossipWorker):
+            pass
+
+        self.assertRaises(TypeError, IdleWorker, 'IdleWorker')
@@ -0,0 +1,49 @@
+import unittest
+
+from gossip.util.timer_wheel import GossipTimerWheel
+
+__author__ = 'Anselm Binninger, Thomas Maier, Ralph Schaumann'
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Test class for GossipTimerWheel class
+    """
+
+    def test_advance(self):
+        """
+            This test method schedules deadlines on all wheels, reschedules and cancels some of them
+            It fails if a deadline expires too early, too late or twice, or if a cancelled deadline expires at all
+            :return: None
+        """
+        timer_wheel = GossipTimerWheel(1000.0, resolution=0.1)
+        timer_wheel.schedule('a', 1000.5)
+        timer_wheel.schedule('b', 1010.0)
+        timer_wheel.schedule('c', 1500.0)
+        timer_wheel.schedule('d', 40000.0)
+        timer_wheel.schedule('e', 1010.0)
+        timer_wheel.cancel('e')
+        timer_wheel.schedule('a', 1001.0)
+        assert len(timer_wheel) == 4 and 'e' not in timer_wheel
+
+        assert timer_wheel.advance(1000.9) == []
+        assert timer_wheel.advance(1001.0) == ['a']
+        assert timer_wheel.advance(1009.9) == []
+        assert timer_wheel.advance(1499.9) == ['b']
+        assert timer_wheel.advance(1500.0) == ['c']
+        assert timer_wheel.advance(39999.9) == []
+        assert timer_wheel.advance(50000.0) == ['d']
+        assert len(timer_wheel) == 0
+
+    def test_far_deadline(self):
+        """
+            This test method schedules a deadline beyond the range of all wheels and one which has already passed
+            It fails if the far deadline does not expire on time or if the passed deadline does not expire immediately
+            :return: None
+        """
+        timer_wheel = GossipTimerWheel(0.0, resolution=1.0)
+        timer_wheel.schedule('far', 50000000.0)
+        timer_wheel.schedule('past', -5.0)
+        assert timer_wheel.advance(0.0) == ['past']
+        assert timer_wheel.advance(49999999.0) == []
+        assert timer_wheel.advance(50000000.0) == ['far']